@@ -46,6 +46,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.StaticFilesMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -80,14 +82,100 @@ WSGI_APPLICATION = 'app.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # django.db.backends.postgresql with pooled connections
+        'ENGINE': 'core.backends.postgresql_pool',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # Connections are returned to the pool at the end of each request
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MIN_SIZE': 2,
+            'MAX_SIZE': 10,
+            'IDLE_TIMEOUT': 300,
+            'TIMEOUT': 10,
+            'PRE_PING': True,
+        },
     }
 }
 
+# Read replicas of the primary, e.g. DB_REPLICA_HOSTS=replica1,replica2.
+# Safe requests read from them, see core.middleware.ReplicaMiddleware.
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+        filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    DATABASE_REPLICAS.append(f'replica{index + 1}')
+    DATABASES[DATABASE_REPLICAS[-1]] = dict(
+        DATABASES['default'], HOST=host, TEST={'MIRROR': 'default'}
+    )
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# 'round-robin' or 'least-latency'
+REPLICA_SELECTION = 'round-robin'
+# Clients read from the primary for this long after a write. The cache
+# must be shared by all processes when serving with several workers.
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_CACHE_ALIAS = 'replica_pins'
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Per-user list responses, LocMemCache evicts least recently used
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+    # Read replica pins, in the primary so every serve worker sees them.
+    # Created by manage.py createcachetable.
+    'replica_pins': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'replica_pin_cache',
+    },
+}
+
+RECIPE_RESPONSE_CACHE_ALIAS = 'responses'
+RECIPE_RESPONSE_CACHE_TIMEOUT = 300
+
+# Keep Tag/Ingredient.usage_count up to date and filter assigned_only on
+# it. Run manage.py refresh_usage_counts after turning this on.
+RECIPE_USAGE_COUNTS = False
+
+# In-process token -> user cache of CachingTokenAuthentication
+AUTH_TOKEN_CACHE_MAX_ENTRIES = 10000
+AUTH_TOKEN_CACHE_TIMEOUT = 60
+
+# Password hashing pool of the token and user creation endpoints, requests
+# beyond the running and waiting slots get a 503
+PASSWORD_HASH_WORKERS = 2
+PASSWORD_HASH_QUEUE_SIZE = 8
+PASSWORD_HASH_TIMEOUT = 5
+PASSWORD_HASH_RETRY_AFTER = 1
+
+# Recipe image thumbnails, generated in this many worker processes
+RECIPE_IMAGE_SIZES = (128, 512, 1024)
+RECIPE_IMAGE_WORKERS = 2
+
+# Chunked image uploads, abandoned ones are removed after the expiry
+RECIPE_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+RECIPE_UPLOAD_EXPIRY = 24 * 60 * 60
+
+# Media files are served by core.views.serve_media. Set MEDIA_ACCEL to
+# 'x-accel-redirect' (nginx, internal location at MEDIA_ACCEL_PREFIX
+# aliased to MEDIA_ROOT) or 'x-sendfile' to leave the body to the proxy.
+MEDIA_ACCEL = os.environ.get('MEDIA_ACCEL') or None
+MEDIA_ACCEL_PREFIX = '/protected/'
+MEDIA_MAX_AGE = 24 * 60 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -131,4 +219,18 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# collectstatic writes content hashed names with .gz and .br siblings,
+# served by core.middleware.StaticFilesMiddleware. Unhashed names are
+# cached for STATIC_MAX_AGE seconds.
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+STATIC_MAX_AGE = 60
+
+# manage.py serve, each option can be overridden on the command line
+SERVE_BIND = '0.0.0.0:8000'
+SERVE_WORKERS = int(os.environ.get('SERVE_WORKERS', os.cpu_count() or 1))
+SERVE_THREADS = 4
+SERVE_MAX_REQUESTS = 1000
+SERVE_MAX_REQUESTS_JITTER = 100
+SERVE_GRACEFUL_TIMEOUT = 30
+
 AUTH_USER_MODEL = 'core.User'
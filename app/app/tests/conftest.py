@@ -1,7 +1,11 @@
+import importlib
 import os
 import django
 from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import BaseDatabaseCache
 from django.contrib.auth import get_user_model
+from django.db import connection
 import pytest
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
@@ -9,9 +13,34 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
 def pytest_configure():
     settings.DEBUG = False
+    # Templates must not need a collected manifest
+    settings.STATICFILES_STORAGE = \
+        'django.contrib.staticfiles.storage.StaticFilesStorage'
     django.setup()
 
 
+@pytest.fixture(scope='session')
+def django_db_setup(django_db_setup, django_db_blocker):
+    """Create the search tables, their migration is skipped in tests"""
+    search = importlib.import_module('core.migrations.0012_recipe_search')
+    with django_db_blocker.unblock():
+        with connection.cursor() as cursor:
+            for sql in search.CREATE.get(connection.vendor, []):
+                cursor.execute(sql)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Keep cached per-user data from leaking between tests"""
+    # Imported here, the module reads settings configured above
+    from user.authentication import token_cache
+    for alias in settings.CACHES:
+        # Rows of database caches are rolled back with the test
+        if not isinstance(caches[alias], BaseDatabaseCache):
+            caches[alias].clear()
+    token_cache.clear()
+
+
 @pytest.fixture
 def new_user():
     user = {
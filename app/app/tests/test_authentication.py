@@ -0,0 +1,115 @@
+from unittest.mock import patch
+
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user.authentication import TokenCache, get_stats
+
+
+ME_URL = reverse('user:me')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+@pytest.fixture
+def token(registred_user):
+    return Token.objects.create(user=registred_user)
+
+
+@pytest.fixture
+def token_client(token):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+@pytest.mark.django_db
+class TestCachingTokenAuthentication:
+
+    def test_cached_token_skips_query(
+        self,
+        token_client,
+        django_assert_num_queries
+    ):
+        """Test the token query only runs on the first request"""
+        with django_assert_num_queries(1):
+            token_client.get(ME_URL)
+        with django_assert_num_queries(0):
+            response = token_client.get(ME_URL)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['email'] == 'test@test.com'
+        assert get_stats()['hits'] == 1
+        assert get_stats()['misses'] == 1
+        assert get_stats()['hit_ratio'] == 0.5
+
+    def test_deleted_token_rejected(self, token_client, token):
+        """Test a deleted token stops authenticating at once"""
+        token_client.get(TAGS_URL)
+
+        token.delete()
+        response = token_client.get(TAGS_URL)
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_deactivated_user_rejected(self, token_client, registred_user):
+        """Test a user turned inactive is not served from the cache"""
+        token_client.get(TAGS_URL)
+
+        registred_user.is_active = False
+        registred_user.save()
+        response = token_client.get(TAGS_URL)
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_user_update_refreshes_user(self, token_client):
+        """Test a user saved through the API is read again"""
+        token_client.patch(ME_URL, {'name': 'New name'})
+
+        response = token_client.get(ME_URL)
+
+        assert response.data['name'] == 'New name'
+
+    def test_cached_user_not_shared(self, token_client):
+        """Test every request gets its own user instance"""
+        users = []
+
+        def get_object(view):
+            users.append(view.request.user)
+            return view.request.user
+
+        with patch('user.views.ManageUserView.get_object', get_object):
+            token_client.get(ME_URL)
+            token_client.get(ME_URL)
+            token_client.get(ME_URL)
+
+        assert users[1] is not users[2]
+        assert users[1] == users[2]
+        assert users[2]._state.adding is False
+
+
+class TestTokenCache:
+
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted first"""
+        cache = TokenCache(max_entries=2, timeout=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+
+        cache.set('c', 3)
+
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get_stats()['evictions'] == 1
+
+    def test_entries_expire(self):
+        """Test entries are dropped once the timeout passed"""
+        cache = TokenCache(max_entries=2, timeout=60)
+        with patch('user.authentication.time.monotonic', return_value=0):
+            cache.set('a', 1)
+        with patch('user.authentication.time.monotonic', return_value=61):
+            assert cache.get('a') is None
+        assert cache.get_stats()['entries'] == 0
@@ -0,0 +1,73 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+import pytest
+
+from test_recipe import RECIPES_URL, sample_recipe, sample_tag
+
+from recipe import caching
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+@pytest.mark.django_db
+class TestResponseCache():
+    """Test caching of list responses"""
+
+    def test_second_request_hits_cache(self, logged_client, registred_user):
+        """Test a repeated list request is served from the cache"""
+        sample_recipe(user=registred_user)
+        first = logged_client.get(RECIPES_URL)
+
+        with CaptureQueriesContext(connection) as context:
+            second = logged_client.get(RECIPES_URL)
+
+        assert first['X-Cache'] == 'MISS'
+        assert second['X-Cache'] == 'HIT'
+        assert second.data == first.data
+        assert not any(
+            'core_recipe' in query['sql']
+            for query in context.captured_queries
+        )
+        assert caching.get_stats() == {'hits': 1, 'misses': 1}
+
+    def test_query_params_normalized(self, logged_client, registred_user):
+        """Test query param order does not matter but values do"""
+        sample_recipe(user=registred_user, time_minutes=5)
+        logged_client.get(RECIPES_URL + '?max_time=10&max_price=9')
+
+        same = logged_client.get(RECIPES_URL + '?max_price=9&max_time=10')
+        other = logged_client.get(RECIPES_URL + '?max_time=1&max_price=9')
+
+        assert same['X-Cache'] == 'HIT'
+        assert other['X-Cache'] == 'MISS'
+        assert other.data['results'] == []
+
+    def test_write_invalidates(self, logged_client, registred_user):
+        """Test changes to tags invalidate the cached tag list"""
+        tag = sample_tag(user=registred_user, name='Vegan')
+        logged_client.get(TAGS_URL)
+
+        tag.name = 'Vegetarian'
+        tag.save()
+        response = logged_client.get(TAGS_URL)
+
+        assert response['X-Cache'] == 'MISS'
+        assert response.data[0]['name'] == 'Vegetarian'
+
+    def test_other_user_write_keeps_cache(
+        self,
+        logged_client,
+        registred_user
+    ):
+        """Test writes of another user do not invalidate the cache"""
+        user2 = get_user_model().objects.create_user('o@test.com', 'pass')
+        logged_client.get(TAGS_URL)
+
+        sample_tag(user=user2, name='Fruity')
+        response = logged_client.get(TAGS_URL)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['X-Cache'] == 'HIT'
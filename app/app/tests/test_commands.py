@@ -1,7 +1,21 @@
+import json
+from io import BytesIO, StringIO
 from unittest.mock import patch
 
+import pytest
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+from core.storage import is_hashed_name
+from recipe import images
 
 
 class TestCommands:
@@ -22,3 +36,279 @@ class TestCommands:
             gi.side_effect = [OperationalError] * 5 + [True]
             call_command('wait_for_db')
             assert gi.call_count == 6
+
+
+def write_ndjson(path, rows):
+    path.write_text(
+        '\n'.join(json.dumps(row) for row in rows) + '\n', encoding='utf-8'
+    )
+    return str(path)
+
+
+@pytest.mark.django_db
+class TestImportRecipes:
+
+    @pytest.fixture
+    def user(self):
+        return get_user_model().objects.create_user(
+            'import@test.com', 'testpass'
+        )
+
+    def test_import_recipes(self, user, tmp_path):
+        """Test importing recipes with their tags and ingredients"""
+        Tag.objects.create(user=user, name='Vegan')
+        path = write_ndjson(tmp_path / 'recipes.ndjson', [
+            {'title': f'Recipe {i}', 'time_minutes': i, 'price': '5.50',
+             'tags': ['Vegan', 'Quick'], 'ingredients': ['Salt']}
+            for i in range(1, 8)
+        ])
+        out = StringIO()
+
+        call_command(
+            'import_recipes', path, user=user.email, batch_size=3, stdout=out
+        )
+
+        recipes = Recipe.objects.filter(user=user).order_by('id')
+        assert recipes.count() == 7
+        assert recipes[6].title == 'Recipe 7'
+        assert str(recipes[0].price) == '5.50'
+        assert Tag.objects.filter(user=user).count() == 2
+        assert Ingredient.objects.filter(user=user).count() == 1
+        for recipe in recipes:
+            assert sorted(t.name for t in recipe.tags.all()) == [
+                'Quick', 'Vegan'
+            ]
+            assert [i.name for i in recipe.ingredients.all()] == ['Salt']
+        assert 'rows/sec' in out.getvalue()
+        assert 'Imported 7 recipes' in out.getvalue()
+
+    def test_import_recipes_user_per_row(self, user, tmp_path):
+        """Test rows can name their owner"""
+        other = get_user_model().objects.create_user(
+            'other@test.com', 'testpass'
+        )
+        path = write_ndjson(tmp_path / 'recipes.ndjson', [
+            {'title': 'Mine', 'time_minutes': 5, 'price': 1,
+             'user': user.email, 'tags': ['Dinner'], 'link': None},
+            {'title': 'Theirs', 'time_minutes': 5, 'price': 1,
+             'user': other.email, 'tags': ['Dinner']},
+        ])
+
+        call_command('import_recipes', path, stdout=StringIO())
+
+        assert Recipe.objects.get(user=other).title == 'Theirs'
+        assert Recipe.objects.get(user=user).link == ''
+        assert Recipe.objects.get(user=user).tags.get().user == user
+        assert Recipe.objects.get(user=other).tags.get().user == other
+
+    def test_import_recipes_invalid_row(self, user, tmp_path):
+        """Test an invalid row aborts with its line number"""
+        path = write_ndjson(tmp_path / 'recipes.ndjson', [
+            {'title': 'Fine', 'time_minutes': 5, 'price': 1},
+            {'title': 'Broken', 'time_minutes': 'soon', 'price': 1},
+        ])
+
+        with pytest.raises(CommandError, match='Line 2'):
+            call_command(
+                'import_recipes', path, user=user.email, stdout=StringIO()
+            )
+        assert not Recipe.objects.exists()
+
+    def test_import_recipes_searchable(self, user, tmp_path):
+        """Test imported recipes reach the search index"""
+        path = write_ndjson(tmp_path / 'recipes.ndjson', [
+            {'title': 'Lemon tart', 'time_minutes': 30, 'price': 4},
+        ])
+
+        call_command(
+            'import_recipes', path, user=user.email, stdout=StringIO()
+        )
+
+        client = APIClient()
+        client.force_authenticate(user)
+        res = client.get(reverse('recipe:recipe-list'), {'search': 'lemon'})
+        assert [r['title'] for r in res.data['results']] == ['Lemon tart']
+
+
+@pytest.mark.django_db
+class TestUsageCountCommands:
+
+    def test_refresh_usage_counts(self):
+        """Test usage counts are recounted from the recipe links"""
+        user = get_user_model().objects.create_user('u@test.com', 'pass')
+        tag = Tag.objects.create(user=user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=user, name='Tofu')
+        recipe = Recipe.objects.create(
+            user=user, title='Tofu bowl', time_minutes=10, price=5
+        )
+        recipe.tags.add(tag)
+        recipe.ingredients.add(ingredient)
+        Tag.objects.update(usage_count=7)
+
+        call_command('refresh_usage_counts', stdout=StringIO())
+
+        assert Tag.objects.get().usage_count == 1
+        assert Ingredient.objects.get().usage_count == 1
+
+    def test_benchmark_assigned_only(self):
+        """Test the strategies are timed and seeded rows rolled back"""
+        out = StringIO()
+
+        call_command('benchmark_assigned_only', seed=20, repeat=1, stdout=out)
+
+        for strategy in ('join', 'exists', 'counter'):
+            assert f'tags {strategy}: 10 rows' in out.getvalue()
+        assert not Recipe.objects.exists()
+
+    def test_benchmark_search(self):
+        """Test indexed search and the title scan are timed, then undone"""
+        out = StringIO()
+
+        call_command(
+            'benchmark_search', seed=112, query='spicy curry', repeat=1,
+            stdout=out
+        )
+
+        # Titles repeat every 56 recipes, the spicy curries are 2 and 58
+        assert 'index: 2 rows' in out.getvalue()
+        assert 'scan: 2 rows' in out.getvalue()
+        assert not Recipe.objects.exists()
+
+    def test_benchmark_serialization(self):
+        """Test rows and instances are rendered alike, timed and undone"""
+        out = StringIO()
+
+        call_command('benchmark_serialization', seed=30, repeat=1, stdout=out)
+
+        for name in ('list', 'detail'):
+            for strategy in ('instances', 'rows'):
+                assert f'{name} {strategy}: 30 rows' in out.getvalue()
+        assert not Recipe.objects.exists()
+
+    def test_benchmark_assigned_only_rolls_back(self):
+        """Test benchmarking existing data leaves usage counts alone"""
+        user = get_user_model().objects.create_user('u@test.com', 'pass')
+        tag = Tag.objects.create(user=user, name='Vegan')
+        recipe = Recipe.objects.create(
+            user=user, title='Curry', time_minutes=5, price=1
+        )
+        recipe.tags.add(tag)
+
+        call_command(
+            'benchmark_assigned_only', user='u@test.com', repeat=1,
+            stdout=StringIO()
+        )
+
+        tag.refresh_from_db()
+        assert tag.usage_count == 0
+
+
+@pytest.mark.django_db
+class TestDedupeRecipeImages:
+
+    @pytest.fixture(autouse=True)
+    def media_root(self, settings, tmp_path):
+        settings.MEDIA_ROOT = str(tmp_path)
+
+    def _store(self, name, content):
+        return default_storage.save(name, ContentFile(content))
+
+    def test_dedupe_recipe_images(self):
+        """Test copies of one image collapse into a single hashed file"""
+        user = get_user_model().objects.create_user('u@test.com', 'pass')
+        first = self._store('uploads/recipe/dedupe-a.jpg', b'same photo')
+        second = self._store('uploads/recipe/dedupe-b.jpg', b'same photo')
+        other = self._store('uploads/recipe/dedupe-c.jpg', b'other photo')
+        thumb = images.derivative_name(first, 128, 'jpeg')
+        self._store(thumb, b'thumbnail')
+        for name in (first, second, other):
+            Recipe.objects.create(
+                user=user, title=name, time_minutes=1, price=1, image=name
+            )
+        out = StringIO()
+
+        call_command('dedupe_recipe_images', stdout=out)
+
+        names = set(Recipe.objects.values_list('image', flat=True))
+        assert len(names) == 2
+        shared = Recipe.objects.get(title=first).image
+        assert Recipe.objects.get(title=second).image == shared
+        assert shared.read() == b'same photo'
+        assert is_hashed_name(shared.name)
+        for name in (first, second, other, thumb):
+            assert not default_storage.exists(name)
+        assert default_storage.exists(
+            images.derivative_name(shared.name, 128, 'jpeg')
+        )
+        assert '1 duplicates removed, 10 bytes freed' in out.getvalue()
+
+    def test_dedupe_dry_run(self):
+        """Test a dry run only reports"""
+        user = get_user_model().objects.create_user('u@test.com', 'pass')
+        name = self._store('uploads/recipe/dry.jpg', b'photo')
+        Recipe.objects.create(
+            user=user, title='Dry', time_minutes=1, price=1, image=name
+        )
+
+        call_command('dedupe_recipe_images', dry_run=True, stdout=StringIO())
+
+        assert Recipe.objects.get().image.name == name
+        assert default_storage.exists(name)
+
+
+@pytest.mark.django_db
+class TestGenerateRecipeDerivatives:
+
+    @pytest.fixture(autouse=True)
+    def media_root(self, settings, tmp_path):
+        settings.MEDIA_ROOT = str(tmp_path)
+
+    def _recipe(self, name, content):
+        user, _created = get_user_model().objects.get_or_create(
+            email='u@test.com'
+        )
+        name = default_storage.save(name, ContentFile(content))
+        Recipe.objects.create(
+            user=user, title=name, time_minutes=1, price=1, image=name
+        )
+        return name
+
+    def _jpeg(self):
+        buffer = BytesIO()
+        Image.new('RGB', (300, 200)).save(buffer, format='JPEG')
+        return buffer.getvalue()
+
+    def test_generate_missing_derivatives(self):
+        """Test images without resized copies get them, once"""
+        name = self._recipe('uploads/recipe/photo.jpg', self._jpeg())
+        broken = self._recipe('uploads/recipe/broken.jpg', b'not an image')
+        default_storage.delete(
+            self._recipe('uploads/recipe/gone.jpg', self._jpeg() + b'x')
+        )
+        out = StringIO()
+
+        call_command('generate_recipe_derivatives', stdout=out)
+
+        for sizes in images.derivative_names(name).values():
+            for derivative in sizes.values():
+                assert default_storage.exists(derivative)
+        assert f'Failed {broken}' in out.getvalue()
+        assert '1 images resized, 0 complete, 1 failed, 1 missing' in \
+            out.getvalue()
+
+        out = StringIO()
+        call_command('generate_recipe_derivatives', stdout=out)
+
+        assert '0 images resized, 1 complete' in out.getvalue()
+
+    def test_generate_dry_run(self):
+        """Test a dry run only reports"""
+        name = self._recipe('uploads/recipe/photo.jpg', self._jpeg())
+        out = StringIO()
+
+        call_command('generate_recipe_derivatives', dry_run=True, stdout=out)
+
+        assert not default_storage.exists(
+            images.derivative_name(name, 128, 'jpeg')
+        )
+        assert 'Would have 1 images resized' in out.getvalue()
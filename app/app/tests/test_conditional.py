@@ -0,0 +1,70 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+import pytest
+
+from test_recipe import RECIPES_URL, sample_recipe, sample_tag
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+@pytest.mark.django_db
+class TestConditionalGet():
+    """Test ETag and If-None-Match handling on recipe endpoints"""
+
+    def test_etag_returned(self, logged_client, registred_user):
+        """Test list responses carry a strong ETag"""
+        sample_recipe(user=registred_user)
+
+        response = logged_client.get(RECIPES_URL)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'].startswith('"')
+        assert 'private' in response['Cache-Control']
+
+    def test_not_modified(self, logged_client, registred_user):
+        """Test matching If-None-Match returns 304 without data queries"""
+        sample_recipe(user=registred_user)
+        etag = logged_client.get(RECIPES_URL)['ETag']
+
+        with CaptureQueriesContext(connection) as context:
+            response = logged_client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response['ETag'] == etag
+        assert not response.content
+        assert not any(
+            'core_recipe' in query['sql']
+            for query in context.captured_queries
+        )
+
+    @pytest.mark.parametrize('change', [
+        lambda user, recipe: sample_recipe(user=user),
+        lambda user, recipe: recipe.delete(),
+        lambda user, recipe: recipe.tags.add(
+            sample_tag(user=user, name='Vegan')
+        ),
+    ])
+    def test_changes_invalidate_etag(
+        self,
+        logged_client,
+        registred_user,
+        change
+    ):
+        """Test writes to recipe data produce a new ETag"""
+        recipe = sample_recipe(user=registred_user)
+        etag = logged_client.get(RECIPES_URL)['ETag']
+
+        change(registred_user, recipe)
+        response = logged_client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'] != etag
+
+    def test_etag_varies_by_query(self, logged_client):
+        """Test different query params do not share an ETag"""
+        first = logged_client.get(TAGS_URL)
+        second = logged_client.get(TAGS_URL, {'assigned_only': 1})
+
+        assert first['ETag'] != second['ETag']
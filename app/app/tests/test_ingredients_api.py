@@ -9,6 +9,8 @@ from core.models import Ingredient, Recipe
 from recipe.serializers import IngredientSerializer
 
 INGREDIENTS_URL = reverse('recipe:ingredient-list')
+INGREDIENTS_BULK_URL = reverse('recipe:ingredient-bulk')
+INGREDIENTS_STATS_URL = reverse('recipe:ingredient-stats')
 
 
 class TestPulicIngredientApi():
@@ -130,3 +132,44 @@ class TestPrivateIngredientsApi():
         response = logged_client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
         assert len(response.data) == 1
+
+    def test_bulk_get_or_create_ingredients(
+        self,
+        logged_client,
+        registred_user
+    ):
+        """Test creating many ingredients by name at once"""
+        Ingredient.objects.create(user=registred_user, name='Salt')
+
+        response = logged_client.post(
+            INGREDIENTS_BULK_URL,
+            {'names': ['Salt', 'Pepper']},
+            format='json'
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [item['name'] for item in response.data] == ['Salt', 'Pepper']
+        assert Ingredient.objects.filter(user=registred_user).count() == 2
+
+    def test_ingredient_stats(self, logged_client, registred_user):
+        """Test ingredients are ranked by the recipes using them"""
+        salt = Ingredient.objects.create(user=registred_user, name='Salt')
+        egg = Ingredient.objects.create(user=registred_user, name='Egg')
+        for minutes in (5, 15):
+            recipe = Recipe.objects.create(
+                user=registred_user,
+                title='Omelette',
+                time_minutes=minutes,
+                price='3.25'
+            )
+            recipe.ingredients.add(salt, egg)
+        recipe.ingredients.remove(egg)
+
+        response = logged_client.get(INGREDIENTS_STATS_URL)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [(row['name'], row['recipe_count']) for row in response.data] \
+            == [('Salt', 2), ('Egg', 1)]
+        assert response.data[0]['avg_price'] == '3.25'
+        assert response.data[0]['avg_time_minutes'] == 10.0
+        assert response.data[1]['max_time_minutes'] == 5
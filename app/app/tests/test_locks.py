@@ -0,0 +1,51 @@
+import pytest
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from core.locks import advisory_lock, advisory_locks, lock_id
+
+
+def test_lock_id():
+    """Test keys map to stable signed 64 bit lock numbers"""
+    assert lock_id('key') == lock_id('key')
+    assert lock_id('key') != lock_id('other')
+    assert -2 ** 63 <= lock_id('key') < 2 ** 63
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('shared, function', [
+    (False, 'pg_advisory_xact_lock('),
+    (True, 'pg_advisory_xact_lock_shared('),
+])
+def test_advisory_lock(shared, function):
+    """Test locks are taken in PostgreSQL and skipped elsewhere"""
+    with CaptureQueriesContext(connection) as context, \
+            transaction.atomic():
+        advisory_lock('key', shared=shared)
+
+    locks = [
+        query['sql'] for query in context.captured_queries
+        if 'advisory' in query['sql']
+    ]
+    if connection.vendor == 'postgresql':
+        assert len(locks) == 1 and function in locks[0]
+    else:
+        assert locks == []
+
+
+@pytest.mark.django_db
+def test_advisory_locks():
+    """Test many locks are taken in one query in PostgreSQL only"""
+    with CaptureQueriesContext(connection) as context, \
+            transaction.atomic():
+        advisory_locks(['b', 'a', 'b'])
+        advisory_locks([])
+
+    locks = [
+        query['sql'] for query in context.captured_queries
+        if 'advisory' in query['sql']
+    ]
+    if connection.vendor == 'postgresql':
+        assert len(locks) == 1 and 'pg_advisory_xact_lock(' in locks[0]
+    else:
+        assert locks == []
@@ -0,0 +1,148 @@
+from unittest.mock import patch
+
+import pytest
+from django.test import Client
+from rest_framework import status
+
+from core import views
+
+
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def media_file(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    directory = tmp_path / 'uploads' / 'recipe'
+    directory.mkdir(parents=True)
+    (directory / 'photo.jpg').write_bytes(CONTENT)
+    return '/media/uploads/recipe/photo.jpg'
+
+
+def body(response):
+    return b''.join(response.streaming_content)
+
+
+class TestServeMedia:
+
+    def setup_method(self):
+        self.client = Client()
+
+    def test_serve_file(self, media_file):
+        """Test a whole file is served with validators and caching"""
+        response = self.client.get(media_file)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert body(response) == CONTENT
+        assert response['Content-Type'] == 'image/jpeg'
+        assert response['Content-Length'] == str(len(CONTENT))
+        assert response['Accept-Ranges'] == 'bytes'
+        assert response['Cache-Control'] == 'public, max-age=86400'
+        assert response['ETag'].startswith('"')
+        assert 'Last-Modified' in response
+
+    def test_not_modified(self, media_file):
+        """Test matching validators get an empty 304"""
+        first = self.client.get(media_file)
+
+        by_etag = self.client.get(
+            media_file, HTTP_IF_NONE_MATCH=first['ETag']
+        )
+        by_date = self.client.get(
+            media_file, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']
+        )
+
+        for response in (by_etag, by_date):
+            assert response.status_code == status.HTTP_304_NOT_MODIFIED
+            assert response['ETag'] == first['ETag']
+            assert response.content == b''
+
+    @pytest.mark.parametrize('header,start,end', [
+        ('bytes=0-99', 0, 99),
+        ('bytes=1000-', 1000, 1023),
+        ('bytes=-24', 1000, 1023),
+        ('bytes=1000-5000', 1000, 1023),
+    ])
+    def test_byte_range(self, media_file, header, start, end):
+        """Test single byte ranges get a 206 with the slice"""
+        response = self.client.get(media_file, HTTP_RANGE=header)
+
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert body(response) == CONTENT[start:end + 1]
+        assert response['Content-Length'] == str(end - start + 1)
+        assert response['Content-Range'] == \
+            f'bytes {start}-{end}/{len(CONTENT)}'
+
+    def test_unsatisfiable_range(self, media_file):
+        """Test ranges past the end get a 416"""
+        response = self.client.get(media_file, HTTP_RANGE='bytes=5000-')
+
+        assert response.status_code == \
+            status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        assert response['Content-Range'] == f'bytes */{len(CONTENT)}'
+
+    def test_stale_if_range(self, media_file):
+        """Test a range is ignored when If-Range no longer matches"""
+        response = self.client.get(
+            media_file, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"'
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert body(response) == CONTENT
+
+    def test_immutable_hashed_names(self, media_file, tmp_path):
+        """Test content addressed files are cached for good"""
+        digest = 'ab' + '0' * 62
+        directory = tmp_path / 'uploads' / 'recipe' / 'ab'
+        directory.mkdir()
+        (directory / f'{digest}_128.webp').write_bytes(CONTENT)
+
+        response = self.client.get(
+            f'/media/uploads/recipe/ab/{digest}_128.webp'
+        )
+
+        assert response['Content-Type'] == 'image/webp'
+        assert 'immutable' in response['Cache-Control']
+
+    @pytest.mark.parametrize('path', [
+        '/media/uploads/recipe/missing.jpg',
+        '/media/uploads/recipe/',
+        '/media/../settings.py',
+        '/media/uploads/partial/upload.part',
+        '/media/uploads//partial/upload.part',
+        '/media/uploads/./partial/upload.part',
+        '/media/uploads/recipe/../partial/upload.part',
+    ])
+    def test_not_found(self, media_file, tmp_path, path):
+        """Test missing, directory, outside and private paths 404"""
+        (tmp_path / 'uploads' / 'partial').mkdir()
+        (tmp_path / 'uploads' / 'partial' / 'upload.part').write_bytes(b'x')
+
+        response = self.client.get(path)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_post_not_allowed(self, media_file):
+        """Test only safe methods are served"""
+        response = self.client.post(media_file)
+
+        assert response.status_code == status.HTTP_405_METHOD_NOT_ALLOWED
+
+    def test_x_accel_redirect(self, media_file):
+        """Test the body is left to nginx when configured"""
+        with patch.object(views, 'MEDIA_ACCEL', 'x-accel-redirect'):
+            response = self.client.get(media_file)
+
+        assert response['X-Accel-Redirect'] == \
+            '/protected/uploads/recipe/photo.jpg'
+        assert response.content == b''
+        assert 'ETag' in response
+
+    def test_x_sendfile(self, media_file, tmp_path):
+        """Test the body is left to the server when configured"""
+        with patch.object(views, 'MEDIA_ACCEL', 'x-sendfile'):
+            response = self.client.get(media_file)
+
+        assert response['X-Sendfile'] == str(
+            tmp_path / 'uploads' / 'recipe' / 'photo.jpg'
+        )
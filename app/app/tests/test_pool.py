@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+
+from core.backends import pool
+from core.backends.pool import ConnectionPool, PoolTimeout
+
+
+class Connection:
+    """Stands in for a DB-API connection"""
+
+    def __init__(self):
+        self.closed = False
+        self.alive = True
+
+    def close(self):
+        self.closed = True
+
+
+def ping(connection):
+    return connection.alive
+
+
+class TestConnectionPool:
+
+    def test_reuse(self):
+        """Test returned connections are handed out again"""
+        connections = ConnectionPool(max_size=2)
+
+        first = connections.checkout(Connection)
+        connections.checkin(first)
+        second = connections.checkout(Connection)
+
+        assert second is first
+        stats = connections.get_stats()
+        assert stats['created'] == 1
+        assert stats['checkouts'] == 2
+        assert stats['in_use'] == 1
+
+    def test_min_size(self):
+        """Test the first checkout opens min_size connections"""
+        connections = ConnectionPool(min_size=3, max_size=5)
+
+        connections.checkout(Connection)
+
+        stats = connections.get_stats()
+        assert stats['created'] == 3
+        assert stats['in_use'] == 1
+        assert stats['idle'] == 2
+
+    def test_wait_for_checkin(self):
+        """Test checkouts beyond max_size wait for a connection"""
+        connections = ConnectionPool(max_size=1, timeout=5)
+        first = connections.checkout(Connection)
+        timer = threading.Timer(0.2, connections.checkin, [first])
+        timer.start()
+
+        second = connections.checkout(Connection)
+
+        timer.join()
+        assert second is first
+        assert connections.get_stats()['max_wait_ms'] >= 150
+
+    def test_timeout(self):
+        """Test waiting for a connection is limited"""
+        connections = ConnectionPool(max_size=1, timeout=0.1)
+        connections.checkout(Connection)
+
+        with pytest.raises(PoolTimeout):
+            connections.checkout(Connection)
+
+        assert connections.get_stats()['timeouts'] == 1
+
+    def test_not_reusable(self):
+        """Test broken connections are closed instead of pooled"""
+        connections = ConnectionPool()
+        connection = connections.checkout(Connection)
+
+        connections.checkin(connection, reusable=False)
+
+        assert connection.closed
+        assert connections.get_stats()['size'] == 0
+
+    def test_pre_ping(self):
+        """Test connections failing the ping are replaced"""
+        connections = ConnectionPool(ping=ping)
+        dead = connections.checkout(Connection)
+        connections.checkin(dead)
+        dead.alive = False
+
+        connection = connections.checkout(Connection)
+
+        assert connection is not dead
+        assert dead.closed
+        stats = connections.get_stats()
+        assert stats['failed_pings'] == 1
+        assert stats['size'] == 1
+
+    def test_idle_timeout(self):
+        """Test surplus connections idle too long are closed"""
+        connections = ConnectionPool(min_size=1, idle_timeout=0.05)
+        first = connections.checkout(Connection)
+        second = connections.checkout(Connection)
+        connections.checkin(first)
+        time.sleep(0.1)
+
+        connections.checkin(second)
+
+        assert first.closed
+        assert not second.closed
+        assert connections.get_stats()['idle'] == 1
+
+    def test_failed_connect(self):
+        """Test a failing connect gives its slot back"""
+        def refuse():
+            raise OSError('refused')
+        connections = ConnectionPool(max_size=1)
+
+        with pytest.raises(OSError):
+            connections.checkout(refuse)
+
+        assert connections.get_stats()['size'] == 0
+        assert connections.checkout(Connection)
+
+
+def test_pools_per_key():
+    """Test pools are shared per key and closed together"""
+    first = pool.get_pool(('test', 'one'))
+    connection = first.checkout(Connection)
+    first.checkin(connection)
+
+    assert pool.get_pool(('test', 'one')) is first
+    assert pool.get_pool(('test', 'two')) is not first
+    assert pool.get_stats()[('test', 'one')]['idle'] == 1
+
+    pool.close_all()
+
+    assert connection.closed
+    assert pool.get_stats()[('test', 'one')]['idle'] == 0
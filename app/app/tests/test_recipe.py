@@ -1,15 +1,27 @@
+import json
 import tempfile
 import os
+from base64 import b64encode
+from io import BytesIO
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import Mock, patch
 from PIL import Image
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from rest_framework.test import APIClient
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 from rest_framework import status
 import pytest
 
 from core.models import Recipe, Tag, Ingredient
 
+from recipe import images, uploads
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from recipe.views import RecipeViewSet
 
 RECIPES_URL = reverse('recipe:recipe-list')
 
@@ -19,6 +31,11 @@ def image_upload_url(recipe_id):
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
 
 
+def upload_start_url(recipe_id):
+    """Return URL starting a chunked image upload"""
+    return reverse('recipe:recipe-start-upload', args=[recipe_id])
+
+
 def detail_url(recipe_id):
     """Return recipe detail URL"""
     return reverse('recipe:recipe-detail', args=[recipe_id])
@@ -73,7 +90,7 @@ class TestPrivateRecipeApi():
         recipes = Recipe.objects.all().order_by('-id')
         serializer = RecipeSerializer(recipes, many=True)
         assert response.status_code == status.HTTP_200_OK
-        assert response.data == serializer.data
+        assert response.data['results'] == serializer.data
 
     def test_recipes_limited_to_user(
         self,
@@ -93,8 +110,8 @@ class TestPrivateRecipeApi():
         serializer = RecipeSerializer(recipes, many=True)
 
         assert response.status_code == status.HTTP_200_OK
-        assert len(response.data) == 1
-        assert response.data == serializer.data
+        assert len(response.data['results']) == 1
+        assert response.data['results'] == serializer.data
 
     def test_view_recipe_detail(sefl, logged_client, registred_user):
         """Test viewing a recipe detail"""
@@ -225,6 +242,175 @@ class TestRecipeImageUpload():
         assert 'image' in response.data
         assert os.path.exists(recipe.image.path)
 
+    def _upload(self, client, recipe, size, suffix='.jpg'):
+        with tempfile.NamedTemporaryFile(suffix=suffix) as ntf:
+            Image.new('RGB', size).save(ntf, format='JPEG')
+            ntf.seek(0)
+            return client.post(
+                image_upload_url(recipe.id),
+                {'image': ntf},
+                format='multipart'
+            )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_upload_image_derivatives(
+        self,
+        logged_client,
+        registred_user,
+        settings
+    ):
+        """Test resized JPEG and WebP copies are written and linked"""
+        settings.RECIPE_IMAGE_WORKERS = 0
+        recipe = sample_recipe(user=registred_user)
+
+        response = self._upload(logged_client, recipe, (2000, 1000))
+
+        assert response.status_code == status.HTTP_200_OK
+        recipe.refresh_from_db()
+        names = images.derivative_names(recipe.image.name)
+        assert set(names) == {'jpeg', 'webp'}
+        for image_format, sizes in names.items():
+            assert set(sizes) == {128, 512, 1024}
+            with Image.open(default_storage.path(sizes[128])) as thumb:
+                assert thumb.size == (128, 64)
+                assert thumb.format == image_format.upper()
+        assert response.data['images']['webp']['512'].endswith(
+            names['webp'][512]
+        )
+
+        detail = logged_client.get(detail_url(recipe.id))
+        assert detail.data['images'] == response.data['images']
+
+    def test_existing_derivatives_kept(self, settings, tmp_path):
+        """Test only missing derivatives are written, without suffixes"""
+        settings.MEDIA_ROOT = str(tmp_path)
+        name = 'uploads/recipe/ab/' + 'ab' * 32 + '.jpg'
+        original = BytesIO()
+        Image.new('RGB', (300, 300)).save(original, format='JPEG')
+        default_storage.save(name, original)
+        existing = images.derivative_name(name, 128, 'jpeg')
+        default_storage.save(existing, BytesIO(b'kept'))
+
+        images.generate_derivatives(name)
+
+        with default_storage.open(existing) as kept:
+            assert kept.read() == b'kept'
+        written = {
+            derivative
+            for sizes in images.derivative_names(name).values()
+            for derivative in sizes.values()
+        }
+        assert all(default_storage.exists(path) for path in written)
+        assert set(os.listdir(os.path.dirname(default_storage.path(name)))) \
+            == {os.path.basename(path) for path in written | {name}}
+
+        images.generate_derivatives(name, replace=True)
+        with Image.open(default_storage.path(existing)) as thumb:
+            assert thumb.size == (128, 128)
+
+    def test_upload_image_resized_later(self, logged_client, registred_user):
+        """Test the upload only queues resizing in the worker pool"""
+        recipe = sample_recipe(user=registred_user)
+
+        with patch('recipe.images.transaction.on_commit') as on_commit, \
+                patch('recipe.images._get_executor') as get_executor:
+            response = self._upload(logged_client, recipe, (300, 300))
+            get_executor.assert_not_called()
+            on_commit.call_args[0][0]()
+
+        recipe.refresh_from_db()
+        assert response.status_code == status.HTTP_200_OK
+        get_executor.return_value.submit.assert_called_once_with(
+            images.generate_derivatives, recipe.image.name
+        )
+
+    def test_broken_pool_replaced(self):
+        """Test resizing goes to a new pool when a worker died"""
+        broken, fresh = Mock(), Mock()
+        broken.submit.side_effect = BrokenProcessPool()
+
+        with patch('recipe.images.transaction.on_commit') as on_commit, \
+                patch('recipe.images._get_executor',
+                      side_effect=[broken, fresh]):
+            images.schedule_derivatives('image.jpg')
+            on_commit.call_args[0][0]()
+
+        broken.shutdown.assert_called_once_with(wait=False)
+        fresh.submit.assert_called_once_with(
+            images.generate_derivatives, 'image.jpg'
+        )
+
+    def test_recipe_without_image(self, logged_client, registred_user):
+        """Test recipes without an image have no image URLs"""
+        recipe = sample_recipe(user=registred_user)
+
+        response = logged_client.get(detail_url(recipe.id))
+
+        assert response.data['images'] is None
+
+    @pytest.mark.django_db(transaction=True)
+    def test_identical_images_stored_once(
+        self,
+        logged_client,
+        registred_user,
+        settings
+    ):
+        """Test identical uploads share one file until the last is gone"""
+        settings.RECIPE_IMAGE_WORKERS = 0
+        recipes = [sample_recipe(user=registred_user) for _ in range(3)]
+        for recipe in recipes[:2]:
+            self._upload(logged_client, recipe, (64, 64))
+        self._upload(logged_client, recipes[2], (32, 32))
+        for recipe in recipes:
+            recipe.refresh_from_db()
+        shared = recipes[0].image.name
+        thumbnail = images.derivative_name(shared, 128, 'jpeg')
+
+        assert recipes[1].image.name == shared
+        assert recipes[2].image.name != shared
+        assert default_storage.exists(thumbnail)
+
+        recipes[0].delete()
+        assert os.path.exists(recipes[1].image.path)
+
+        self._upload(logged_client, recipes[1], (48, 48))
+        assert not os.path.exists(recipes[1].image.path)
+        assert not default_storage.exists(thumbnail)
+
+    def test_name_from_detected_format(self, logged_client, registred_user):
+        """Test identical images get one name whatever they were called"""
+        recipes = [sample_recipe(user=registred_user) for _ in range(2)]
+        self._upload(logged_client, recipes[0], (16, 16), suffix='.jpeg')
+        self._upload(logged_client, recipes[1], (16, 16), suffix='.JPG')
+        for recipe in recipes:
+            recipe.refresh_from_db()
+
+        assert recipes[0].image.name == recipes[1].image.name
+        assert recipes[0].image.name.endswith('.jpg')
+
+    @pytest.mark.django_db(transaction=True)
+    def test_derivatives_kept_for_other_extension(
+        self,
+        registred_user,
+        settings,
+        tmp_path
+    ):
+        """Test a copy stored under another extension keeps thumbnails"""
+        settings.MEDIA_ROOT = str(tmp_path)
+        root = 'uploads/recipe/ab/' + 'ab' * 32
+        for name in (f'{root}.jpeg', f'{root}.jpg', f'{root}_128.jpg'):
+            default_storage.save(name, BytesIO(b'image'))
+        old, current = sample_recipe(user=registred_user), \
+            sample_recipe(user=registred_user)
+        Recipe.objects.filter(pk=old.pk).update(image=f'{root}.jpeg')
+        Recipe.objects.filter(pk=current.pk).update(image=f'{root}.jpg')
+
+        Recipe.objects.get(pk=old.pk).delete()
+
+        assert not default_storage.exists(f'{root}.jpeg')
+        assert default_storage.exists(f'{root}.jpg')
+        assert default_storage.exists(f'{root}_128.jpg')
+
     def test_upload_image_bad_request(self, logged_client, registred_user):
         """Test uploading a invalid image"""
         recipe = sample_recipe(user=registred_user)
@@ -256,10 +442,10 @@ class TestRecipeImageUpload():
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        assert len(response.data) == 2
-        assert serializer1.data in response.data
-        assert serializer2.data in response.data
-        assert serializer3.data not in response.data
+        assert len(response.data['results']) == 2
+        assert serializer1.data in response.data['results']
+        assert serializer2.data in response.data['results']
+        assert serializer3.data not in response.data['results']
 
     def test_filter_recipes_by_ingredients(
         self,
@@ -284,7 +470,824 @@ class TestRecipeImageUpload():
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
 
-        assert len(response.data) == 2
-        assert serializer1.data in response.data
-        assert serializer2.data in response.data
-        assert serializer3.data not in response.data
+        assert len(response.data['results']) == 2
+        assert serializer1.data in response.data['results']
+        assert serializer2.data in response.data['results']
+        assert serializer3.data not in response.data['results']
+
+
+@pytest.mark.django_db
+class TestRecipePagination():
+    """Test keyset pagination of the recipe list"""
+
+    def _collect_pages(self, client, params):
+        """Follow next links and return ids from every page"""
+        ids = []
+        response = client.get(RECIPES_URL, params)
+        while True:
+            assert response.status_code == status.HTTP_200_OK
+            ids.extend(item['id'] for item in response.data['results'])
+            if not response.data['next']:
+                return ids, response
+            response = client.get(response.data['next'])
+
+    def test_pages_cover_all_recipes(self, logged_client, registred_user):
+        """Test walking pages returns every recipe exactly once"""
+        recipes = [
+            sample_recipe(user=registred_user, title=f'Recipe {i}')
+            for i in range(7)
+        ]
+
+        ids, _ = self._collect_pages(logged_client, {'page_size': 3})
+
+        assert ids == sorted((recipe.id for recipe in recipes), reverse=True)
+
+    def test_ordering_with_duplicate_values(
+        self,
+        logged_client,
+        registred_user
+    ):
+        """Test ordering by a non unique column uses id as tie-breaker"""
+        for i in range(6):
+            sample_recipe(user=registred_user, time_minutes=i % 2)
+
+        ids, _ = self._collect_pages(
+            logged_client,
+            {'page_size': 2, 'ordering': 'time_minutes'}
+        )
+
+        expected = Recipe.objects.order_by('time_minutes', 'id')
+        assert ids == [recipe.id for recipe in expected]
+
+    def test_previous_link(self, logged_client, registred_user):
+        """Test previous link returns the preceding page"""
+        for i in range(5):
+            sample_recipe(user=registred_user, price=i)
+
+        first = logged_client.get(
+            RECIPES_URL,
+            {'page_size': 2, 'ordering': '-price'}
+        )
+        second = logged_client.get(first.data['next'])
+        back = logged_client.get(second.data['previous'])
+
+        assert first.data['previous'] is None
+        assert back.data['results'] == first.data['results']
+
+    def test_cursor_from_other_ordering_rejected(
+        self,
+        logged_client,
+        registred_user
+    ):
+        """Test a cursor can not be reused with a different ordering"""
+        for i in range(3):
+            sample_recipe(user=registred_user)
+
+        response = logged_client.get(RECIPES_URL, {'page_size': 1})
+        response = logged_client.get(
+            response.data['next'] + '&ordering=price'
+        )
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    @pytest.mark.parametrize('ordering, querystring', [
+        ('-id', 'f=id&p=abc'),
+        ('-id', 'f=id&p=1.5'),
+        ('price', 'f=price&p=x&p=1'),
+        ('price', 'f=price&p=NaN&p=1'),
+        ('price', 'f=price&p=1.00&p=one'),
+        ('time_minutes', 'f=time_minutes&p=&p=1'),
+    ])
+    def test_tampered_cursor_rejected(
+        self,
+        logged_client,
+        ordering,
+        querystring
+    ):
+        """Test cursors with values of the wrong type are rejected"""
+        cursor = b64encode(querystring.encode('ascii')).decode('ascii')
+
+        response = logged_client.get(
+            RECIPES_URL,
+            {'ordering': ordering, 'cursor': cursor}
+        )
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestRecipeQueryCount():
+    """Test the number of queries does not grow with the result size"""
+
+    def _add_recipes(self, user, count):
+        """Create recipes with a tag and an ingredient each"""
+        start = Recipe.objects.count()
+        for i in range(start, start + count):
+            recipe = sample_recipe(user=user, title=f'Recipe {i}')
+            recipe.tags.add(sample_tag(user=user, name=f'Tag {i}'))
+            recipe.ingredients.add(
+                sample_ingredient(user=user, name=f'Ingredient {i}')
+            )
+
+    def _count_queries(self, client, url):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        return len(context)
+
+    def test_list_query_count_constant(self, logged_client, registred_user):
+        """Test listing recipes uses a fixed number of queries"""
+        self._add_recipes(registred_user, 2)
+        few = self._count_queries(logged_client, RECIPES_URL)
+
+        self._add_recipes(registred_user, 8)
+        many = self._count_queries(logged_client, RECIPES_URL)
+
+        # One query reads the data version for the ETag
+        assert few == many == 4
+
+    def test_detail_query_count(self, logged_client, registred_user):
+        """Test retrieving a recipe prefetches nested objects"""
+        recipe = sample_recipe(user=registred_user)
+        for i in range(5):
+            recipe.tags.add(sample_tag(user=registred_user, name=f'Tag {i}'))
+            recipe.ingredients.add(
+                sample_ingredient(user=registred_user, name=f'Ing {i}')
+            )
+
+        queries = self._count_queries(logged_client, detail_url(recipe.id))
+
+        assert queries == 4
+
+
+@pytest.mark.django_db
+class TestRecipeMatchFilter():
+    """Test filtering recipes with match=all|any"""
+
+    def _tagged_recipes(self, user):
+        """Create recipes tagged with one or both of two tags"""
+        vegan = sample_tag(user=user, name='Vegan')
+        quick = sample_tag(user=user, name='Quick')
+        both = sample_recipe(user=user, title='Salad')
+        both.tags.add(vegan, quick)
+        only_vegan = sample_recipe(user=user, title='Stew')
+        only_vegan.tags.add(vegan)
+        return vegan, quick, both, only_vegan
+
+    def _ids(self, response):
+        assert response.status_code == status.HTTP_200_OK
+        return sorted(item['id'] for item in response.data['results'])
+
+    def test_match_any_returns_unique_recipes(
+        self,
+        logged_client,
+        registred_user
+    ):
+        """Test OR filtering does not duplicate recipes with both tags"""
+        vegan, quick, both, only_vegan = self._tagged_recipes(registred_user)
+
+        response = logged_client.get(
+            RECIPES_URL,
+            {'tags': f'{vegan.id},{quick.id}'}
+        )
+
+        assert self._ids(response) == sorted([both.id, only_vegan.id])
+
+    def test_match_all(self, logged_client, registred_user):
+        """Test AND filtering returns recipes having every tag"""
+        vegan, quick, both, _ = self._tagged_recipes(registred_user)
+
+        response = logged_client.get(
+            RECIPES_URL,
+            {'tags': f'{vegan.id},{quick.id}', 'match': 'all'}
+        )
+
+        assert self._ids(response) == [both.id]
+
+    def test_match_all_tags_and_ingredients(
+        self,
+        logged_client,
+        registred_user
+    ):
+        """Test tag and ingredient filters are combined"""
+        vegan, quick, both, only_vegan = self._tagged_recipes(registred_user)
+        tofu = sample_ingredient(user=registred_user, name='Tofu')
+        only_vegan.ingredients.add(tofu)
+
+        response = logged_client.get(
+            RECIPES_URL,
+            {'tags': str(vegan.id), 'ingredients': str(tofu.id),
+             'match': 'all'}
+        )
+
+        assert self._ids(response) == [only_vegan.id]
+
+    def test_index_follows_changes(self, logged_client, registred_user):
+        """Test the index is updated after links change"""
+        vegan, quick, both, only_vegan = self._tagged_recipes(registred_user)
+        params = {'tags': str(quick.id)}
+        assert self._ids(logged_client.get(RECIPES_URL, params)) == [both.id]
+
+        only_vegan.tags.add(quick)
+        both.tags.remove(quick)
+        assert self._ids(logged_client.get(RECIPES_URL, params)) == [
+            only_vegan.id
+        ]
+
+        quick.recipe_set.clear()
+        assert self._ids(logged_client.get(RECIPES_URL, params)) == []
+
+        only_vegan.delete()
+        response = logged_client.get(RECIPES_URL, {'tags': str(vegan.id)})
+        assert self._ids(response) == [both.id]
+
+    def test_index_follows_data_version(self, logged_client, registred_user):
+        """Test links written elsewhere are seen once the version moves"""
+        vegan, quick, both, only_vegan = self._tagged_recipes(registred_user)
+        params = {'tags': str(quick.id)}
+        assert self._ids(logged_client.get(RECIPES_URL, params)) == [both.id]
+
+        # As another worker would, without signals in this process
+        Recipe.tags.through.objects.create(recipe=only_vegan, tag=quick)
+        get_user_model().objects.bump_data_version(registred_user.id)
+
+        assert sorted(self._ids(logged_client.get(RECIPES_URL, params))) == \
+            sorted([both.id, only_vegan.id])
+
+    @pytest.mark.parametrize('params', [
+        {'tags': 'abc'},
+        {'ingredients': '1,-2'},
+        {'tags': '99999999999999999999'},
+    ])
+    def test_invalid_ids(self, logged_client, params):
+        """Test filtering by anything but ids is rejected"""
+        response = logged_client.get(RECIPES_URL, params)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert set(response.data) == set(params)
+
+    def test_empty_ids_skipped(self, logged_client, registred_user):
+        """Test empty items of an id list are ignored"""
+        vegan = sample_tag(user=registred_user, name='Vegan')
+        recipe = sample_recipe(user=registred_user)
+        recipe.tags.add(vegan)
+        sample_recipe(user=registred_user)
+
+        response = logged_client.get(RECIPES_URL, {'tags': f'{vegan.id},'})
+        unfiltered = logged_client.get(RECIPES_URL, {'tags': ','})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [item['id'] for item in response.data['results']] == \
+            [recipe.id]
+        assert len(unfiltered.data['results']) == 2
+
+    def test_invalid_match(self, logged_client):
+        """Test an unknown match mode is rejected"""
+        response = logged_client.get(
+            RECIPES_URL,
+            {'tags': '1', 'match': 'some'}
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestRecipeSearch():
+    """Test full-text search of recipes"""
+
+    def _titles(self, response):
+        assert response.status_code == status.HTTP_200_OK
+        return [item['title'] for item in response.data['results']]
+
+    def test_search_title(self, logged_client, registred_user):
+        """Test searching recipes by words in the title"""
+        sample_recipe(user=registred_user, title='Thai green curry')
+        sample_recipe(user=registred_user, title='Fish and chips')
+
+        response = logged_client.get(RECIPES_URL, {'search': 'curry'})
+
+        assert self._titles(response) == ['Thai green curry']
+
+    def test_search_tags_and_ingredients(
+        self,
+        logged_client,
+        registred_user
+    ):
+        """Test tag and ingredient names are searchable and kept fresh"""
+        recipe = sample_recipe(user=registred_user, title='Weekday dinner')
+        tag = sample_tag(user=registred_user, name='Vegan')
+        recipe.tags.add(tag)
+        recipe.ingredients.add(
+            sample_ingredient(user=registred_user, name='Tofu')
+        )
+
+        assert self._titles(
+            logged_client.get(RECIPES_URL, {'search': 'vegan tofu'})
+        ) == ['Weekday dinner']
+
+        tag.name = 'Spicy'
+        tag.save()
+        assert self._titles(
+            logged_client.get(RECIPES_URL, {'search': 'vegan'})
+        ) == []
+
+        recipe.tags.clear()
+        assert self._titles(
+            logged_client.get(RECIPES_URL, {'search': 'spicy'})
+        ) == []
+
+    def test_search_ranks_title_matches_first(
+        self,
+        logged_client,
+        registred_user
+    ):
+        """Test recipes matching in the title outrank other matches"""
+        tagged = sample_recipe(user=registred_user, title='Pasta bake')
+        tagged.tags.add(sample_tag(user=registred_user, name='Soup'))
+        sample_recipe(user=registred_user, title='Tomato soup')
+
+        response = logged_client.get(RECIPES_URL, {'search': 'soup'})
+
+        assert self._titles(response) == ['Tomato soup', 'Pasta bake']
+
+    def test_search_limited_to_user(self, logged_client, registred_user):
+        """Test search does not return recipes of other users"""
+        user2 = get_user_model().objects.create_user(
+            'other@test.com',
+            'pass123'
+        )
+        sample_recipe(user=user2, title='Secret curry')
+        sample_recipe(user=registred_user, title='Public curry')
+
+        response = logged_client.get(RECIPES_URL, {'search': 'curry'})
+
+        assert self._titles(response) == ['Public curry']
+
+    def test_search_deleted_recipe(self, logged_client, registred_user):
+        """Test deleted recipes are removed from the index"""
+        recipe = sample_recipe(user=registred_user, title='Old curry')
+        recipe.delete()
+
+        response = logged_client.get(RECIPES_URL, {'search': 'curry'})
+
+        assert self._titles(response) == []
+
+    def test_search_pages_by_rank(self, logged_client, registred_user):
+        """Test ranked search results can be paged"""
+        for i in range(5):
+            sample_recipe(user=registred_user, title=f'Curry {i}')
+
+        response = logged_client.get(
+            RECIPES_URL,
+            {'search': 'curry', 'page_size': 2}
+        )
+        titles = self._titles(response)
+        while response.data['next']:
+            response = logged_client.get(response.data['next'])
+            titles.extend(self._titles(response))
+
+        assert sorted(titles) == [f'Curry {i}' for i in range(5)]
+
+
+@pytest.mark.django_db
+class TestRecipeRangeFilter():
+    """Test filtering recipes by time and price ranges"""
+
+    def _titles(self, response):
+        assert response.status_code == status.HTTP_200_OK
+        return sorted(item['title'] for item in response.data['results'])
+
+    def test_filter_max_time(self, logged_client, registred_user):
+        """Test returning recipes under a preparation time"""
+        sample_recipe(user=registred_user, title='Toast', time_minutes=5)
+        sample_recipe(user=registred_user, title='Stew', time_minutes=90)
+
+        response = logged_client.get(RECIPES_URL, {'max_time': 30})
+
+        assert self._titles(response) == ['Toast']
+
+    def test_filter_price_range(self, logged_client, registred_user):
+        """Test returning recipes within a price range"""
+        sample_recipe(user=registred_user, title='Rice', price=1.50)
+        sample_recipe(user=registred_user, title='Pasta', price=4.00)
+        sample_recipe(user=registred_user, title='Steak', price=20.00)
+
+        response = logged_client.get(
+            RECIPES_URL,
+            {'min_price': '2', 'max_price': '10.00', 'min_time': 10}
+        )
+
+        assert self._titles(response) == ['Pasta']
+
+    def test_filter_invalid_range(self, logged_client):
+        """Test invalid range values are rejected"""
+        response = logged_client.get(
+            RECIPES_URL,
+            {'max_time': 'soon', 'min_price': '-'}
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert set(response.data) == {'max_time', 'min_price'}
+
+    @pytest.mark.parametrize('params', [
+        {'max_price': 'sNaN'},
+        {'min_price': 'Infinity'},
+        {'min_time': '99999999999999999999'},
+    ])
+    def test_filter_out_of_range(self, logged_client, params):
+        """Test values the database cannot compare with are rejected"""
+        response = logged_client.get(RECIPES_URL, params)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert set(response.data) == set(params)
+
+    @pytest.mark.parametrize('params, index', [
+        ({'max_time': 30}, 'recipe_user_time_id_idx'),
+        ({'max_price': 10}, 'recipe_user_price_id_idx'),
+    ])
+    def test_range_filter_uses_index(self, registred_user, params, index):
+        """Test the planner uses the (user, column) indexes"""
+        request = Request(APIRequestFactory().get(RECIPES_URL, params))
+        request.user = registred_user
+        view = RecipeViewSet(request=request, action='list')
+        if connection.vendor == 'postgresql':
+            # Tiny test tables would otherwise always be scanned
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+        plan = view.get_queryset().explain()
+
+        assert index in plan
+
+
+@pytest.mark.django_db
+class TestRecipeSparseFields():
+    """Test ?fields= and ?expand= on recipe endpoints"""
+
+    def test_fields_limit_output_and_queries(
+        self,
+        logged_client,
+        registred_user
+    ):
+        """Test only requested fields are rendered and loaded"""
+        recipe = sample_recipe(user=registred_user, link='http://a.com')
+        recipe.tags.add(sample_tag(user=registred_user))
+
+        with CaptureQueriesContext(connection) as context:
+            response = logged_client.get(
+                RECIPES_URL,
+                {'fields': 'id,title', 'ordering': 'price'}
+            )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['results'] == [
+            {'id': recipe.id, 'title': recipe.title}
+        ]
+        assert len(context) == 2
+        recipe_sql = context.captured_queries[-1]['sql']
+        assert '"core_recipe"' in recipe_sql
+        assert '"link"' not in recipe_sql
+
+    def test_expand_nests_relations(self, logged_client, registred_user):
+        """Test expanded relations are rendered as nested objects"""
+        recipe = sample_recipe(user=registred_user)
+        tag = sample_tag(user=registred_user)
+        ingredient = sample_ingredient(user=registred_user)
+        recipe.tags.add(tag)
+        recipe.ingredients.add(ingredient)
+
+        response = logged_client.get(RECIPES_URL, {'expand': 'tags'})
+
+        result = response.data['results'][0]
+        assert result['tags'] == [{'id': tag.id, 'name': tag.name}]
+        assert result['ingredients'] == [ingredient.id]
+
+    def test_detail_fields(self, logged_client, registred_user):
+        """Test fields can be limited on the recipe detail"""
+        recipe = sample_recipe(user=registred_user)
+        recipe.tags.add(sample_tag(user=registred_user))
+
+        response = logged_client.get(
+            detail_url(recipe.id),
+            {'fields': 'title,tags'}
+        )
+
+        assert response.data == {
+            'title': recipe.title,
+            'tags': RecipeDetailSerializer(recipe).data['tags'],
+        }
+
+
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+@pytest.mark.django_db
+class TestBulkRecipeCreate():
+    """Test creating recipes through the bulk endpoint"""
+
+    def test_bulk_create(self, logged_client, registred_user):
+        """Test recipes and their links are created"""
+        tag = sample_tag(user=registred_user)
+        ingredient = sample_ingredient(user=registred_user)
+        payload = [
+            {'title': f'Recipe {i}', 'time_minutes': i, 'price': '1.00',
+             'tags': [tag.id], 'ingredients': [ingredient.id, ingredient.id]}
+            for i in range(20)
+        ]
+
+        response = logged_client.post(BULK_URL, payload, format='json')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert len(response.data) == 20
+        assert response.data[0]['tags'] == [tag.id]
+        assert response.data[0]['ingredients'] == [ingredient.id]
+        assert Recipe.objects.filter(user=registred_user).count() == 20
+        assert tag.recipe_set.count() == 20
+        assert ingredient.recipe_set.count() == 20
+
+    def test_bulk_create_visible_to_filters(
+        self,
+        logged_client,
+        registred_user
+    ):
+        """Test bulk created recipes are indexed for filtering and search"""
+        tag = sample_tag(user=registred_user)
+        logged_client.get(RECIPES_URL, {'tags': str(tag.id)})
+        payload = [{'title': 'Bulk curry', 'time_minutes': 5,
+                    'price': '2.00', 'tags': [tag.id]}]
+
+        logged_client.post(BULK_URL, payload, format='json')
+
+        by_tag = logged_client.get(RECIPES_URL, {'tags': str(tag.id)})
+        by_search = logged_client.get(RECIPES_URL, {'search': 'curry'})
+        assert len(by_tag.data['results']) == 1
+        assert len(by_search.data['results']) == 1
+
+    def test_bulk_create_validates_ids_at_once(
+        self,
+        logged_client,
+        registred_user
+    ):
+        """Test invalid items are reported per item and nothing is saved"""
+        user2 = get_user_model().objects.create_user('o@test.com', 'pass')
+        own_tag = sample_tag(user=registred_user)
+        other_tag = sample_tag(user=user2)
+        ingredient = sample_ingredient(user=registred_user)
+        payload = [
+            {'title': 'Fine', 'time_minutes': 5, 'price': '2.00',
+             'tags': [own_tag.id], 'ingredients': [ingredient.id]},
+            {'title': 'Foreign tag', 'time_minutes': 5, 'price': '2.00',
+             'tags': [own_tag.id, other_tag.id]},
+            {'title': '', 'time_minutes': 5, 'price': '2.00'},
+        ]
+
+        with CaptureQueriesContext(connection) as context:
+            response = logged_client.post(BULK_URL, payload, format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data[0] == {}
+        assert list(response.data[1]) == ['tags']
+        assert list(response.data[2]) == ['title']
+        # One query for tags and one for ingredients
+        assert len(context) == 2
+        assert not Recipe.objects.exists()
+
+    def test_bulk_create_requires_list(self, logged_client):
+        """Test a non list payload is rejected"""
+        response = logged_client.post(
+            BULK_URL,
+            {'title': 'Single'},
+            format='json'
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestRecipeRowSerialization():
+    """Test serializing values() rows matches serializing instances"""
+
+    def _recipes(self, user):
+        tags = [sample_tag(user=user, name=f'Tag {i}') for i in range(3)]
+        ingredient = sample_ingredient(user=user)
+        for i, price in enumerate(['5', '0.99', '999.99', '12.5']):
+            recipe = sample_recipe(
+                user=user,
+                title=f'Recipe {i}',
+                price=price,
+                link='http://a.com' if i % 2 else '',
+                image=f'uploads/recipe/{i}.jpg' if i % 2 else None
+            )
+            recipe.tags.add(*tags[:i])
+            recipe.ingredients.add(ingredient)
+
+    def test_list_output_identical(self, registred_user):
+        """Test rows render byte for byte like model instances"""
+        self._recipes(registred_user)
+        columns = RecipeSerializer().row_columns()
+
+        rows = Recipe.objects.order_by('id').values(*columns)
+        instances = Recipe.objects.order_by('id')
+
+        renderer = JSONRenderer()
+        assert renderer.render(
+            RecipeSerializer(rows, many=True).data
+        ) == renderer.render(RecipeSerializer(instances, many=True).data)
+
+    def test_detail_output_identical(self, registred_user):
+        """Test nested detail output of a row matches an instance"""
+        self._recipes(registred_user)
+        recipe = Recipe.objects.order_by('id').last()
+        row = Recipe.objects.values(
+            'id', 'title', 'time_minutes', 'price', 'link', 'image'
+        ).get(id=recipe.id)
+
+        renderer = JSONRenderer()
+        assert renderer.render(
+            RecipeDetailSerializer(row).data
+        ) == renderer.render(RecipeDetailSerializer(recipe).data)
+
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+@pytest.mark.django_db
+class TestRecipeExport():
+    """Test streaming export of all recipes"""
+
+    def _recipes(self, user, count):
+        tag = sample_tag(user=user)
+        for i in range(count):
+            sample_recipe(user=user, title=f'Recipe {i}').tags.add(tag)
+
+    def test_export_json(self, logged_client, registred_user):
+        """Test exporting recipes as a streamed JSON array"""
+        self._recipes(registred_user, 3)
+
+        response = logged_client.get(EXPORT_URL)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.streaming
+        assert response['Content-Type'] == 'application/json'
+        data = json.loads(b''.join(response.streaming_content))
+        expected = RecipeDetailSerializer(
+            Recipe.objects.order_by('id'),
+            many=True
+        ).data
+        assert data == json.loads(JSONRenderer().render(expected))
+
+    def test_export_ndjson(self, logged_client, registred_user):
+        """Test exporting recipes as newline delimited JSON in chunks"""
+        self._recipes(registred_user, 5)
+        with patch.object(RecipeViewSet, 'export_chunk_size', 2):
+            response = logged_client.get(
+                EXPORT_URL,
+                HTTP_ACCEPT='application/x-ndjson'
+            )
+            lines = b''.join(response.streaming_content).splitlines()
+
+        assert response['Content-Type'] == 'application/x-ndjson'
+        items = [json.loads(line) for line in lines]
+        assert [item['title'] for item in items] == [
+            f'Recipe {i}' for i in range(5)
+        ]
+        assert all(item['tags'][0]['name'] for item in items)
+
+    def test_export_limited_to_user(self, logged_client, registred_user):
+        """Test only recipes of the user are exported"""
+        user2 = get_user_model().objects.create_user('o@test.com', 'pass')
+        sample_recipe(user=user2)
+
+        response = logged_client.get(EXPORT_URL)
+
+        assert json.loads(b''.join(response.streaming_content)) == []
+
+
+@pytest.mark.django_db
+class TestChunkedImageUpload():
+    """Test resumable image uploads sent in chunks"""
+
+    def _image(self, size=(600, 400), image_format='PNG'):
+        buffer = BytesIO()
+        Image.effect_noise(size, 64).convert('RGB').save(
+            buffer, format=image_format
+        )
+        return buffer.getvalue()
+
+    def _start(self, client, recipe, size):
+        response = client.post(
+            upload_start_url(recipe.id), {'size': size}, format='json'
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        return response.data['id'], response['Location']
+
+    def _send(self, client, url, chunk, offset):
+        return client.patch(
+            url,
+            chunk,
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def test_chunked_upload(self, logged_client, registred_user, settings):
+        """Test an image sent in chunks becomes the recipe image"""
+        settings.RECIPE_IMAGE_WORKERS = 0
+        recipe = sample_recipe(user=registred_user)
+        data = self._image()
+        upload_id, url = self._start(logged_client, recipe, len(data))
+
+        offset = 0
+        for start in range(0, len(data), 100000):
+            response = self._send(
+                logged_client, url, data[start:start + 100000], offset
+            )
+            assert response.status_code == status.HTTP_200_OK
+            offset = response.data['offset']
+        assert offset == len(data)
+        assert response['Upload-Offset'] == str(len(data))
+
+        response = logged_client.post(f'{url}finalize/')
+
+        assert response.status_code == status.HTTP_200_OK
+        recipe.refresh_from_db()
+        assert recipe.image.name.endswith('.png')
+        with open(recipe.image.path, 'rb') as image_file:
+            assert image_file.read() == data
+        assert response.data['images']['jpeg']['128']
+        assert not os.path.exists(
+            os.path.join(
+                settings.MEDIA_ROOT, 'uploads', 'partial', f'{upload_id}.part'
+            )
+        )
+
+    def test_resume_after_conflict(self, logged_client, registred_user):
+        """Test a chunk at the wrong offset is refused with 409"""
+        recipe = sample_recipe(user=registred_user)
+        data = self._image()
+        _upload_id, url = self._start(logged_client, recipe, len(data))
+        self._send(logged_client, url, data[:1000], 0)
+
+        response = self._send(logged_client, url, data[:1000], 0)
+        assert response.status_code == status.HTTP_409_CONFLICT
+
+        response = logged_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['offset'] == 1000
+        assert 'ETag' not in response
+
+        response = self._send(logged_client, url, data[1000:], 1000)
+        assert response.data['offset'] == len(data)
+
+    def test_finalize_incomplete(self, logged_client, registred_user):
+        """Test an upload can not be finalized before all bytes arrived"""
+        recipe = sample_recipe(user=registred_user)
+        data = self._image()
+        _upload_id, url = self._start(logged_client, recipe, len(data))
+        self._send(logged_client, url, data[:1000], 0)
+
+        response = logged_client.post(f'{url}finalize/')
+
+        assert response.status_code == status.HTTP_409_CONFLICT
+        recipe.refresh_from_db()
+        assert not recipe.image
+
+    def test_reject_non_image_early(self, logged_client, registred_user):
+        """Test the first chunk of a non image aborts the upload"""
+        recipe = sample_recipe(user=registred_user)
+        _upload_id, url = self._start(logged_client, recipe, 10 ** 6)
+
+        response = self._send(logged_client, url, b'%PDF-1.4' * 100, 0)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert logged_client.get(url).status_code == \
+            status.HTTP_404_NOT_FOUND
+
+    def test_size_limits(self, logged_client, registred_user, settings):
+        """Test declared sizes are capped and enforced"""
+        recipe = sample_recipe(user=registred_user)
+        response = logged_client.post(
+            upload_start_url(recipe.id),
+            {'size': uploads.MAX_SIZE + 1},
+            format='json'
+        )
+        assert response.status_code == \
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+        data = self._image()
+        _upload_id, url = self._start(logged_client, recipe, 100)
+        response = self._send(logged_client, url, data[:101], 0)
+        assert response.status_code == \
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        assert logged_client.get(url).data['offset'] == 0
+
+    def test_upload_of_other_user(self, logged_client, registred_user):
+        """Test uploads of other users can not be continued"""
+        recipe = sample_recipe(user=registred_user)
+        _upload_id, url = self._start(logged_client, recipe, 1000)
+        other = get_user_model().objects.create_user('o@test.com', 'pass')
+        client = APIClient()
+        client.force_authenticate(other)
+
+        response = self._send(client, url, b'x', 0)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,232 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+from types import SimpleNamespace
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import router
+from django.http import HttpResponse
+from django.test import RequestFactory
+from rest_framework.authtoken.models import Token
+
+from core.middleware import PIN_COOKIE, ReplicaMiddleware
+from core.models import Recipe
+from core.routers import QueryTimer, ReplicaSelector, use_replica
+
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+
+class TestReplicaSelector:
+
+    def test_round_robin(self):
+        """Test replicas take turns"""
+        selector = ReplicaSelector(['one', 'two'])
+
+        assert [selector.choose() for _ in range(4)] == \
+            ['one', 'two', 'one', 'two']
+
+    def test_least_latency(self):
+        """Test the replica with the lowest query latency is chosen"""
+        selector = ReplicaSelector(['one', 'two'], 'least-latency')
+        selector.record('one', 0.2)
+        selector.record('two', 0.05)
+        assert selector.choose() == 'two'
+
+        for _ in range(10):
+            selector.record('two', 0.5)
+
+        assert selector.choose() == 'one'
+        assert selector.get_stats()['one']['latency_ms'] == \
+            pytest.approx(200)
+
+    def test_stale_latency_forgotten(self):
+        """Test a replica measured long ago is tried again"""
+        selector = ReplicaSelector(
+            ['one', 'two'], 'least-latency', latency_ttl=0
+        )
+        selector.record('one', 0.5)
+
+        assert selector.choose() == 'one'
+
+    def test_unknown_strategy(self):
+        with pytest.raises(ValueError):
+            ReplicaSelector(['one'], 'random')
+
+    def test_query_timer(self):
+        """Test query durations are recorded for the connection alias"""
+        selector = ReplicaSelector(['one'], 'least-latency')
+        timer = QueryTimer(selector)
+        context = {'connection': SimpleNamespace(alias='one')}
+
+        result = timer(
+            lambda *args: 'rows', 'SELECT 1', None, False, context
+        )
+
+        assert result == 'rows'
+        assert 'one' in selector.latencies
+
+
+class TestReplicaRouter:
+
+    def test_reads_outside_requests(self):
+        """Test reads go to the primary unless a replica is in use"""
+        assert Recipe.objects.all().db == 'default'
+
+    def test_reads_from_replica(self):
+        """Test reads go to the replica in use, writes to the primary"""
+        with use_replica('replica1'):
+            assert Recipe.objects.all().db == 'replica1'
+            assert router.db_for_write(Recipe) == 'default'
+            assert Token.objects.all().db == 'default'
+
+    def test_no_migrations_on_replicas(self, settings):
+        settings.DATABASE_REPLICAS = ['replica1']
+
+        assert router.allow_migrate('replica1', 'core') is False
+        assert router.allow_migrate('default', 'core') is True
+
+
+class TestReplicaMiddleware:
+
+    @pytest.fixture(autouse=True)
+    def replicas(self, settings):
+        settings.DATABASE_REPLICAS = ['replica1', 'replica2']
+        settings.REPLICA_SELECTION = 'round-robin'
+        settings.REPLICA_PIN_CACHE_ALIAS = 'default'
+        settings.SERVE_WORKERS = 1
+        self.factory = RequestFactory()
+        self.middleware = ReplicaMiddleware(self.get_response)
+
+    def get_response(self, request):
+        return HttpResponse(Recipe.objects.all().db)
+
+    def request(self, method='get', **extra):
+        request = getattr(self.factory, method)('/api/recipe/recipes/')
+        request.META.update(extra)
+        return self.middleware(request)
+
+    def test_safe_requests_on_replicas(self):
+        """Test safe requests read from the replicas in turn"""
+        assert self.request().content == b'replica1'
+        assert self.request('head').content == b'replica2'
+        assert self.request().content == b'replica1'
+
+    def test_writes_pin_to_primary(self):
+        """Test reads after a write go to the primary for a while"""
+        token = {'HTTP_AUTHORIZATION': 'Token abc'}
+
+        response = self.request('post', **token)
+        pinned = self.request(**token)
+        other = self.request(HTTP_AUTHORIZATION='Token def')
+
+        assert response.content == b'default'
+        assert response.cookies[PIN_COOKIE]['max-age'] == 5
+        assert pinned.content == b'default'
+        assert other.content == b'replica1'
+
+    def test_pin_cookie(self):
+        """Test clients sending the pin cookie read from the primary"""
+        response = self.request(HTTP_COOKIE=f'{PIN_COOKIE}=1')
+
+        assert response.content == b'default'
+
+    def test_not_used_without_replicas(self, settings):
+        settings.DATABASE_REPLICAS = []
+
+        with pytest.raises(MiddlewareNotUsed):
+            ReplicaMiddleware(self.get_response)
+
+    def test_unknown_selection(self, settings):
+        settings.REPLICA_SELECTION = 'random'
+
+        with pytest.raises(ImproperlyConfigured):
+            ReplicaMiddleware(self.get_response)
+
+    def test_process_local_pin_cache(self, settings):
+        """Test pins must be visible to every serve worker"""
+        settings.SERVE_WORKERS = 2
+
+        with pytest.raises(ImproperlyConfigured):
+            ReplicaMiddleware(self.get_response)
+
+        settings.SERVE_WORKERS = 1
+        ReplicaMiddleware(self.get_response)
+
+
+REPLICATION_SCRIPT = '''
+import json
+import shutil
+
+import django
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from core.models import Tag
+
+
+call_command('migrate', verbosity=0)
+call_command('createcachetable')
+user = get_user_model().objects.create_user(
+    'test@test.com', 'pass123', name='Test'
+)
+Tag.objects.create(user=user, name='Replicated')
+# The replica lags behind the rows created after this copy
+shutil.copy(settings.DATABASES['default']['NAME'],
+            settings.DATABASES['replica']['NAME'])
+Tag.objects.create(user=user, name='Lagging')
+token = Token.objects.create(user=user)
+
+client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+names = {}
+names['read'] = [tag['name'] for tag in client.get('/api/recipe/tags/').json()]
+client.post('/api/recipe/tags/', {'name': 'Written'})
+client.cookies.clear()
+names['pinned'] = [
+    tag['name'] for tag in client.get('/api/recipe/tags/').json()
+]
+print(json.dumps(names))
+'''
+
+
+def test_two_sqlite_databases(tmp_path):
+    """Test reads, writes and pinning against a lagging SQLite replica"""
+    (tmp_path / 'replica_settings.py').write_text(textwrap.dedent(f'''
+        from app.settings import *  # noqa
+
+        DATABASES = {{
+            'default': {{
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': {str(tmp_path / 'primary.sqlite3')!r},
+            }},
+            'replica': {{
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': {str(tmp_path / 'replica.sqlite3')!r},
+            }},
+        }}
+        DATABASE_REPLICAS = ['replica']
+        REPLICA_SELECTION = 'least-latency'
+        ALLOWED_HOSTS = ['testserver']
+    '''))
+    environment = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE='replica_settings',
+        PYTHONPATH=os.pathsep.join([str(tmp_path), APP_DIR]),
+    )
+
+    output = subprocess.run(
+        [sys.executable, '-c', REPLICATION_SCRIPT], env=environment,
+        cwd=APP_DIR, stdout=subprocess.PIPE, check=True
+    ).stdout
+
+    names = json.loads(output.decode().splitlines()[-1])
+    assert names['read'] == ['Replicated']
+    assert sorted(names['pinned']) == ['Lagging', 'Replicated', 'Written']
@@ -0,0 +1,154 @@
+import http.client
+import os
+import signal
+import time
+import urllib.request
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from core.server import Server
+
+
+def pid_app(environ, start_response):
+    if environ['PATH_INFO'] == '/file':
+        start_response('200 OK', [
+            ('Content-Type', 'text/plain'),
+            ('Content-Length', str(os.path.getsize(__file__))),
+        ])
+        return environ['wsgi.file_wrapper'](open(__file__, 'rb'))
+
+    body = str(os.getpid()).encode()
+    start_response('200 OK', [
+        ('Content-Type', 'text/plain'),
+        ('Content-Length', str(len(body))),
+    ])
+    return [body]
+
+
+@pytest.fixture
+def server():
+    """Run a master with one worker in a child process"""
+    server = Server(
+        ('127.0.0.1', 0), workers=1, threads=2, max_requests=3,
+        application=pid_app
+    )
+    host, port = server.bind()
+    with patch('core.server.warm_up_connections'):
+        pid = os.fork()
+        if not pid:
+            try:
+                server.run()
+            finally:
+                os._exit(0)
+    server.listener.close()
+
+    def get():
+        with urllib.request.urlopen(f'http://{host}:{port}/') as response:
+            return int(response.read())
+
+    get.address = (host, port)
+    yield pid, get
+    try:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+    except (ProcessLookupError, ChildProcessError):
+        pass
+
+
+def wait_for_new_worker(get, old, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        worker = get()
+        if worker != old:
+            return worker
+        time.sleep(0.1)
+    raise AssertionError('worker was not replaced')
+
+
+class TestServer:
+
+    def test_serve_from_worker(self, server):
+        """Test requests are answered by a forked worker"""
+        master, get = server
+
+        worker = get()
+
+        assert worker not in (master, os.getpid())
+
+    def test_recycle_after_max_requests(self, server):
+        """Test workers are replaced after max_requests requests"""
+        _master, get = server
+        first = get()
+        assert get() == first
+        assert get() == first
+
+        assert wait_for_new_worker(get, first) != first
+
+    def test_reload_on_sighup(self, server):
+        """Test SIGHUP replaces the workers"""
+        master, get = server
+        first = get()
+
+        os.kill(master, signal.SIGHUP)
+
+        assert wait_for_new_worker(get, first) != first
+
+    @pytest.mark.parametrize('path', ['/', '/file'])
+    def test_head_without_body(self, server, path):
+        """Test HEAD responses end with the headers on kept alive sockets"""
+        _master, get = server
+        connection = http.client.HTTPConnection(*get.address, timeout=5)
+
+        connection.request('HEAD', path)
+        head = connection.getresponse()
+        head.read()
+        connection.request('GET', path)
+        response = connection.getresponse()
+        body = response.read()
+        connection.close()
+
+        assert head.status == response.status == 200
+        assert head.getheader('Content-Length') == str(len(body))
+        if path == '/file':
+            with open(__file__, 'rb') as source:
+                assert body == source.read()
+
+    def test_graceful_stop(self, server):
+        """Test SIGTERM stops the workers and the master"""
+        master, get = server
+        get()
+
+        os.kill(master, signal.SIGTERM)
+        _pid, status = os.waitpid(master, 0)
+
+        assert os.WIFEXITED(status)
+        assert os.WEXITSTATUS(status) == 0
+
+
+class TestServeCommand:
+
+    @patch('core.management.commands.serve.Server')
+    def test_serve_options(self, server):
+        """Test command line options override the settings"""
+        call_command(
+            'serve', bind='127.0.0.1:9000', workers=3, max_requests=10
+        )
+
+        args, kwargs = server.call_args
+        assert args == (('127.0.0.1', 9000),)
+        assert kwargs['workers'] == 3
+        assert kwargs['threads'] == 4
+        assert kwargs['max_requests'] == 10
+        assert server.return_value.run.called
+
+    @pytest.mark.parametrize('options', [
+        {'bind': 'localhost'},
+        {'workers': 0},
+    ])
+    def test_serve_invalid(self, options):
+        """Test invalid addresses and worker counts are rejected"""
+        with pytest.raises(CommandError):
+            call_command('serve', **options)
@@ -0,0 +1,137 @@
+import gzip
+import os
+
+import pytest
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+from core.middleware import StaticFilesMiddleware, accepted_encodings
+from core.storage import brotli
+
+
+BASE_CSS = 'admin/css/base.css'
+
+
+@pytest.fixture(scope='module')
+def collected(tmp_path_factory):
+    root = tmp_path_factory.mktemp('static')
+    with override_settings(
+        STATIC_ROOT=str(root),
+        STATICFILES_STORAGE='core.storage.CompressedManifestStaticFilesStorage'
+    ):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        yield root
+
+
+@pytest.fixture
+def middleware(collected):
+    return StaticFilesMiddleware(lambda request: HttpResponse('app'))
+
+
+class TestCompressedStorage:
+
+    def test_hashed_and_compressed(self, collected):
+        """Test collectstatic writes hashed names with compressed copies"""
+        hashed = staticfiles_storage.stored_name(BASE_CSS)
+        assert hashed != BASE_CSS
+
+        for name in (BASE_CSS, hashed):
+            path = collected / name
+            with gzip.open(f'{path}.gz') as compressed:
+                assert compressed.read() == path.read_bytes()
+            assert os.path.exists(f'{path}.br') == (brotli is not None)
+
+    def test_skip_compressed_formats(self, collected):
+        """Test images are not compressed again"""
+        assert list(collected.glob('**/*.png'))
+        assert not list(collected.glob('**/*.png.gz'))
+
+
+class TestStaticFilesMiddleware:
+
+    def setup_method(self):
+        self.factory = RequestFactory()
+
+    def test_serve_hashed(self, middleware):
+        """Test content hashed names are cached for good"""
+        url = staticfiles_storage.url(BASE_CSS)
+
+        response = middleware(self.factory.get(url))
+
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'text/css'
+        assert 'immutable' in response['Cache-Control']
+        assert 'Content-Encoding' not in response
+        assert 'Accept-Encoding' in response['Vary']
+
+    def test_serve_unhashed(self, middleware):
+        """Test original names are revalidated after a short while"""
+        response = middleware(self.factory.get('/static/' + BASE_CSS))
+
+        assert response['Cache-Control'] == 'public, max-age=60'
+
+    def test_serve_gzip(self, middleware, collected):
+        """Test clients accepting gzip get the compressed copy"""
+        response = middleware(self.factory.get(
+            '/static/' + BASE_CSS, HTTP_ACCEPT_ENCODING='gzip, deflate'
+        ))
+
+        assert response['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(b''.join(response.streaming_content)) == \
+            (collected / BASE_CSS).read_bytes()
+
+    @pytest.mark.skipif(brotli is None, reason='brotli is not installed')
+    def test_serve_brotli(self, middleware):
+        """Test brotli is preferred when accepted"""
+        response = middleware(self.factory.get(
+            '/static/' + BASE_CSS, HTTP_ACCEPT_ENCODING='gzip, br'
+        ))
+
+        assert response['Content-Encoding'] == 'br'
+
+    def test_not_modified(self, middleware):
+        """Test the ETag of the served variant is honoured"""
+        request = self.factory.get(
+            '/static/' + BASE_CSS, HTTP_ACCEPT_ENCODING='gzip'
+        )
+        etag = middleware(request)['ETag']
+
+        response = middleware(self.factory.get(
+            '/static/' + BASE_CSS, HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_IF_NONE_MATCH=etag
+        ))
+        identity = middleware(self.factory.get(
+            '/static/' + BASE_CSS, HTTP_IF_NONE_MATCH=etag
+        ))
+
+        assert response.status_code == 304
+        assert identity.status_code == 200
+
+    def test_pass_through(self, middleware):
+        """Test other paths and methods reach the application"""
+        for request in (
+            self.factory.get('/static/missing.css'),
+            self.factory.get('/api/recipe/'),
+            self.factory.post('/static/' + BASE_CSS),
+        ):
+            assert middleware(request).content == b'app'
+
+    def test_not_used_without_files(self, settings, tmp_path):
+        """Test the middleware is left out when nothing was collected"""
+        settings.STATIC_ROOT = str(tmp_path)
+
+        with pytest.raises(MiddlewareNotUsed):
+            StaticFilesMiddleware(lambda request: HttpResponse())
+
+
+@pytest.mark.parametrize('header,expected', [
+    ('gzip, deflate, br', {'gzip', 'deflate', 'br'}),
+    ('br;q=0, gzip;q=0.5', {'gzip'}),
+    ('', set()),
+])
+def test_accepted_encodings(header, expected):
+    """Test Accept-Encoding parsing drops refused codings"""
+    assert accepted_encodings(header) == expected
@@ -12,6 +12,8 @@ from recipe.serializers import TagSerializer
 
 
 TAGS_URL = reverse('recipe:tag-list')
+TAGS_BULK_URL = reverse('recipe:tag-bulk')
+TAGS_STATS_URL = reverse('recipe:tag-stats')
 
 
 class TestPublicTagsApi():
@@ -128,3 +130,138 @@ class TestPrivateTagsApi():
         response = logged_client.get(TAGS_URL, {'assigned_only': 1})
 
         assert len(response.data) == 1
+
+    def test_create_tag_existing_name(self, logged_client, registred_user):
+        """Test creating a tag with an existing name reuses it"""
+        tag = Tag.objects.create(user=registred_user, name='Vegan')
+
+        response = logged_client.post(TAGS_URL, {'name': 'Vegan'})
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['id'] == tag.id
+        assert Tag.objects.filter(user=registred_user).count() == 1
+
+    def test_bulk_get_or_create_tags(self, logged_client, registred_user):
+        """Test creating missing tags and returning existing ones"""
+        existing = Tag.objects.create(user=registred_user, name='Vegan')
+        payload = {'names': ['Quick', 'Vegan', 'Quick', 'Dessert']}
+
+        response = logged_client.post(TAGS_BULK_URL, payload, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [tag['name'] for tag in response.data] == [
+            'Quick', 'Vegan', 'Dessert'
+        ]
+        assert response.data[1]['id'] == existing.id
+        assert Tag.objects.filter(user=registred_user).count() == 3
+
+    def test_bulk_tags_invalid(self, logged_client):
+        """Test bulk creating tags requires a list of names"""
+        response = logged_client.post(
+            TAGS_BULK_URL,
+            {'names': []},
+            format='json'
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_tag_stats(
+        self,
+        logged_client,
+        registred_user,
+        django_assert_num_queries
+    ):
+        """Test recipe statistics per tag come from one query"""
+        vegan = Tag.objects.create(user=registred_user, name='Vegan')
+        Tag.objects.create(user=registred_user, name='Unused')
+        for title, minutes, price in (('Salad', 10, 4), ('Curry', 40, 9)):
+            recipe = Recipe.objects.create(
+                user=registred_user,
+                title=title,
+                time_minutes=minutes,
+                price=price
+            )
+            recipe.tags.add(vegan)
+        other = get_user_model().objects.create_user('o@test.com', 'pass')
+        Tag.objects.create(user=other, name='Other')
+
+        # The data version read for the ETag plus the grouped query
+        with django_assert_num_queries(2):
+            response = logged_client.get(TAGS_STATS_URL)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == [
+            {
+                'id': vegan.id, 'name': 'Vegan', 'recipe_count': 2,
+                'avg_price': '6.50', 'min_price': '4.00',
+                'max_price': '9.00', 'avg_time_minutes': 25.0,
+                'min_time_minutes': 10, 'max_time_minutes': 40,
+            },
+            {
+                'id': response.data[1]['id'], 'name': 'Unused',
+                'recipe_count': 0, 'avg_price': None, 'min_price': None,
+                'max_price': None, 'avg_time_minutes': None,
+                'min_time_minutes': None, 'max_time_minutes': None,
+            },
+        ]
+
+
+@pytest.mark.django_db
+class TestTagUsageCounts():
+
+    @pytest.fixture(autouse=True)
+    def usage_counts(self, settings):
+        settings.RECIPE_USAGE_COUNTS = True
+
+    def _counts(self, user):
+        return dict(
+            Tag.objects.filter(user=user).values_list('name', 'usage_count')
+        )
+
+    def test_usage_count_follows_links(self, registred_user):
+        """Test usage_count is kept up to date on link changes"""
+        vegan = Tag.objects.create(user=registred_user, name='Vegan')
+        quick = Tag.objects.create(user=registred_user, name='Quick')
+        recipe1, recipe2 = [
+            Recipe.objects.create(
+                user=registred_user, title=title, time_minutes=5, price=1
+            )
+            for title in ('Salad', 'Soup')
+        ]
+
+        recipe1.tags.add(vegan, quick)
+        recipe2.tags.add(vegan)
+        assert self._counts(registred_user) == {'Vegan': 2, 'Quick': 1}
+
+        recipe1.tags.remove(quick)
+        vegan.recipe_set.remove(recipe2)
+        assert self._counts(registred_user) == {'Vegan': 1, 'Quick': 0}
+
+        quick.recipe_set.add(recipe1, recipe2)
+        recipe1.tags.clear()
+        assert self._counts(registred_user) == {'Vegan': 0, 'Quick': 1}
+
+        recipe2.delete()
+        assert self._counts(registred_user) == {'Vegan': 0, 'Quick': 0}
+
+    def test_retrive_tags_assigned_by_count(
+        self,
+        registred_user,
+        logged_client,
+        django_assert_num_queries
+    ):
+        """Test assigned_only filters on usage_count"""
+        tag = Tag.objects.create(user=registred_user, name='Breakfast')
+        Tag.objects.create(user=registred_user, name='Lunch')
+        recipe = Recipe.objects.create(
+            user=registred_user, title='Eggs', time_minutes=5, price=1
+        )
+        recipe.tags.add(tag)
+
+        with django_assert_num_queries(2) as captured:
+            response = logged_client.get(TAGS_URL, {'assigned_only': 1})
+
+        assert response.data == [TagSerializer(tag).data]
+        sql = captured.captured_queries[-1]['sql']
+        assert 'usage_count' in sql
+        assert 'DISTINCT' not in sql
@@ -1,12 +1,28 @@
+import os
+import threading
+import time
+from unittest.mock import patch
+
 import pytest
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from core.models import Recipe
+from user import hashing
+
 USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
 ME_URL = reverse('user:me')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def exit_in_worker(parent):
+    """Kill the pool worker running this, return in the parent"""
+    if os.getpid() != parent:
+        os._exit(1)
+    return parent
 
 
 @pytest.mark.django_db
@@ -93,6 +109,45 @@ class TestPublicUser:
         assert 'token' not in response.data
         assert response.status_code == status.HTTP_400_BAD_REQUEST
 
+    def test_create_token_stage_timings(self, new_user, registred_user):
+        """Test login reports lookup, queue and hash durations"""
+        response = self.client.post(TOKEN_URL, new_user)
+
+        assert response.status_code == status.HTTP_200_OK
+        stages = [
+            stage.split(';')[0]
+            for stage in response['Server-Timing'].split(', ')
+        ]
+        assert stages == ['lookup', 'queue', 'hash']
+        assert hashing.pool.get_stats()['hash']['count'] >= 1
+
+    def test_create_token_pool_saturated(self, new_user, registred_user):
+        """Test login fails fast when no hashing slot is free"""
+        with patch.object(hashing.pool, '_slots', threading.Semaphore(0)):
+            response = self.client.post(TOKEN_URL, new_user)
+
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response['Retry-After'] == str(hashing.HASH_RETRY_AFTER)
+        assert 'token' not in response.data
+
+    def test_create_user_pool_saturated(self, new_user):
+        """Test sign-up fails fast when no hashing slot is free"""
+        payload = dict(new_user, name='Test')
+        with patch.object(hashing.pool, '_slots', threading.Semaphore(0)):
+            response = self.client.post(USER_URL, payload)
+
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert not get_user_model().objects.exists()
+
+    def test_create_token_inactive_user(self, new_user, registred_user):
+        """Test inactive users get no token"""
+        registred_user.is_active = False
+        registred_user.save()
+
+        response = self.client.post(TOKEN_URL, new_user)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
     def test_retrive_user_unauthorized(self):
         """Test that authentication is required for users"""
         response = self.client.get(ME_URL)
@@ -131,3 +186,53 @@ class TestPrivateUserApi():
         assert user.name == payload['name']
         assert user.check_password(payload['password'])
         assert response.status_code == status.HTTP_200_OK
+
+    def test_update_profile_keeps_data_version(
+        self,
+        registred_user,
+        logged_client
+    ):
+        """Test a profile update does not undo recipe data changes"""
+        Recipe.objects.create(
+            user=registred_user, title='Curry', time_minutes=5, price=1
+        )
+        etag = logged_client.get(RECIPES_URL)['ETag']
+        Recipe.objects.create(
+            user=registred_user, title='Soup', time_minutes=5, price=1
+        )
+
+        logged_client.patch(ME_URL, {'name': 'new name'})
+        response = logged_client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        registred_user.refresh_from_db()
+        assert registred_user.data_version == 2
+        assert response.status_code == status.HTTP_200_OK
+
+
+class TestHashingPool:
+    """Test the bounded password hashing pool"""
+
+    def test_slot_held_until_timed_out_work_finishes(self):
+        """Test a timeout does not free the slot of still running work"""
+        pool = hashing.HashingPool(workers=1, queue_size=0, timeout=0.1)
+
+        with pytest.raises(hashing.HashingUnavailable):
+            pool.run(time.sleep, 1)
+        with pytest.raises(hashing.HashingUnavailable):
+            pool.run(time.sleep, 0)
+
+        time.sleep(1.5)
+        assert pool.run(time.sleep, 0) is None
+        assert pool.get_stats()['rejected']['count'] == 1
+        pool._get_executor().shutdown()
+
+    def test_broken_pool_replaced(self):
+        """Test a pool with a dead worker is replaced, its work redone"""
+        pool = hashing.HashingPool(workers=1, queue_size=0, timeout=5)
+        broken = pool._get_executor()
+
+        assert pool.run(exit_in_worker, os.getpid()) == os.getpid()
+        assert pool.run(pow, 2, 10) == 1024
+        assert pool._get_executor() is not broken
+        assert pool.get_stats()['broken']['count'] == 1
+        pool._get_executor().shutdown()
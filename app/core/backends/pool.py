@@ -0,0 +1,199 @@
+"""Process wide pools of open database connections
+
+Each thread's DatabaseWrapper checks a connection out when Django opens
+one and returns it when Django closes it, at the end of every request
+with CONN_MAX_AGE = 0. The handshake is paid once per pooled connection
+instead of once per request.
+"""
+import collections
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Thread safe pool of at most max_size connections
+
+    Connections idle for longer than idle_timeout are closed, as long as
+    min_size remain. With ping set, it is called on every connection
+    taken from the pool and connections failing it are replaced.
+    """
+
+    def __init__(self, min_size=0, max_size=10, idle_timeout=300,
+                 timeout=10, ping=None, close=None):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.ping = ping
+        self.close = close or (lambda connection: connection.close())
+        # Most recently returned last, expiry starts from the left
+        self._idle = collections.deque()
+        self._condition = threading.Condition()
+        self.in_use = 0
+        self.created = 0
+        self.closed = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.failed_pings = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @property
+    def size(self):
+        return self.in_use + len(self._idle)
+
+    def checkout(self, connect):
+        """Return an idle connection, or one new from connect()
+
+        Waits for a connection to be returned when max_size are in use,
+        raising PoolTimeout after timeout seconds.
+        """
+        started = time.monotonic()
+        with self._condition:
+            while not self._idle and self.size >= self.max_size:
+                remaining = started + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(
+                        f'No connection available in {self.timeout}s'
+                    )
+                self._condition.wait(remaining)
+
+            connection = self._idle.pop()[0] if self._idle else None
+            # The slot is taken before connecting outside of the lock
+            self.in_use += 1
+            self.checkouts += 1
+            waited = time.monotonic() - started
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            # Opened after this one, up to min_size
+            missing = max(self.min_size - self.size, 0)
+            self.in_use += missing
+
+        if connection is not None and self.ping is not None and \
+                not self.ping(connection):
+            with self._condition:
+                self.failed_pings += 1
+            self._close(connection)
+            connection = None
+        if connection is None:
+            try:
+                connection = self._connect(connect)
+            except BaseException:
+                self._release_slot()
+                raise
+
+        for filled in range(missing):
+            try:
+                self.checkin(self._connect(connect))
+            except Exception:
+                # Left to the next checkout
+                for _ in range(missing - filled):
+                    self._release_slot()
+                break
+        return connection
+
+    def checkin(self, connection, reusable=True):
+        """Return a connection, closing it unless reusable"""
+        now = time.monotonic()
+        expired = []
+        with self._condition:
+            self.in_use -= 1
+            if reusable:
+                self._idle.append((connection, now))
+            else:
+                expired.append(connection)
+            while self._idle and self.size > self.min_size and \
+                    now - self._idle[0][1] > self.idle_timeout:
+                expired.append(self._idle.popleft()[0])
+            self._condition.notify()
+        for connection in expired:
+            self._close(connection)
+
+    def clear(self):
+        """Close every idle connection"""
+        with self._condition:
+            idle = [connection for connection, _returned in self._idle]
+            self._idle.clear()
+            self._condition.notify_all()
+        for connection in idle:
+            self._close(connection)
+
+    def _connect(self, connect):
+        connection = connect()
+        with self._condition:
+            self.created += 1
+        return connection
+
+    def _close(self, connection):
+        with self._condition:
+            self.closed += 1
+        try:
+            self.close(connection)
+        except Exception:
+            pass
+
+    def _release_slot(self):
+        with self._condition:
+            self.in_use -= 1
+            self._condition.notify()
+
+    def get_stats(self):
+        """Return pool size, usage counters and checkout wait times"""
+        with self._condition:
+            return {
+                'size': self.size,
+                'in_use': self.in_use,
+                'idle': len(self._idle),
+                'created': self.created,
+                'closed': self.closed,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'failed_pings': self.failed_pings,
+                'mean_wait_ms': (
+                    self.wait_total / self.checkouts * 1000
+                    if self.checkouts else 0.0
+                ),
+                'max_wait_ms': self.wait_max * 1000,
+            }
+
+
+_lock = threading.Lock()
+_pools = {}
+_pools_pid = None
+# Pools copied by fork(), their connections belong to the parent
+_inherited = []
+
+
+def get_pool(key, **options):
+    """Return the pool of key, created with options on first use"""
+    global _pools_pid
+    with _lock:
+        if _pools_pid != os.getpid():
+            # Kept referenced, closing them would end the parent's sessions
+            _inherited.append(_pools.copy())
+            _pools.clear()
+            _pools_pid = os.getpid()
+        if key not in _pools:
+            _pools[key] = ConnectionPool(**options)
+        return _pools[key]
+
+
+def close_all():
+    """Close the idle connections of every pool of this process"""
+    with _lock:
+        pools = list(_pools.values()) if _pools_pid == os.getpid() else []
+    for pool in pools:
+        pool.clear()
+
+
+def get_stats():
+    """Return the stats of every pool by alias and database"""
+    with _lock:
+        pools = dict(_pools) if _pools_pid == os.getpid() else {}
+    return {key: pool.get_stats() for key, pool in pools.items()}
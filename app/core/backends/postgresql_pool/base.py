@@ -0,0 +1,96 @@
+"""PostgreSQL backend handing out connections from a process wide pool
+
+Configured with a POOL entry next to the usual DATABASES settings:
+
+    'POOL': {
+        'MIN_SIZE': 2,        # kept open once the pool is used
+        'MAX_SIZE': 10,       # checkouts beyond wait up to TIMEOUT seconds
+        'IDLE_TIMEOUT': 300,  # close surplus connections idle this long
+        'TIMEOUT': 10,
+        'PRE_PING': True,     # SELECT 1 before handing out a connection
+    }
+
+Leave CONN_MAX_AGE at 0, Django then returns the connection of a thread
+to the pool at the end of every request.
+"""
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.creation import DatabaseCreation
+from psycopg2 import extensions
+
+from core.backends import pool
+
+
+Database = base.Database
+
+
+def ping(connection):
+    """Return whether a connection still answers
+
+    Ends the transaction psycopg2 opened for the query, Django cannot
+    switch a connection left idle in transaction to autocommit.
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        connection.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+class PooledDatabaseCreation(DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections would keep the database in use
+        pool.close_all()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = PooledDatabaseCreation
+
+    def get_pool(self):
+        options = self.settings_dict.get('POOL', {})
+        # Keyed by database as well, tests rename it after connecting
+        return pool.get_pool(
+            (self.alias, self.settings_dict['NAME']),
+            min_size=options.get('MIN_SIZE', 0),
+            max_size=options.get('MAX_SIZE', 10),
+            idle_timeout=options.get('IDLE_TIMEOUT', 300),
+            timeout=options.get('TIMEOUT', 10),
+            ping=ping if options.get('PRE_PING', True) else None
+        )
+
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        try:
+            connection = self.get_pool().checkout(
+                lambda: connect(conn_params)
+            )
+        except pool.PoolTimeout as exc:
+            raise Database.OperationalError(str(exc)) from exc
+        # Set by the parent only for connections it opened
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            self.get_pool().checkin(
+                self.connection, reusable=self._reset_connection()
+            )
+
+    def _reset_connection(self):
+        """Roll back what the connection was left with, return if usable"""
+        if self.connection.closed:
+            return False
+        try:
+            status = self.connection.get_transaction_status()
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                self.connection.rollback()
+        except Database.Error:
+            return False
+        return True
@@ -0,0 +1,50 @@
+"""Database locks on arbitrary keys
+
+PostgreSQL advisory locks, held until the end of the transaction they
+are taken in. Other databases have no such locks, there taking one does
+nothing; SQLite serializes writing transactions anyway.
+"""
+import hashlib
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def lock_id(key):
+    """Return the signed 64 bit advisory lock number of a key"""
+    digest = hashlib.sha256(key.encode()).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+
+def advisory_lock(key, shared=False, using=DEFAULT_DB_ALIAS):
+    """Wait for and take a lock on key until the transaction ends
+
+    Shared locks only exclude exclusive ones. Outside of a transaction
+    the lock is released right away.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    function = 'pg_advisory_xact_lock_shared' if shared else \
+        'pg_advisory_xact_lock'
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {function}(%s)', [lock_id(key)])
+
+
+def advisory_locks(keys, using=DEFAULT_DB_ALIAS):
+    """Wait for and take exclusive locks on all keys in one query
+
+    Locks are taken in lock number order, so transactions locking
+    overlapping sets of keys this way cannot deadlock each other.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    ids = sorted({lock_id(key) for key in keys})
+    if not ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(id) FROM '
+            '(SELECT unnest(%s::bigint[]) AS id ORDER BY id) AS ids',
+            [ids]
+        )
@@ -0,0 +1,105 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import Recipe
+from recipe import bulk, usage
+
+
+class Command(BaseCommand):
+    """Django command to time the assigned_only filter strategies
+
+    join is the former join plus DISTINCT, exists the correlated
+    subquery and counter the usage_count column. Everything, the seeded
+    data and the recounted usage_count of the user's rows, is rolled
+    back afterwards.
+    """
+    help = 'Compare assigned_only query strategies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Email of the user to query')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Create this many tags, ingredients and recipes first'
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self._get_user(options)
+            if options['seed']:
+                self._seed(user, options['seed'])
+            for model in usage.RELATIONS:
+                usage.refresh(
+                    model,
+                    model.objects.filter(user=user).values_list(
+                        'id', flat=True
+                    )
+                )
+                self._compare(model, user, options['repeat'])
+            transaction.set_rollback(True)
+
+    def _get_user(self, options):
+        if options['seed']:
+            return get_user_model().objects.create_user(
+                'benchmark@assigned-only.invalid'
+            )
+        if not options['user']:
+            raise CommandError('Either --user or --seed is required')
+        try:
+            return get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Unknown user {options["user"]}')
+
+    def _seed(self, user, size):
+        """Create recipes linked to every other tag and ingredient"""
+        self.stdout.write(f'Seeding {size} rows per table...')
+        for model in usage.RELATIONS:
+            bulk.get_or_create_by_name(
+                model, user.pk, (f'{i:08d}' for i in range(size))
+            )
+        recipes = [
+            Recipe(user=user, title=f'Recipe {i}', time_minutes=i, price=1)
+            for i in range(size)
+        ]
+        related_ids = {}
+        for model, relation in usage.RELATIONS.items():
+            ids = list(
+                model.objects.filter(user=user).values_list('id', flat=True)
+            )
+            # Half of the rows are used, each by two recipes
+            related_ids[relation] = [[] for recipe in recipes]
+            for i, pk in enumerate(ids[::2]):
+                related_ids[relation][i].append(pk)
+                related_ids[relation][-1 - i].append(pk)
+        bulk.insert_recipes(recipes, related_ids)
+
+    def _compare(self, model, user, repeat):
+        queryset = model.objects.filter(user=user)
+        strategies = {
+            'join': queryset.filter(recipe__isnull=False).distinct(),
+            'exists': usage.assigned_exists(queryset),
+            'counter': usage.assigned_counted(queryset),
+        }
+        expected = None
+        for name, strategy in strategies.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                ids = list(
+                    strategy.order_by('-name').values_list('id', flat=True)
+                )
+                timings.append(time.perf_counter() - started)
+            if expected is None:
+                expected = ids
+            elif ids != expected:
+                raise CommandError(f'{name} returned different rows')
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural} {name}: '
+                f'{len(ids)} rows, median '
+                f'{statistics.median(timings) * 1000:.2f} ms, '
+                f'best {min(timings) * 1000:.2f} ms'
+            )
@@ -0,0 +1,105 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.models import Recipe, Tag
+from recipe import bulk, search
+
+
+DISHES = ('curry', 'soup', 'salad', 'pasta', 'stew', 'pie', 'roast', 'tart')
+STYLES = ('thai', 'green', 'spicy', 'creamy', 'summer', 'winter', 'quick')
+TAGS = ('vegan', 'dinner', 'lunch', 'baking')
+
+
+class Command(BaseCommand):
+    """Django command to time full-text search of recipes
+
+    index runs the query through the search backend of the database,
+    scan through the unindexed title scan used where there is none.
+    Both fetch the first page of results. Everything, including seeded
+    data, is rolled back afterwards.
+    """
+    help = 'Time recipe full-text search against a title scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Email of the user to query')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Create this many recipes first'
+        )
+        parser.add_argument('--query', default='spicy curry')
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self._get_user(options)
+            if options['seed']:
+                self._seed(user, options['seed'])
+            self.stdout.write(
+                f'{type(search.get_backend(connection.alias)).__name__} '
+                f'on {connection.vendor}'
+            )
+            self._compare(user, options)
+            transaction.set_rollback(True)
+
+    def _get_user(self, options):
+        if options['seed']:
+            return get_user_model().objects.create_user(
+                'benchmark@search.invalid'
+            )
+        if not options['user']:
+            raise CommandError('Either --user or --seed is required')
+        try:
+            return get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Unknown user {options["user"]}')
+
+    def _seed(self, user, size):
+        """Create recipes with generated titles, every other one tagged"""
+        self.stdout.write(f'Seeding {size} recipes...')
+        tags = bulk.get_or_create_by_name(Tag, user.pk, TAGS)
+        tag_ids = [tags[name].pk for name in TAGS]
+        recipes = [
+            Recipe(
+                user=user, time_minutes=i % 120, price=1,
+                title=f'{STYLES[i % len(STYLES)]} '
+                      f'{DISHES[i // len(STYLES) % len(DISHES)]} {i}'
+            )
+            for i in range(size)
+        ]
+        bulk.insert_recipes(recipes, {
+            'tags': [
+                [tag_ids[i % len(tag_ids)]] if i % 2 else []
+                for i in range(size)
+            ],
+        })
+        bulk.recipes_created(recipes)
+
+    def _compare(self, user, options):
+        queryset = Recipe.objects.filter(user=user)
+        query = options['query']
+        strategies = {
+            'index': search.search(queryset, user, query).order_by(
+                f'-{search.RANK_FIELD}', '-id'
+            ),
+            'scan': search.ScanSearchBackend().filter(
+                queryset, user, query
+            ).order_by('-id'),
+        }
+        for name, strategy in strategies.items():
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                ids = list(
+                    strategy.values_list('id', flat=True)[:options['limit']]
+                )
+                timings.append(time.perf_counter() - started)
+            self.stdout.write(
+                f'{name}: {len(ids)} rows, median '
+                f'{statistics.median(timings) * 1000:.2f} ms, '
+                f'best {min(timings) * 1000:.2f} ms'
+            )
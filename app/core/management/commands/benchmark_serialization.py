@@ -0,0 +1,111 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from core.models import Ingredient, Recipe, Tag
+from recipe import bulk, serializers
+
+
+class Command(BaseCommand):
+    """Django command to time rendering recipes from rows and instances
+
+    instances is the former path, model instances with prefetched tags
+    and ingredients through ModelSerializer, rows the values() rows the
+    list and detail views serialize now. Both include the query and the
+    JSON rendering. Everything, including seeded data, is rolled back
+    afterwards.
+    """
+    help = 'Compare serializing recipe rows against model instances'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Email of the user to query')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Create this many recipes first'
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self._get_user(options)
+            if options['seed']:
+                self._seed(user, options['seed'])
+            for name, serializer_class in (
+                    ('list', serializers.RecipeSerializer),
+                    ('detail', serializers.RecipeDetailSerializer)):
+                self._compare(name, serializer_class, user, options['repeat'])
+            transaction.set_rollback(True)
+
+    def _get_user(self, options):
+        if options['seed']:
+            return get_user_model().objects.create_user(
+                'benchmark@serialization.invalid'
+            )
+        if not options['user']:
+            raise CommandError('Either --user or --seed is required')
+        try:
+            return get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Unknown user {options["user"]}')
+
+    def _seed(self, user, size):
+        """Create recipes with three tags and two ingredients each"""
+        self.stdout.write(f'Seeding {size} recipes...')
+        tags = bulk.get_or_create_by_name(
+            Tag, user.pk, (f'Tag {i}' for i in range(20))
+        )
+        ingredients = bulk.get_or_create_by_name(
+            Ingredient, user.pk, (f'Ingredient {i}' for i in range(50))
+        )
+        tag_ids = sorted(tag.pk for tag in tags.values())
+        ingredient_ids = sorted(obj.pk for obj in ingredients.values())
+        recipes = [
+            Recipe(
+                user=user, title=f'Recipe {i}', time_minutes=i % 120,
+                price=f'{i % 100}.50', link=f'https://example.com/{i}'
+            )
+            for i in range(size)
+        ]
+        bulk.insert_recipes(recipes, {
+            'tags': [
+                [tag_ids[(i + j) % len(tag_ids)] for j in range(3)]
+                for i in range(size)
+            ],
+            'ingredients': [
+                [ingredient_ids[(i + j) % len(ingredient_ids)]
+                 for j in range(2)]
+                for i in range(size)
+            ],
+        })
+
+    def _compare(self, name, serializer_class, user, repeat):
+        queryset = Recipe.objects.filter(user=user).order_by('id')
+        columns = serializer_class().row_columns()
+        strategies = {
+            'instances': queryset.prefetch_related('tags', 'ingredients'),
+            'rows': queryset.values(*columns),
+        }
+        renderer = JSONRenderer()
+        expected = None
+        for strategy_name, strategy in strategies.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                # all() drops the result cache of the previous round
+                data = serializer_class(strategy.all(), many=True).data
+                content = renderer.render(data)
+                timings.append(time.perf_counter() - started)
+            if expected is None:
+                expected = content
+            elif content != expected:
+                raise CommandError(f'{name} {strategy_name} rendered '
+                                   f'different output')
+            self.stdout.write(
+                f'{name} {strategy_name}: {len(data)} rows, median '
+                f'{statistics.median(timings) * 1000:.2f} ms, '
+                f'best {min(timings) * 1000:.2f} ms'
+            )
@@ -0,0 +1,95 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from core.models import Recipe
+from core.storage import (
+    content_extension, file_digest, hashed_name, is_hashed_name
+)
+from recipe import images
+
+
+class Command(BaseCommand):
+    """Django command to move recipe images to content addressed names
+
+    Every image stored under a random name is hashed and renamed to its
+    digest, recipes are pointed at the new name, and copies of content
+    that is already stored are deleted together with their thumbnails.
+    """
+    help = 'Deduplicate recipe image files by content'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report what would change without touching anything'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        storage = Recipe._meta.get_field('image').storage
+        names = Recipe.objects.exclude(image='').exclude(
+            image__isnull=True
+        ).order_by().values_list('image', flat=True).distinct()
+
+        moved = removed = freed = missing = 0
+        for name in names.iterator():
+            if is_hashed_name(name):
+                continue
+            path = storage.path(name)
+            if not os.path.exists(path):
+                self.stdout.write(self.style.WARNING(f'Missing {name}'))
+                missing += 1
+                continue
+
+            directory, basename = os.path.split(name)
+            target = hashed_name(
+                directory, file_digest(path),
+                content_extension(path, os.path.splitext(basename)[1])
+            )
+            duplicate = storage.exists(target)
+            if duplicate:
+                removed += 1
+                freed += os.path.getsize(path)
+            else:
+                moved += 1
+            if dry_run:
+                continue
+
+            if not duplicate:
+                os.makedirs(os.path.dirname(storage.path(target)),
+                            exist_ok=True)
+                os.replace(path, storage.path(target))
+            self._move_derivatives(name, target)
+            recipes = Recipe.objects.filter(image=name)
+            user_ids = set(recipes.values_list('user_id', flat=True))
+            recipes.update(image=target)
+            for user_id in user_ids:
+                # Cached responses carry the old image URLs
+                get_user_model().objects.bump_data_version(user_id)
+            if duplicate:
+                storage.delete(name)
+
+        prefix = 'Would have ' if dry_run else ''
+        self.stdout.write(
+            f'{prefix}{moved} images renamed, {removed} duplicates '
+            f'removed, {freed} bytes freed, {missing} missing'
+        )
+        self.stdout.write(self.style.SUCCESS('Recipe images deduplicated!'))
+
+    def _move_derivatives(self, name, target):
+        """Keep thumbnails of the old name unless the target has them"""
+        old_names = images.derivative_names(name)
+        new_names = images.derivative_names(target)
+        for image_format, sizes in old_names.items():
+            for size, old in sizes.items():
+                new = new_names[image_format][size]
+                if not default_storage.exists(old):
+                    continue
+                if default_storage.exists(new):
+                    default_storage.delete(old)
+                else:
+                    os.replace(
+                        default_storage.path(old), default_storage.path(new)
+                    )
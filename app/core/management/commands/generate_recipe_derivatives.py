@@ -0,0 +1,66 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from core.models import Recipe
+from recipe import images
+
+
+class Command(BaseCommand):
+    """Django command to write missing resized copies of recipe images
+
+    Resizing after an upload runs in a process pool and is lost when a
+    worker dies or the server restarts before it finished. This catches
+    up on those and on images uploaded before derivatives existed.
+    """
+    help = 'Generate missing recipe image derivatives'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Regenerate the derivatives of every image'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report what would be generated without writing anything'
+        )
+
+    def handle(self, *args, **options):
+        storage = Recipe._meta.get_field('image').storage
+        names = Recipe.objects.exclude(image='').exclude(
+            image__isnull=True
+        ).order_by().values_list('image', flat=True).distinct()
+
+        generated = complete = missing = failed = 0
+        for name in names.iterator():
+            if not storage.exists(name):
+                self.stdout.write(self.style.WARNING(f'Missing {name}'))
+                missing += 1
+                continue
+            if not options['all'] and self._complete(name):
+                complete += 1
+                continue
+            generated += 1
+            if options['dry_run']:
+                continue
+            try:
+                images.generate_derivatives(name, replace=options['all'])
+            except Exception as exc:
+                self.stdout.write(
+                    self.style.WARNING(f'Failed {name}: {exc}')
+                )
+                generated -= 1
+                failed += 1
+
+        prefix = 'Would have ' if options['dry_run'] else ''
+        self.stdout.write(
+            f'{prefix}{generated} images resized, {complete} complete, '
+            f'{failed} failed, {missing} missing'
+        )
+        self.stdout.write(self.style.SUCCESS('Recipe image derivatives done!'))
+
+    def _complete(self, name):
+        return all(
+            default_storage.exists(derivative)
+            for sizes in images.derivative_names(name).values()
+            for derivative in sizes.values()
+        )
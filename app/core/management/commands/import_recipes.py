@@ -0,0 +1,148 @@
+import json
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from core.models import Ingredient, Recipe, Tag
+from recipe import bulk
+
+
+class Command(BaseCommand):
+    """Django command to import recipes from a newline-delimited JSON file
+
+    Every line is an object with title, time_minutes, price and optional
+    link, tags and ingredients (lists of names) and user (an email,
+    defaults to --user). Missing tags and ingredients are created.
+    """
+    help = 'Import recipes from an NDJSON file ("-" reads stdin)'
+
+    related = (('tags', Tag), ('ingredients', Ingredient))
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--user', help='Email of the owner of rows without "user"'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        self.using = options['database']
+        self.default_user = options['user']
+        self.users = {}
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+
+        copy = connections[self.using].vendor == 'postgresql'
+        self.stdout.write(
+            'Importing with {}...'.format('COPY' if copy else 'bulk_create')
+        )
+
+        if options['path'] == '-':
+            self._import(sys.stdin, batch_size, copy)
+        else:
+            with open(options['path'], encoding='utf-8') as lines:
+                self._import(lines, batch_size, copy)
+
+    def _import(self, lines, batch_size, copy):
+        numbered = enumerate(lines, start=1)
+        total, started = 0, time.monotonic()
+        while True:
+            batch = [
+                (number, line) for number, line in
+                islice(numbered, batch_size) if line.strip()
+            ]
+            if not batch:
+                break
+
+            recipes, related_ids = self._build(batch)
+            with transaction.atomic(using=self.using):
+                if copy:
+                    bulk.copy_recipes(recipes, related_ids, self.using)
+                else:
+                    bulk.insert_recipes(recipes, related_ids, self.using)
+                bulk.recipes_created(recipes, self.using)
+
+            total += len(recipes)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'{total} recipes imported, '
+                f'{total / max(elapsed, 1e-6):.0f} rows/sec'
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {total} recipes'))
+
+    def _build(self, batch):
+        """Return validated recipes and related ids for a batch of lines"""
+        rows = []
+        for number, line in batch:
+            try:
+                data = json.loads(line)
+                if not isinstance(data, dict):
+                    raise ValueError('expected a JSON object')
+                recipe = Recipe(
+                    user_id=self._user_id(data.get('user')),
+                    title=data.get('title'),
+                    time_minutes=data.get('time_minutes'),
+                    price=data.get('price'),
+                    link=data.get('link') or ''
+                )
+                recipe.clean_fields(exclude=['user', 'image'])
+                names = {
+                    relation: self._names(data.get(relation, []))
+                    for relation, _model in self.related
+                }
+            except (ValueError, ValidationError) as exc:
+                raise CommandError(f'Line {number}: {exc}')
+            rows.append((recipe, names))
+
+        related_ids = {}
+        for relation, model in self.related:
+            objects = {}
+            for user_id in {recipe.user_id for recipe, _names in rows}:
+                wanted = [
+                    name for recipe, names in rows
+                    if recipe.user_id == user_id
+                    for name in names[relation]
+                ]
+                found = bulk.get_or_create_by_name(
+                    model, user_id, wanted, self.using
+                )
+                objects.update(
+                    ((user_id, name), obj.pk) for name, obj in found.items()
+                )
+            related_ids[relation] = [
+                [objects[recipe.user_id, name] for name in names[relation]]
+                for recipe, names in rows
+            ]
+
+        return [recipe for recipe, _names in rows], related_ids
+
+    def _user_id(self, email):
+        email = email or self.default_user
+        if not email:
+            raise ValueError('no "user" and no --user given')
+        if email not in self.users:
+            try:
+                self.users[email] = get_user_model().objects.using(
+                    self.using
+                ).values_list('pk', flat=True).get(email=email)
+            except get_user_model().DoesNotExist:
+                raise ValueError(f'unknown user {email}')
+
+        return self.users[email]
+
+    @staticmethod
+    def _names(names):
+        if not isinstance(names, list) or not all(
+            isinstance(name, str) and 0 < len(name) <= 255 for name in names
+        ):
+            raise ValueError('expected a list of names')
+
+        return names
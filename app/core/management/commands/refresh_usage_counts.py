@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from recipe import usage
+
+
+class Command(BaseCommand):
+    """Django command to recount recipes linked to tags and ingredients"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        for model in usage.RELATIONS:
+            updated = usage.refresh(model, using=options['database'])
+            self.stdout.write(
+                f'{updated} {model._meta.verbose_name_plural} recounted'
+            )
+        self.stdout.write(self.style.SUCCESS('Usage counts refreshed!'))
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.server import Server
+
+
+def parse_bind(value):
+    host, _, port = value.rpartition(':')
+    if not port.isdigit():
+        raise CommandError(f'"{value}" is not a valid host:port')
+    return host.strip('[]') or '0.0.0.0', int(port)
+
+
+class Command(BaseCommand):
+    """Django command to run the application in pre-forked workers"""
+
+    help = 'Serve the application with pre-forked worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--bind', default=getattr(settings, 'SERVE_BIND', '0.0.0.0:8000')
+        )
+        parser.add_argument(
+            '--workers', type=int,
+            default=getattr(settings, 'SERVE_WORKERS', 2)
+        )
+        parser.add_argument(
+            '--threads', type=int,
+            default=getattr(settings, 'SERVE_THREADS', 4)
+        )
+        parser.add_argument(
+            '--max-requests', type=int,
+            default=getattr(settings, 'SERVE_MAX_REQUESTS', 0),
+            help='Restart workers after this many requests, 0 never'
+        )
+        parser.add_argument(
+            '--max-requests-jitter', type=int,
+            default=getattr(settings, 'SERVE_MAX_REQUESTS_JITTER', 0)
+        )
+        parser.add_argument(
+            '--graceful-timeout', type=int,
+            default=getattr(settings, 'SERVE_GRACEFUL_TIMEOUT', 30)
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['threads'] < 1:
+            raise CommandError('At least one worker and thread are needed')
+
+        server = Server(
+            parse_bind(options['bind']),
+            workers=options['workers'],
+            threads=options['threads'],
+            max_requests=options['max_requests'],
+            max_requests_jitter=options['max_requests_jitter'],
+            graceful_timeout=options['graceful_timeout'],
+            stdout=self.stdout
+        )
+        server.run()
+        self.stdout.write(self.style.SUCCESS('Server stopped!'))
@@ -0,0 +1,190 @@
+import contextlib
+import hashlib
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import connections
+from django.http import FileResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from core.routers import QueryTimer, ReplicaSelector, use_replica
+
+
+STATIC_MAX_AGE = getattr(settings, 'STATIC_MAX_AGE', 60)
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'replica_pin'
+# Preferred first, the uncompressed file is the fallback
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+NO_QUALITY = re.compile(r'q=0(\.0{0,3})?')
+
+
+def accepted_encodings(header):
+    """Return the content codings an Accept-Encoding header allows"""
+    accepted = set()
+    for item in header.lower().split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if coding and not any(NO_QUALITY.fullmatch(p) for p in params):
+            accepted.add(coding)
+    return accepted
+
+
+class StaticAsset:
+    """A collected file with its compressed variants and headers"""
+
+    def __init__(self, path, immutable):
+        self.content_type = mimetypes.guess_type(path)[0] or \
+            'application/octet-stream'
+        self.last_modified = int(os.stat(path).st_mtime)
+        if immutable:
+            self.cache_control = 'public, max-age=31536000, immutable'
+        else:
+            self.cache_control = f'public, max-age={STATIC_MAX_AGE}'
+
+        self.variants = []
+        for encoding, suffix in ENCODINGS + ((None, ''),):
+            try:
+                status = os.stat(path + suffix)
+            except FileNotFoundError:
+                continue
+            etag = '"{:x}-{:x}"'.format(status.st_mtime_ns, status.st_size)
+            self.variants.append((encoding, path + suffix, etag))
+
+    def serve(self, request):
+        accepted = accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        for encoding, path, etag in self.variants:
+            if encoding is None or encoding in accepted:
+                break
+
+        response = get_conditional_response(
+            request, etag, self.last_modified
+        )
+        if response is None:
+            response = FileResponse(open(path, 'rb'))
+            response['Content-Type'] = self.content_type
+            if encoding is not None:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(self.last_modified)
+        response['Cache-Control'] = self.cache_control
+        if len(self.variants) > 1:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+def build_index(root, url):
+    """Map the URL of every file below root to its StaticAsset"""
+    # Content hashed names, listed in the manifest, never change
+    hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+    suffixes = tuple(suffix for _encoding, suffix in ENCODINGS)
+    index = {}
+    for directory, _dirs, files in os.walk(root):
+        for filename in files:
+            if filename.endswith(suffixes):
+                continue
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            index[url + name] = StaticAsset(path, name in hashed)
+    return index
+
+
+class StaticFilesMiddleware:
+    """Serve STATIC_ROOT from an index built when the server starts
+
+    Picks the brotli or gzip copy written by collectstatic when the
+    client accepts it. Files added after startup are not served.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not settings.STATIC_ROOT or not settings.STATIC_URL:
+            raise MiddlewareNotUsed()
+        self.files = build_index(settings.STATIC_ROOT, settings.STATIC_URL)
+        if not self.files:
+            raise MiddlewareNotUsed()
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD'):
+            asset = self.files.get(request.path)
+            if asset is not None:
+                return asset.serve(request)
+        return self.get_response(request)
+
+
+class ReplicaMiddleware:
+    """Send the reads of requests with a safe method to a replica
+
+    After a request with an unsafe method, requests from the same client
+    read from the primary for REPLICA_PIN_SECONDS so users see their own
+    changes. The pin is kept in a cookie and, keyed by the credentials,
+    in the cache for token clients that do not send cookies back. That
+    cache must be shared by the workers of manage.py serve.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        if not replicas:
+            raise MiddlewareNotUsed()
+        strategy = getattr(settings, 'REPLICA_SELECTION', 'round-robin')
+        try:
+            self.selector = ReplicaSelector(replicas, strategy)
+        except ValueError as exc:
+            raise ImproperlyConfigured(str(exc))
+        self.timer = None
+        if strategy == 'least-latency':
+            self.timer = QueryTimer(self.selector)
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+        alias = getattr(settings, 'REPLICA_PIN_CACHE_ALIAS', 'default')
+        self.cache = caches[alias]
+        workers = getattr(settings, 'SERVE_WORKERS', 1)
+        if isinstance(self.cache, LocMemCache) and workers > 1:
+            raise ImproperlyConfigured(
+                f'The replica pin cache {alias!r} is local to each process, '
+                f'use a shared cache to serve with {workers} workers'
+            )
+
+    def __call__(self, request):
+        key = self.pin_key(request)
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            self.pin(response, key)
+            return response
+
+        if request.COOKIES.get(PIN_COOKIE) or \
+                key is not None and self.cache.get(key):
+            return self.get_response(request)
+
+        alias = self.selector.choose()
+        with use_replica(alias), self.timed(alias):
+            return self.get_response(request)
+
+    def timed(self, alias):
+        if self.timer is None:
+            return contextlib.nullcontext()
+        return connections[alias].execute_wrapper(self.timer)
+
+    def pin_key(self, request):
+        credentials = request.META.get('HTTP_AUTHORIZATION') or \
+            request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if not credentials:
+            return None
+        digest = hashlib.sha256(credentials.encode()).hexdigest()
+        return f'replica-pin:{digest}'
+
+    def pin(self, response, key):
+        """Read from the primary for a while after a write"""
+        response.set_cookie(
+            PIN_COOKIE, '1', max_age=self.pin_seconds, httponly=True,
+            samesite='Lax'
+        )
+        if key is not None:
+            self.cache.set(key, True, self.pin_seconds)
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.2 on 2026-10-17 05:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
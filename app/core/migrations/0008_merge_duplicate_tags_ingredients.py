@@ -0,0 +1,57 @@
+from django.db import migrations
+
+
+BATCH_SIZE = 1000
+
+
+def merge_duplicates(apps, schema_editor):
+    """Fold tags and ingredients sharing a (user, name) into the oldest"""
+    db = schema_editor.connection.alias
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, relation in (('Tag', 'tags'), ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = Recipe._meta.get_field(relation).remote_field.through
+        column = f'{model_name.lower()}_id'
+
+        remap = {}
+        previous = None
+        rows = model.objects.using(db).order_by(
+            'user_id', 'name', 'id'
+        ).values_list('id', 'user_id', 'name')
+        for pk, user_id, name in rows.iterator():
+            if previous and previous[1:] == (user_id, name):
+                remap[pk] = previous[0]
+            else:
+                previous = (pk, user_id, name)
+
+        duplicates = list(remap)
+        for start in range(0, len(duplicates), BATCH_SIZE):
+            batch = duplicates[start:start + BATCH_SIZE]
+            links = through.objects.using(db).filter(
+                **{f'{column}__in': batch}
+            ).values_list('recipe_id', column)
+            wanted = {(recipe_id, remap[pk]) for recipe_id, pk in links}
+            existing = set(through.objects.using(db).filter(
+                recipe_id__in={recipe_id for recipe_id, _ in wanted},
+                **{f'{column}__in': set(remap[pk] for pk in batch)}
+            ).values_list('recipe_id', column))
+            through.objects.using(db).bulk_create(
+                [through(recipe_id=recipe_id, **{column: pk})
+                 for recipe_id, pk in wanted - existing],
+                batch_size=BATCH_SIZE
+            )
+            through.objects.using(db).filter(
+                **{f'{column}__in': batch}
+            ).delete()
+            model.objects.using(db).filter(id__in=batch).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_user_data_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.2.2 on 2026-10-17 06:10
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_usage(apps, schema_editor):
+    """Fill usage_count from the existing recipe links"""
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, relation, column in (
+        ('Tag', 'tags', 'tag_id'),
+        ('Ingredient', 'ingredients', 'ingredient_id'),
+    ):
+        through = getattr(Recipe, relation).through
+        count = through.objects.filter(
+            **{column: OuterRef('pk')}
+        ).order_by().values(column).annotate(n=Count('*')).values('n')
+        apps.get_model('core', model_name).objects.using(
+            schema_editor.connection.alias
+        ).update(usage_count=Coalesce(
+            Subquery(count, output_field=IntegerField()), 0
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_tag_ingredient_user_name_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='usage_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='usage_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_usage, migrations.RunPython.noop),
+    ]
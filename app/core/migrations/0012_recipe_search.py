@@ -0,0 +1,70 @@
+# Generated by Django 2.2.2 on 2026-10-17 09:40
+
+from django.db import migrations
+
+
+# Shadow tables of recipe.search, indexing the recipes that exist already.
+# Other databases search with an unindexed title scan and get nothing.
+CREATE = {
+    'postgresql': [
+        'CREATE TABLE IF NOT EXISTS core_recipe_search ('
+        ' recipe_id integer PRIMARY KEY,'
+        ' user_id integer NOT NULL,'
+        ' document tsvector NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS core_recipe_search_document_gin '
+        'ON core_recipe_search USING gin (document)',
+        'CREATE INDEX IF NOT EXISTS core_recipe_search_user_id '
+        'ON core_recipe_search (user_id)',
+        "INSERT INTO core_recipe_search (recipe_id, user_id, document) "
+        "SELECT r.id, r.user_id, "
+        " setweight(to_tsvector('english', r.title), 'A') || "
+        " setweight(to_tsvector('english', coalesce(("
+        "  SELECT string_agg(t.name, ' ') FROM core_recipe_tags rt "
+        "  JOIN core_tag t ON t.id = rt.tag_id "
+        "  WHERE rt.recipe_id = r.id), '')), 'B') || "
+        " setweight(to_tsvector('english', coalesce(("
+        "  SELECT string_agg(i.name, ' ') FROM core_recipe_ingredients ri "
+        "  JOIN core_ingredient i ON i.id = ri.ingredient_id "
+        "  WHERE ri.recipe_id = r.id), '')), 'B') "
+        "FROM core_recipe r "
+        "ON CONFLICT (recipe_id) DO NOTHING",
+    ],
+    'sqlite': [
+        'CREATE VIRTUAL TABLE IF NOT EXISTS core_recipe_fts USING fts5('
+        'title, tags, ingredients, user_id UNINDEXED)',
+        "INSERT INTO core_recipe_fts "
+        "(rowid, title, tags, ingredients, user_id) "
+        "SELECT r.id, r.title, coalesce(("
+        " SELECT group_concat(t.name, ' ') FROM core_recipe_tags rt "
+        " JOIN core_tag t ON t.id = rt.tag_id "
+        " WHERE rt.recipe_id = r.id), ''), coalesce(("
+        " SELECT group_concat(i.name, ' ') FROM core_recipe_ingredients ri "
+        " JOIN core_ingredient i ON i.id = ri.ingredient_id "
+        " WHERE ri.recipe_id = r.id), ''), r.user_id "
+        "FROM core_recipe r "
+        "WHERE r.id NOT IN (SELECT rowid FROM core_recipe_fts)",
+    ],
+}
+DROP = {
+    'postgresql': ['DROP TABLE IF EXISTS core_recipe_search'],
+    'sqlite': ['DROP TABLE IF EXISTS core_recipe_fts'],
+}
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in statements.get(vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_recipe_image_content_addressed'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_for_vendor(CREATE), run_for_vendor(DROP)),
+    ]
@@ -6,6 +6,8 @@ from django.contrib.auth.models import (
 )
 from django.conf import settings
 
+from core.storage import ContentAddressedStorage
+
 
 def recipe_image_file_path(instance, filename):
     """Generate file path for new recipe image"""
@@ -27,6 +29,12 @@ class UserManager(BaseUserManager):
 
         return user
 
+    def bump_data_version(self, user_id):
+        """Mark the recipe data of a user as changed"""
+        self.filter(pk=user_id).update(
+            data_version=models.F('data_version') + 1
+        )
+
     def create_superuser(self, email, password):
         """Creates and saves a new super user"""
         user = self.create_user(email, password)
@@ -43,11 +51,25 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    data_version = models.PositiveIntegerField(default=0)
 
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
 
+    def save(self, *args, **kwargs):
+        """Save the user, leaving data_version to bump_data_version
+
+        Instances such as request.user may carry an outdated counter,
+        writing it back would make stale ETags and caches valid again.
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'data_version'
+            ]
+        super().save(*args, **kwargs)
+
 
 class Tag(models.Model):
     """Tag to be used for a recipe"""
@@ -56,6 +78,16 @@ class Tag(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    # Linked recipes, maintained when RECIPE_USAGE_COUNTS is on
+    usage_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='tag_user_name_unique'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -68,6 +100,16 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
+    # Linked recipes, maintained when RECIPE_USAGE_COUNTS is on
+    usage_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='ingredient_user_name_unique'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -85,7 +127,28 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image = models.ImageField(
+        null=True,
+        upload_to=recipe_image_file_path,
+        storage=ContentAddressedStorage(),
+        db_index=True
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'id'],
+                name='recipe_user_id_idx'
+            ),
+            models.Index(
+                fields=['user', 'time_minutes', 'id'],
+                name='recipe_user_time_id_idx'
+            ),
+            models.Index(
+                fields=['user', 'price', 'id'],
+                name='recipe_user_price_id_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.title
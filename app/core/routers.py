@@ -0,0 +1,132 @@
+"""Read replica routing
+
+ReplicaMiddleware picks one of DATABASE_REPLICAS for each request with a
+safe method and ReplicaRouter sends that request's reads to it. Writes,
+reads inside a transaction and reads of PRIMARY_MODELS always go to the
+primary.
+"""
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Read right after being created, before replication caught up
+PRIMARY_MODELS = {'authtoken.Token'}
+# Weight of a new query duration in the latency average
+LATENCY_WEIGHT = 0.2
+
+_state = threading.local()
+
+
+def get_replica():
+    """Return the replica reads of this thread go to, if any"""
+    return getattr(_state, 'replica', None)
+
+
+@contextmanager
+def use_replica(alias):
+    """Send reads in this thread to the replica alias"""
+    previous = get_replica()
+    _state.replica = alias
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+class ReplicaSelector:
+    """Chooses replicas round-robin or by lowest recent query latency
+
+    Latencies older than latency_ttl seconds are forgotten, so a replica
+    that was slow once gets tried again.
+    """
+
+    def __init__(self, aliases, strategy='round-robin', latency_ttl=10):
+        if strategy not in ('round-robin', 'least-latency'):
+            raise ValueError(f'Unknown replica selection {strategy!r}')
+        self.aliases = list(aliases)
+        self.strategy = strategy
+        self.latency_ttl = latency_ttl
+        self.latencies = {}
+        self._cycle = itertools.cycle(self.aliases)
+        self._lock = threading.Lock()
+
+    def choose(self):
+        with self._lock:
+            if self.strategy == 'round-robin':
+                return next(self._cycle)
+            now = time.monotonic()
+            return min(
+                self.aliases,
+                key=lambda alias: self._latency(alias, now)
+            )
+
+    def _latency(self, alias, now):
+        latency, measured = self.latencies.get(alias, (0.0, 0.0))
+        return latency if now - measured < self.latency_ttl else 0.0
+
+    def record(self, alias, seconds):
+        """Add the duration of a query on alias to its average"""
+        now = time.monotonic()
+        with self._lock:
+            if alias in self.latencies and \
+                    now - self.latencies[alias][1] < self.latency_ttl:
+                previous = self.latencies[alias][0]
+                seconds = previous + (seconds - previous) * LATENCY_WEIGHT
+            self.latencies[alias] = (seconds, now)
+
+    def get_stats(self):
+        """Return the average query latency of every replica"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                alias: {'latency_ms': self._latency(alias, now) * 1000}
+                for alias in self.aliases
+            }
+
+
+class QueryTimer:
+    """Execute wrapper reporting query durations to a selector"""
+
+    def __init__(self, selector):
+        self.selector = selector
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.selector.record(
+                context['connection'].alias, time.monotonic() - started
+            )
+
+
+class ReplicaRouter:
+    """Route reads of replica requests to their replica"""
+
+    def db_for_read(self, model, **hints):
+        replica = get_replica()
+        if replica is None or model._meta.label in PRIMARY_MODELS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Must see what the transaction wrote
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        # Also for instances read from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through replication
+        if db in getattr(settings, 'DATABASE_REPLICAS', ()):
+            return False
+        return None
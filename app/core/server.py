@@ -0,0 +1,340 @@
+"""Pre-fork WSGI server run by manage.py serve
+
+The master process loads the application and imports every view once,
+checks the databases, then forks workers that share that memory copy on
+write. Each worker accepts on the listening socket of the master with a
+fixed number of threads and exits after serving max_requests requests,
+spread by a random jitter so workers do not all restart at once. The
+master replaces workers that exit. Requests are parsed by the handler of
+runserver, changed to answer HEAD without a body and to send file
+responses with sendfile().
+
+Signals to the master:
+
+- SIGHUP starts a new set of workers and gracefully stops the old ones.
+  The application stays the one preloaded, new code needs a restart.
+- SIGTERM and SIGINT let workers finish their requests, for at most
+  graceful_timeout seconds, and exit.
+"""
+import os
+import random
+import selectors
+import signal
+import socket
+import threading
+import time
+import traceback
+
+from django.core.servers import basehttp
+from django.core.servers.basehttp import (
+    WSGIRequestHandler, WSGIServer, get_internal_wsgi_application
+)
+from django.db import DatabaseError, connections
+from django.urls import get_resolver
+
+from core.backends import pool
+
+
+# How long an idle keep-alive connection holds a worker thread
+KEEPALIVE = 5
+
+
+def warm_up_connections():
+    """Connect to every database, in the current thread"""
+    for connection in connections.all():
+        connection.ensure_connection()
+
+
+class ServerHandler(basehttp.ServerHandler):
+    """Handler answering HEAD without a body and sending files zero-copy"""
+
+    def finish_response(self):
+        if self.environ['REQUEST_METHOD'] != 'HEAD':
+            return super().finish_response()
+        # A body would be read as the start of the next response on a
+        # kept alive connection
+        try:
+            if self.status is None:
+                # Applications may only start the response when iterated
+                for _data in self.result:
+                    if self.status is not None:
+                        break
+            if not self.headers_sent:
+                self.send_headers()
+        finally:
+            self.close()
+
+    def sendfile(self):
+        """Send a wsgi.file_wrapper result with socket.sendfile()"""
+        file = getattr(self.result, 'filelike', None)
+        try:
+            file.fileno()
+        except (AttributeError, OSError, ValueError):
+            return False
+        if not self.headers_sent:
+            self.send_headers()
+        self._flush()
+        self.bytes_sent += self.request_handler.connection.sendfile(
+            file, file.tell()
+        )
+        return True
+
+
+class RequestHandler(WSGIRequestHandler):
+    timeout = KEEPALIVE
+
+    def handle_one_request(self):
+        try:
+            self._handle_one_request()
+        except socket.timeout:
+            self.close_connection = True
+            return
+        if not self.server.request_served():
+            # Recycling, the client reconnects to another worker
+            self.close_connection = True
+
+    def _handle_one_request(self):
+        """WSGIRequestHandler.handle_one_request with ServerHandler above"""
+        self.raw_requestline = self.rfile.readline(65537)
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            return
+        if not self.parse_request():
+            return
+
+        handler = ServerHandler(
+            self.rfile, self.wfile, self.get_stderr(), self.get_environ()
+        )
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+
+
+class Worker(WSGIServer):
+    """Serves requests on the shared socket in a pool of threads"""
+
+    def __init__(self, listener, application, threads, max_requests):
+        host, port = listener.getsockname()[:2]
+        super().__init__(
+            (host, port), RequestHandler,
+            ipv6=listener.family == socket.AF_INET6,
+            bind_and_activate=False
+        )
+        self.socket.close()
+        self.socket = listener
+        self.server_name = host
+        self.server_port = port
+        self.setup_environ()
+        self.set_app(application)
+
+        self.threads = threads
+        self.max_requests = max_requests
+        self.master = os.getppid()
+        self.handled = 0
+        self.running = True
+        self._lock = threading.Lock()
+
+    def stop(self, *args):
+        self.running = False
+
+    def run(self):
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        threads = [
+            threading.Thread(target=self.accept_loop, daemon=True)
+            for _ in range(self.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        # Joined with a timeout so the main thread still handles signals
+        while any(thread.is_alive() for thread in threads):
+            if os.getppid() != self.master:
+                # Orphaned, the master was killed
+                self.stop()
+            for thread in threads:
+                thread.join(0.5)
+
+    def request_served(self):
+        """Count a request, return whether the worker keeps running"""
+        with self._lock:
+            self.handled += 1
+            if self.max_requests and self.handled >= self.max_requests:
+                self.running = False
+            return self.running
+
+    def accept_loop(self):
+        try:
+            warm_up_connections()
+        except DatabaseError:
+            # Requests get to report the error
+            pass
+
+        selector = selectors.DefaultSelector()
+        selector.register(self.socket, selectors.EVENT_READ)
+        while self.running:
+            if not selector.select(timeout=0.5):
+                continue
+            try:
+                request, client_address = self.socket.accept()
+            except (BlockingIOError, InterruptedError):
+                # Another thread or worker was faster
+                continue
+            request.setblocking(True)
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+        selector.close()
+        connections.close_all()
+
+
+class Server:
+    """Master process keeping a number of worker processes running"""
+
+    def __init__(self, address, workers, threads=1, max_requests=0,
+                 max_requests_jitter=0, graceful_timeout=30,
+                 application=None, stdout=None):
+        self.address = address
+        self.workers = workers
+        self.threads = threads
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.application = application
+        self.stdout = stdout
+        self.listener = None
+        # pid -> generation, bumped on every reload
+        self.children = {}
+        self.generation = 0
+        self._reload = False
+        self._stop = False
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def bind(self):
+        host, port = self.address
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        self.listener = socket.socket(family, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, port))
+        self.listener.listen(128)
+        # Workers select before accepting, a lost race must not block
+        self.listener.setblocking(False)
+        return self.listener.getsockname()
+
+    def load(self):
+        """Import the application and its views, check the databases"""
+        if self.application is None:
+            self.application = get_internal_wsgi_application()
+        # Imports the URLconf and with it every view
+        get_resolver().url_patterns
+        warm_up_connections()
+        # Connections must not be shared with the forked workers
+        connections.close_all()
+        pool.close_all()
+
+    def run(self):
+        if self.listener is None:
+            self.bind()
+        self.load()
+        signal.signal(signal.SIGHUP, self._on_reload)
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+
+        host, port = self.listener.getsockname()[:2]
+        self.log(f'Listening at http://{host}:{port} with {self.workers} '
+                 f'workers of {self.threads} threads')
+        while not self._stop:
+            self.reap()
+            if self._reload:
+                self._reload = False
+                self.reload()
+            self.spawn_missing()
+            time.sleep(0.1)
+        self.shutdown()
+
+    def _on_reload(self, *args):
+        self._reload = True
+
+    def _on_stop(self, *args):
+        self._stop = True
+
+    def spawn_missing(self):
+        current = sum(
+            1 for generation in self.children.values()
+            if generation == self.generation
+        )
+        for _ in range(self.workers - current):
+            self.spawn()
+
+    def spawn(self):
+        max_requests = self.max_requests
+        if max_requests and self.max_requests_jitter:
+            max_requests += random.randint(0, self.max_requests_jitter)
+
+        pid = os.fork()
+        if pid:
+            self.children[pid] = self.generation
+            return pid
+
+        status = 0
+        try:
+            Worker(
+                self.listener, self.application, self.threads, max_requests
+            ).run()
+        except Exception:
+            traceback.print_exc()
+            status = 1
+        finally:
+            # Never return into the code of the master
+            os._exit(status)
+
+    def reap(self):
+        """Forget workers that exited, return their pids"""
+        exited = []
+        while self.children:
+            try:
+                pid, _status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if not pid:
+                break
+            self.children.pop(pid, None)
+            exited.append(pid)
+        return exited
+
+    def reload(self):
+        self.log('Reloading workers')
+        old = list(self.children)
+        self.generation += 1
+        self.spawn_missing()
+        self.signal(old, signal.SIGTERM)
+
+    def signal(self, pids, signum):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def shutdown(self):
+        self.log('Shutting down')
+        self.signal(list(self.children), signal.SIGTERM)
+        deadline = time.time() + self.graceful_timeout
+        while self.children and time.time() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        self.signal(list(self.children), signal.SIGKILL)
+        while self.children:
+            pid, _status = os.waitpid(-1, 0)
+            self.children.pop(pid, None)
+        self.listener.close()
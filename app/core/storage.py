@@ -0,0 +1,169 @@
+import gzip
+import hashlib
+import os
+import re
+import tempfile
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from PIL import Image
+
+from core.locks import advisory_lock
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+# Stored images get the extension of their detected format, not the one
+# of the name they were uploaded under
+IMAGE_EXTENSIONS = {
+    'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp',
+}
+# Formats that are compressed already gain nothing from gzip or brotli
+INCOMPRESSIBLE = {
+    '.br', '.gif', '.gz', '.jpeg', '.jpg', '.png', '.webp', '.woff',
+    '.woff2', '.zip',
+}
+
+
+def hashed_name(directory, digest, ext):
+    """Return the storage name of content with the given SHA-256"""
+    return '/'.join(
+        part for part in (directory, digest[:2], digest + ext.lower()) if part
+    )
+
+
+def is_hashed_name(name):
+    return bool(HASHED_NAME.search(name))
+
+
+def content_extension(path, default=''):
+    """Return the extension of the image format of a file, else default"""
+    try:
+        with Image.open(path) as image:
+            image_format = image.format
+    except (OSError, Image.DecompressionBombError):
+        return default
+    return IMAGE_EXTENSIONS.get(image_format, default)
+
+
+def file_digest(path, chunk_size=64 * 1024):
+    """Return the SHA-256 of a file, read in chunks"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as stored:
+        for chunk in iter(lambda: stored.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """File storage keeping one copy per distinct content
+
+    Files are named after the SHA-256 of their bytes, computed while they
+    are written, in the directory of the name they were saved under.
+    Images get the extension of their format, other files the one of that
+    name, so identical bytes always get the same name. Saving content
+    that is already stored returns the existing name. Deleting shared
+    files is left to the callers, see recipe.images.delete_unused.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is only known once the content is hashed
+        return name
+
+    def _save(self, name, content):
+        directory, basename = os.path.split(name)
+        ext = os.path.splitext(basename)[1]
+        os.makedirs(self.path(directory), exist_ok=True)
+
+        if hasattr(content, 'temporary_file_path'):
+            # Already on disk, hash it and move it in place of copying
+            temporary = content.temporary_file_path()
+            digest = file_digest(temporary)
+            owned = False
+        else:
+            handle, temporary = tempfile.mkstemp(dir=self.path(directory))
+            hasher = hashlib.sha256()
+            with os.fdopen(handle, 'wb') as partial:
+                for chunk in content.chunks():
+                    hasher.update(chunk)
+                    partial.write(chunk)
+            digest = hasher.hexdigest()
+            owned = True
+
+        name = hashed_name(
+            directory.replace('\\', '/'), digest,
+            content_extension(temporary, ext)
+        )
+        # Held until the reference to the name is committed, deleting the
+        # file once unused waits for it
+        advisory_lock(os.path.splitext(name)[0], shared=True)
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            if owned:
+                os.remove(temporary)
+            return name
+
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # Concurrent saves of the same content write identical bytes
+        file_move_safe(temporary, full_path, allow_overwrite=True)
+        os.chmod(full_path, self.file_permissions_mode or 0o644)
+        return name
+
+
+def compress(path, min_size=256, cache=None):
+    """Write .gz and, with brotli installed, .br siblings of a file
+
+    Siblings not smaller than the file are not kept. Compressed content is
+    looked up in and added to cache, keyed by the digest of the file, so
+    identical files are compressed once. Returns the paths written.
+    """
+    with open(path, 'rb') as source:
+        content = source.read()
+    if len(content) < min_size:
+        return []
+
+    key = hashlib.sha256(content).digest()
+    if cache is not None and key in cache:
+        siblings = cache[key]
+    else:
+        siblings = {'.gz': gzip.compress(content, 9, mtime=0)}
+        if brotli is not None:
+            siblings['.br'] = brotli.compress(content)
+        if cache is not None:
+            cache[key] = siblings
+
+    written = []
+    for suffix, compressed in siblings.items():
+        if len(compressed) >= len(content) * 0.95:
+            continue
+        with open(path + suffix, 'wb') as target:
+            target.write(compressed)
+        written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage also writing compressed siblings of every file
+
+    The original and the content hashed copy of each collected file get
+    .gz and .br versions next to them, which core.middleware serves to
+    clients accepting them.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Hashed copies of most files have the content of the original
+        cache = {}
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() not in INCOMPRESSIBLE:
+                compress(self.path(name), cache=cache)
@@ -0,0 +1,169 @@
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+
+MEDIA_ACCEL = getattr(settings, 'MEDIA_ACCEL', None)
+MEDIA_ACCEL_PREFIX = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected/')
+MEDIA_MAX_AGE = getattr(settings, 'MEDIA_MAX_AGE', 24 * 60 * 60)
+# Names that embed the digest of their content never change
+IMMUTABLE_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}[._]')
+# Files still being uploaded in chunks are not public
+PRIVATE_DIRS = ('uploads/partial',)
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange:
+    """File-like view of length bytes of a file starting at offset"""
+
+    def __init__(self, file, offset, length):
+        file.seek(offset)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _is_private(full_path):
+    """Return whether a resolved path lies in one of PRIVATE_DIRS"""
+    for directory in PRIVATE_DIRS:
+        private = safe_join(settings.MEDIA_ROOT, directory)
+        if full_path == private or full_path.startswith(private + os.sep):
+            return True
+    return False
+
+
+def _resolve(path):
+    """Return the absolute path and stat result of a media file"""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        status = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404()
+    # Checked once resolved, the URL may spell the directory many ways
+    if _is_private(full_path) or not stat.S_ISREG(status.st_mode):
+        raise Http404()
+    return full_path, status
+
+
+def _parse_range(header, size):
+    """Return (start, end) of a single byte range, None for the whole file
+
+    Raises ValueError when the range can not be satisfied.
+    """
+    match = RANGE.match(header.replace(' ', ''))
+    if match is None:
+        # Several or malformed ranges, the whole file is a valid answer
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last or int(last) == 0:
+            raise ValueError(header)
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve an uploaded file with validators, caching and byte ranges
+
+    With MEDIA_ACCEL set to 'x-accel-redirect' or 'x-sendfile' the body
+    is left to the front proxy; otherwise FileResponse lets the server
+    use sendfile() for whole files.
+    """
+    full_path, status = _resolve(path)
+    size = status.st_size
+    last_modified = int(status.st_mtime)
+    etag = '"{:x}-{:x}"'.format(status.st_mtime_ns, size)
+    if IMMUTABLE_NAME.search(path):
+        cache_control = 'public, max-age=31536000, immutable'
+    else:
+        cache_control = f'public, max-age={MEDIA_MAX_AGE}'
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': cache_control,
+        'Accept-Ranges': 'bytes',
+    }
+
+    response = get_conditional_response(request, etag, last_modified)
+    if response is None:
+        response = _file_response(
+            request, path, full_path, size,
+            _if_range_matches(request, etag, last_modified)
+        )
+    for header, value in headers.items():
+        if header not in response:
+            response[header] = value
+    return response
+
+
+def _file_response(request, path, full_path, size, range_allowed):
+    content_type = mimetypes.guess_type(full_path)[0] or \
+        'application/octet-stream'
+
+    if MEDIA_ACCEL == 'x-accel-redirect':
+        # nginx answers ranges and conditionals for internal redirects
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = MEDIA_ACCEL_PREFIX + path
+        return response
+    if MEDIA_ACCEL == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+        return response
+
+    byte_range = None
+    header = request.META.get('HTTP_RANGE')
+    if header and range_allowed:
+        try:
+            byte_range = _parse_range(header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(
+            open(full_path, 'rb'), content_type=content_type
+        )
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(
+            FileRange(open(full_path, 'rb'), start, length),
+            status=206,
+            content_type=content_type
+        )
+        response['Content-Length'] = length
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
@@ -0,0 +1,154 @@
+"""Bulk writes of recipes, tags and ingredients
+
+bulk_create() and COPY send no model signals, so callers finish with
+recipes_created() to update what the signal handlers would have.
+"""
+import csv
+import io
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+
+from core.models import Recipe
+from recipe import search, usage
+
+
+RELATIONS = ('tags', 'ingredients')
+
+
+def _through(relation):
+    """Return the through model and related id column of a relation"""
+    descriptor = getattr(Recipe, relation)
+    column = f'{descriptor.field.m2m_reverse_field_name()}_id'
+    return descriptor.through, column
+
+
+def _bulk_create(queryset, objs, batch_size, **kwargs):
+    """bulk_create() with batch_size capped to what the backend accepts"""
+    objs = list(objs)
+    if not objs:
+        return objs
+    fields = [
+        field for field in queryset.model._meta.concrete_fields
+        if not field.primary_key
+    ]
+    limit = connections[queryset.db].ops.bulk_batch_size(fields, objs)
+    return queryset.bulk_create(
+        objs, batch_size=min(batch_size, max(limit, 1)), **kwargs
+    )
+
+
+def get_or_create_by_name(model, user_id, names, using='default',
+                          batch_size=1000):
+    """Return {name: object} for names, inserting the missing ones"""
+    names = list(dict.fromkeys(names))
+    manager = model.objects.using(using)
+    objects = {
+        obj.name: obj
+        for obj in manager.filter(user_id=user_id, name__in=names)
+    }
+    missing = [name for name in names if name not in objects]
+    if missing:
+        # Rows inserted concurrently are skipped, then read back below
+        _bulk_create(
+            manager,
+            [model(user_id=user_id, name=name) for name in missing],
+            batch_size,
+            ignore_conflicts=True
+        )
+        objects.update(
+            (obj.name, obj)
+            for obj in manager.filter(user_id=user_id, name__in=missing)
+        )
+        get_user_model().objects.db_manager(using).bump_data_version(
+            user_id
+        )
+
+    return objects
+
+
+def insert_recipes(recipes, related_ids, using='default', batch_size=1000):
+    """Insert recipes and their links with bulk_create
+
+    related_ids maps a relation name to lists of related ids aligned
+    with recipes. Duplicate ids are dropped.
+    """
+    if connections[using].features.can_return_ids_from_bulk_insert:
+        _bulk_create(Recipe.objects.using(using), recipes, batch_size)
+    else:
+        # Primary keys are needed for the links below
+        for recipe in recipes:
+            recipe.save(using=using)
+
+    for relation, id_lists in related_ids.items():
+        through, column = _through(relation)
+        _bulk_create(
+            through.objects.using(using),
+            (
+                through(recipe_id=recipe.id, **{column: pk})
+                for recipe, ids in zip(recipes, id_lists)
+                for pk in dict.fromkeys(ids)
+            ),
+            batch_size
+        )
+
+
+def copy_recipes(recipes, related_ids, using='default'):
+    """Insert recipes and their links with COPY FROM STDIN
+
+    PostgreSQL only. Ids are reserved from the recipe sequence first so
+    the link rows can be written in the same way.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+            "FROM generate_series(1, %s)",
+            [Recipe._meta.db_table, len(recipes)]
+        )
+        for recipe, (pk,) in zip(recipes, cursor.fetchall()):
+            recipe.id = pk
+
+        _copy(
+            cursor,
+            Recipe._meta.db_table,
+            ('id', 'user_id', 'title', 'time_minutes', 'price', 'link'),
+            (
+                (recipe.id, recipe.user_id, recipe.title,
+                 recipe.time_minutes, recipe.price, recipe.link)
+                for recipe in recipes
+            )
+        )
+        for relation, id_lists in related_ids.items():
+            through, column = _through(relation)
+            _copy(
+                cursor,
+                through._meta.db_table,
+                ('recipe_id', column),
+                (
+                    (recipe.id, pk)
+                    for recipe, ids in zip(recipes, id_lists)
+                    for pk in dict.fromkeys(ids)
+                )
+            )
+
+
+def _copy(cursor, table, columns, rows):
+    buffer = io.StringIO()
+    # Quoting every non number keeps empty strings apart from NULL
+    csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(
+        f'COPY {table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)',
+        buffer
+    )
+
+
+def recipes_created(recipes, using='default'):
+    """Index bulk inserted recipes and invalidate their owners' caches"""
+    search.update((recipe.id for recipe in recipes), using=using)
+    if usage.counts_enabled():
+        usage.refresh_for_recipes([recipe.id for recipe in recipes], using)
+    for user_id in {recipe.user_id for recipe in recipes}:
+        get_user_model().objects.db_manager(using).bump_data_version(
+            user_id
+        )
@@ -0,0 +1,83 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from recipe.conditional import get_data_version
+
+
+CACHE_ALIAS = getattr(settings, 'RECIPE_RESPONSE_CACHE_ALIAS', 'default')
+CACHE_TIMEOUT = getattr(settings, 'RECIPE_RESPONSE_CACHE_TIMEOUT', 300)
+STATS_KEYS = {'hits': 'response-cache:hits', 'misses': 'response-cache:misses'}
+
+
+def get_response_cache():
+    """Return the cache used for list responses, None when disabled"""
+    if CACHE_ALIAS is None:
+        return None
+    return caches[CACHE_ALIAS]
+
+
+def _count(name):
+    cache = get_response_cache()
+    cache.add(STATS_KEYS[name], 0, None)
+    try:
+        cache.incr(STATS_KEYS[name])
+    except ValueError:
+        # The counter was evicted between add() and incr()
+        cache.set(STATS_KEYS[name], 1, None)
+
+
+def get_stats():
+    """Return hit and miss counters of the response cache"""
+    cache = get_response_cache()
+    if cache is None:
+        return {'hits': 0, 'misses': 0}
+    values = cache.get_many(STATS_KEYS.values())
+    return {name: values.get(key, 0) for name, key in STATS_KEYS.items()}
+
+
+class ResponseCacheMixin:
+    """Cache list responses per user, action and query params
+
+    Keys include the user's data version, which the recipe signals bump
+    on every change, so entries are invalidated by writes of their owner
+    only and simply age out of the LRU cache afterwards.
+    """
+
+    def list(self, request, *args, **kwargs):
+        cache = get_response_cache()
+        if cache is None:
+            return super().list(request, *args, **kwargs)
+
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            _count('hits')
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        _count('misses')
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def get_response_cache_key(self, request):
+        """Return the cache key of the current list request"""
+        params = sorted(
+            (name, sorted(values))
+            for name, values in request.query_params.lists()
+        )
+        key = '{}:{}:{}:{}:{}:{}'.format(
+            request.user.pk,
+            get_data_version(request),
+            self.basename,
+            self.action,
+            request.get_host(),
+            params,
+        )
+        return 'response-cache:{}'.format(
+            hashlib.sha1(key.encode()).hexdigest()
+        )
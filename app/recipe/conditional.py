@@ -0,0 +1,84 @@
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+
+class NotModified(APIException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+
+    def __init__(self, etag):
+        super().__init__()
+        self.etag = etag
+
+
+def get_data_version(request):
+    """Return the recipe data version of the requesting user
+
+    The value is read once per request and remembered on it.
+    """
+    if not hasattr(request, '_data_version'):
+        request._data_version = get_user_model().objects.filter(
+            pk=request.user.pk
+        ).values_list('data_version', flat=True).first()
+    return request._data_version
+
+
+class DataVersionETagMixin:
+    """Answer safe requests with an ETag derived from the data version
+
+    The tag covers the user's data version, the full path and the Accept
+    header, so a matching If-None-Match gets a 304 before any recipe,
+    tag or ingredient query runs. Actions whose responses do not follow
+    the data version are listed in etag_exempt_actions.
+    """
+    etag_exempt_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = None
+        if request.method not in ('GET', 'HEAD') or \
+                self.action in self.etag_exempt_actions:
+            return
+
+        self.etag = self.get_etag(request)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            etags = [etag.replace('W/', '', 1)
+                     for etag in parse_etags(if_none_match)]
+            if '*' in etags or self.etag in etags:
+                raise NotModified(self.etag)
+
+    def get_etag(self, request):
+        """Return a strong ETag for the current request"""
+        key = '{}:{}:{}:{}'.format(
+            request.user.pk,
+            get_data_version(request),
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT', ''),
+        )
+        return '"{}"'.format(hashlib.sha1(key.encode()).hexdigest())
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(
+                status=exc.status_code,
+                headers=self._conditional_headers(exc.etag)
+            )
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        etag = getattr(self, 'etag', None)
+        if etag and response.status_code == status.HTTP_200_OK:
+            for header, value in self._conditional_headers(etag).items():
+                response[header] = value
+        return response
+
+    def _conditional_headers(self, etag):
+        return {'ETag': etag, 'Cache-Control': 'private, no-cache'}
@@ -0,0 +1,55 @@
+import json
+from itertools import islice
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Render a list as newline delimited JSON"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, list):
+            data = [data]
+        return b''.join(iter_ndjson(data))
+
+
+def _dumps(item):
+    return json.dumps(
+        item, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')
+    ).encode('utf-8')
+
+
+def iter_ndjson(items):
+    """Yield every item as one line of JSON"""
+    for item in items:
+        yield _dumps(item) + b'\n'
+
+
+def iter_json_array(items):
+    """Yield items encoded one by one as a single JSON array"""
+    yield b'['
+    for position, item in enumerate(items):
+        yield (b',' if position else b'') + _dumps(item)
+    yield b']'
+
+
+def iter_representations(serializer, rows, chunk_size):
+    """Render values() rows chunk by chunk
+
+    Related objects are fetched once per chunk, so memory use depends on
+    the chunk size and not on the number of rows.
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        serializer.add_related(chunk)
+        for row in chunk:
+            yield serializer.row_to_representation(row)
@@ -0,0 +1,204 @@
+"""Thumbnails of recipe images
+
+Every uploaded image gets resized copies in each of SIZES as JPEG and,
+where Pillow supports it, WebP. They are written next to the original
+under names derived from it, so their URLs are known from the image
+column alone. Resizing runs in a process pool after the upload has been
+committed; until it finishes the derivative URLs answer 404 and clients
+fall back to the original.
+"""
+import logging
+import os
+import tempfile
+import threading
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, features
+
+from core.locks import advisory_lock
+
+
+SIZES = getattr(settings, 'RECIPE_IMAGE_SIZES', (128, 512, 1024))
+FORMATS = {
+    'jpeg': {'ext': 'jpg', 'quality': 85, 'optimize': True,
+             'progressive': True},
+    'webp': {'ext': 'webp', 'quality': 80, 'method': 4},
+}
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+
+
+def get_formats():
+    """Return the derivative formats this Pillow build can write"""
+    return [
+        name for name in FORMATS
+        if name != 'webp' or features.check('webp')
+    ]
+
+
+def derivative_name(name, size, image_format):
+    """Return the storage name of one derivative of an image"""
+    root, _ext = os.path.splitext(name)
+    return f'{root}_{size}.{FORMATS[image_format]["ext"]}'
+
+
+def derivative_names(name):
+    """Return {format: {size: name}} for all derivatives of an image"""
+    return {
+        image_format: {
+            size: derivative_name(name, size, image_format)
+            for size in SIZES
+        }
+        for image_format in get_formats()
+    }
+
+
+def _write(name, content):
+    """Put content at name in the default storage in one rename
+
+    Readers see the old file or the new one, never a missing or partly
+    written file, and concurrent writers of the same name do not clash.
+    """
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(handle, 'wb') as partial:
+            partial.write(content)
+        os.chmod(temporary, default_storage.file_permissions_mode or 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def generate_derivatives(name, replace=False):
+    """Write the missing derivatives of the stored image name
+
+    Identical uploads share their file and so its derivatives, which are
+    only written again with replace set.
+    """
+    missing = [
+        (size, image_format)
+        for size in SIZES
+        for image_format in get_formats()
+        if replace or
+        not default_storage.exists(derivative_name(name, size, image_format))
+    ]
+    if not missing:
+        return
+
+    with default_storage.open(name) as original:
+        image = Image.open(original)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+    for size in sorted({size for size, _image_format in missing}):
+        resized = image.copy()
+        # Never scales up, small originals are only re-encoded
+        resized.thumbnail((size, size), Image.LANCZOS)
+        for image_format in get_formats():
+            if (size, image_format) not in missing:
+                continue
+            options = dict(FORMATS[image_format])
+            options.pop('ext')
+            buffer = BytesIO()
+            resized.save(buffer, format=image_format.upper(), **options)
+            _write(
+                derivative_name(name, size, image_format),
+                buffer.getvalue()
+            )
+
+
+def delete_unused(name):
+    """Delete an image and its derivatives once no recipe refers to it
+
+    Stored images are shared between recipes with identical files, so
+    the recipes pointing at a name are its reference count. The check
+    runs after the transaction commits, under the lock that saving the
+    same content takes until its recipe is committed. Derivatives are
+    kept while a copy stored under another extension still uses them.
+    """
+    from core.models import Recipe
+
+    def delete():
+        root = os.path.splitext(name)[0]
+        with transaction.atomic():
+            advisory_lock(root)
+            used = set(
+                Recipe.objects.filter(
+                    image__startswith=f'{root}.'
+                ).values_list('image', flat=True)
+            )
+            if name in used:
+                return
+            storage = Recipe._meta.get_field('image').storage
+            storage.delete(name)
+            if used:
+                return
+            for names in derivative_names(name).values():
+                for derivative in names.values():
+                    default_storage.delete(derivative)
+
+    transaction.on_commit(delete)
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    # A pool inherited through fork() has no workers in this process
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = futures.ProcessPoolExecutor(
+                getattr(settings, 'RECIPE_IMAGE_WORKERS', 2)
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _discard_executor(executor):
+    global _executor
+    # A pool stays broken once a worker died, the next call builds a new one
+    with _lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logger.error(
+            'Generating image derivatives failed',
+            exc_info=future.exception()
+        )
+
+
+def schedule_derivatives(name):
+    """Generate derivatives of an image once the transaction commits
+
+    With RECIPE_IMAGE_WORKERS set to 0 they are generated in place. A
+    pool broken by a dead worker is replaced and the image submitted to
+    the new one; work lost with it is left to generate_recipe_derivatives.
+    """
+    def submit():
+        if not getattr(settings, 'RECIPE_IMAGE_WORKERS', 2):
+            generate_derivatives(name)
+            return
+        executor = _get_executor()
+        try:
+            future = executor.submit(generate_derivatives, name)
+        except BrokenProcessPool:
+            _discard_executor(executor)
+            future = _get_executor().submit(generate_derivatives, name)
+        future.add_done_callback(_log_failure)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,75 @@
+"""Tag/ingredient id -> recipe ids postings of every user
+
+Postings are cached under the data version of their owner, which every
+change to recipes, tags, ingredients or their links bumps in the
+database. Entries are never updated in place: a change makes every
+process read postings under the new version and the old ones expire.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from core.models import Recipe
+
+
+INDEX_TIMEOUT = getattr(settings, 'RECIPE_INDEX_TIMEOUT', 300)
+RELATIONS = ('tags', 'ingredients')
+
+
+def _cache_key(user_id, version, relation, related_id):
+    return f'recipe-index:{user_id}:{version}:{relation}:{related_id}'
+
+
+def _related_column(relation):
+    """Return the through table column holding the related object id"""
+    field = getattr(Recipe, relation).field
+    return f'{field.m2m_reverse_field_name()}_id'
+
+
+def build_postings(user_id, relation, related_ids):
+    """Return the recipe ids linked to each of related_ids"""
+    column = _related_column(relation)
+    through = getattr(Recipe, relation).through
+    rows = through.objects.filter(
+        recipe__user_id=user_id, **{f'{column}__in': related_ids}
+    ).values_list(column, 'recipe_id')
+    postings = {related_id: set() for related_id in related_ids}
+    for related_id, recipe_id in rows.iterator():
+        postings[related_id].add(recipe_id)
+
+    return postings
+
+
+def get_postings(user_id, version, relation, related_ids):
+    """Return the cached postings of related_ids, building missing ones"""
+    keys = {
+        _cache_key(user_id, version, relation, related_id): related_id
+        for related_id in related_ids
+    }
+    cached = cache.get_many(keys)
+    postings = {keys[key]: recipe_ids for key, recipe_ids in cached.items()}
+    missing = [
+        related_id for key, related_id in keys.items() if key not in cached
+    ]
+    if missing:
+        built = build_postings(user_id, relation, missing)
+        cache.set_many({
+            _cache_key(user_id, version, relation, related_id): recipe_ids
+            for related_id, recipe_ids in built.items()
+        }, INDEX_TIMEOUT)
+        postings.update(built)
+
+    return postings
+
+
+def match_recipes(user_id, version, relation, related_ids, match_all=False):
+    """Return ids of recipes linked to all or any of related_ids"""
+    postings = get_postings(user_id, version, relation, set(related_ids))
+    sets = list(postings.values())
+    if not sets:
+        return set()
+    if match_all:
+        # Intersect starting from the shortest list to keep it cheap
+        sets.sort(key=len)
+        return set(sets[0]).intersection(*sets[1:])
+
+    return set().union(*sets)
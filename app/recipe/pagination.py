@@ -0,0 +1,182 @@
+import math
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+from recipe.search import RANK_FIELD
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Keyset pagination over (<ordering field>, id)
+
+    The cursor stores the ordering value and the id of the last row seen,
+    so every page is a single range scan on the matching
+    (user, <field>, id) index no matter how deep the client pages.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering_param = 'ordering'
+    ordering_fields = ('id', 'time_minutes', 'price')
+    default_ordering = '-id'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def get_ordering(self, request, queryset, view):
+        """Return the requested ordering with id as a tie-breaker"""
+        fields, default = self.ordering_fields, self.default_ordering
+        if RANK_FIELD in queryset.query.annotations:
+            # Search results are ranked best first unless asked otherwise
+            fields, default = fields + (RANK_FIELD,), f'-{RANK_FIELD}'
+
+        ordering = request.query_params.get(
+            self.ordering_param, default
+        ).strip()
+        if ordering.lstrip('-') not in fields:
+            ordering = default
+
+        direction = '-' if ordering.startswith('-') else ''
+        field = ordering.lstrip('-')
+        if field == 'id':
+            return (ordering,)
+
+        return (ordering, f'{direction}id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.model = queryset.model
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.field = self.ordering[0].lstrip('-')
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, position = False, None
+        else:
+            reverse, position = self.cursor
+
+        if reverse:
+            ordering = [self._flip(order) for order in self.ordering]
+        else:
+            ordering = list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering[0], position))
+
+        # Fetch one extra row to find out if there is another page.
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+
+        position = self._get_position_from_instance(self.page[-1])
+        return self.encode_cursor((False, position))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+
+        position = self._get_position_from_instance(self.page[0])
+        return self.encode_cursor((True, position))
+
+    def decode_cursor(self, request):
+        """Return a (reverse, position) pair from the request cursor"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        # A cursor is only meaningful for the ordering it was issued for.
+        fields = ('id',) if self.field == 'id' else (self.field, 'id')
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            field = tokens['f'][0]
+            position = tokens['p']
+            if field != self.field or len(position) != len(fields):
+                raise ValueError('Cursor of another ordering')
+            position = [
+                self._to_python(name, value)
+                for name, value in zip(fields, position)
+            ]
+        except (TypeError, ValueError, KeyError, UnicodeError,
+                ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return reverse, position
+
+    def encode_cursor(self, cursor):
+        """Return the page URL with the given cursor encoded in it"""
+        reverse, position = cursor
+        tokens = {'f': self.field, 'p': position}
+        if reverse:
+            tokens['r'] = '1'
+
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded
+        )
+
+    def _get_position_from_instance(self, instance, ordering=None):
+        """Return the keyset values of an instance as strings"""
+        if isinstance(instance, dict):
+            values = [instance[self.field], instance['id']]
+        else:
+            values = [getattr(instance, self.field), instance.id]
+
+        if self.field == 'id':
+            values = values[:1]
+        return [str(value) for value in values]
+
+    def _to_python(self, name, value):
+        """Convert a cursor value to the type of its ordering field"""
+        if name == RANK_FIELD:
+            value = float(value)
+        else:
+            value = self.model._meta.get_field(name).to_python(value)
+        # NaN and infinities would compare oddly or fail in the database
+        if value is None or not math.isfinite(value):
+            raise ValueError(f'Invalid {name} in cursor')
+        return value
+
+    def _after(self, order, position):
+        """Return a filter selecting rows after position in given order"""
+        lookup = 'lt' if order.startswith('-') else 'gt'
+        if self.field == 'id':
+            return Q(**{f'id__{lookup}': position[0]})
+
+        value, pk = position
+        return (
+            Q(**{f'{self.field}__{lookup}': value}) |
+            Q(**{self.field: value, f'id__{lookup}': pk})
+        )
+
+    @staticmethod
+    def _flip(order):
+        return order[1:] if order.startswith('-') else f'-{order}'
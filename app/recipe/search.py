@@ -0,0 +1,189 @@
+"""Full-text search over recipe titles, tag and ingredient names
+
+Documents live in a shadow table keyed by recipe id, created by the
+core 0012_recipe_search migration, and are kept up to date by the signal
+handlers in recipe.signals. PostgreSQL stores a weighted tsvector behind
+a GIN index, SQLite uses an FTS5 virtual table so the same API can be
+exercised locally. Other databases fall back to an unindexed title scan.
+"""
+from django.db import connections, router
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+from core.models import Recipe
+
+
+RANK_FIELD = 'search_rank'
+
+# Names of a recipe's tags and ingredients as space separated strings,
+# correlated on the outer core_recipe row aliased as "r".
+_RELATED_NAMES = {
+    'postgresql': (
+        "SELECT string_agg(t.name, ' ') FROM core_recipe_tags rt "
+        "JOIN core_tag t ON t.id = rt.tag_id WHERE rt.recipe_id = r.id",
+        "SELECT string_agg(i.name, ' ') FROM core_recipe_ingredients ri "
+        "JOIN core_ingredient i ON i.id = ri.ingredient_id "
+        "WHERE ri.recipe_id = r.id",
+    ),
+    'sqlite': (
+        "SELECT group_concat(t.name, ' ') FROM core_recipe_tags rt "
+        "JOIN core_tag t ON t.id = rt.tag_id WHERE rt.recipe_id = r.id",
+        "SELECT group_concat(i.name, ' ') FROM core_recipe_ingredients ri "
+        "JOIN core_ingredient i ON i.id = ri.ingredient_id "
+        "WHERE ri.recipe_id = r.id",
+    ),
+}
+
+
+class PostgresSearchBackend:
+    """tsvector documents in core_recipe_search behind a GIN index"""
+    table = 'core_recipe_search'
+    config = 'english'
+
+    def update(self, cursor, recipe_ids):
+        self._upsert(cursor, 'r.id = ANY(%s)', [list(recipe_ids)])
+
+    def delete(self, cursor, recipe_ids):
+        cursor.execute(
+            f'DELETE FROM {self.table} WHERE recipe_id = ANY(%s)',
+            [list(recipe_ids)]
+        )
+
+    def _upsert(self, cursor, where, params):
+        tags_sql, ingredients_sql = _RELATED_NAMES['postgresql']
+        cursor.execute(
+            f'INSERT INTO {self.table} (recipe_id, user_id, document) '
+            'SELECT r.id, r.user_id, '
+            ' setweight(to_tsvector(%s, r.title), \'A\') || '
+            f' setweight(to_tsvector(%s, coalesce(({tags_sql}), \'\')), '
+            '  \'B\') || '
+            f' setweight(to_tsvector(%s, coalesce(({ingredients_sql}), '
+            '  \'\')), \'B\') '
+            f'FROM core_recipe r WHERE {where} '
+            'ON CONFLICT (recipe_id) DO UPDATE '
+            'SET user_id = EXCLUDED.user_id, document = EXCLUDED.document',
+            [self.config, self.config, self.config] + params
+        )
+
+    def filter(self, queryset, user, query):
+        matches = (
+            f'core_recipe.id IN (SELECT recipe_id FROM {self.table} '
+            'WHERE user_id = %s AND document @@ plainto_tsquery(%s, %s))'
+        )
+        rank = RawSQL(
+            'SELECT ts_rank(document, plainto_tsquery(%s, %s))::float8 '
+            f'FROM {self.table} WHERE recipe_id = core_recipe.id',
+            (self.config, query),
+            output_field=FloatField()
+        )
+        return queryset.extra(
+            where=[matches], params=[user.id, self.config, query]
+        ).annotate(**{RANK_FIELD: rank})
+
+
+class SqliteSearchBackend:
+    """FTS5 shadow table with the recipe id as its rowid"""
+    table = 'core_recipe_fts'
+
+    def update(self, cursor, recipe_ids):
+        recipe_ids = list(recipe_ids)
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        self.delete(cursor, recipe_ids)
+        self._insert(cursor, f'r.id IN ({placeholders})', recipe_ids)
+
+    def delete(self, cursor, recipe_ids):
+        recipe_ids = list(recipe_ids)
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        cursor.execute(
+            f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})',
+            recipe_ids
+        )
+
+    def _insert(self, cursor, where, params):
+        tags_sql, ingredients_sql = _RELATED_NAMES['sqlite']
+        cursor.execute(
+            f'INSERT INTO {self.table} '
+            '(rowid, title, tags, ingredients, user_id) '
+            f'SELECT r.id, r.title, coalesce(({tags_sql}), \'\'), '
+            f'coalesce(({ingredients_sql}), \'\'), r.user_id '
+            f'FROM core_recipe r WHERE {where}',
+            params
+        )
+
+    def filter(self, queryset, user, query):
+        match = self._match_expression(query)
+        matches = (
+            f'core_recipe.id IN (SELECT rowid FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND user_id = %s)'
+        )
+        # bm25() is lower for better matches, negate it so higher wins
+        rank = RawSQL(
+            f'SELECT -bm25({self.table}, 10.0, 5.0, 5.0) '
+            f'FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND rowid = core_recipe.id',
+            (match,),
+            output_field=FloatField()
+        )
+        return queryset.extra(
+            where=[matches], params=[match, user.id]
+        ).annotate(**{RANK_FIELD: rank})
+
+    def _match_expression(self, query):
+        """Quote every term so user input can not use FTS5 syntax"""
+        terms = query.split()
+        return ' '.join('"{}"'.format(term.replace('"', '""'))
+                        for term in terms)
+
+
+class ScanSearchBackend:
+    """Unindexed fallback for databases without a full-text engine"""
+
+    def update(self, cursor, recipe_ids):
+        pass
+
+    def delete(self, cursor, recipe_ids):
+        pass
+
+    def filter(self, queryset, user, query):
+        for term in query.split():
+            queryset = queryset.filter(title__icontains=term)
+        return queryset
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend(),
+    'sqlite': SqliteSearchBackend(),
+}
+
+
+def get_backend(using):
+    """Return the search backend for a database alias"""
+    vendor = connections[using].vendor
+    return BACKENDS.get(vendor, ScanSearchBackend())
+
+
+def update(recipe_ids, using=None):
+    """Re-index the given recipes"""
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return
+    using = using or router.db_for_write(Recipe)
+    with connections[using].cursor() as cursor:
+        get_backend(using).update(cursor, recipe_ids)
+
+
+def delete(recipe_ids, using=None):
+    """Remove the given recipes from the search index"""
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return
+    using = using or router.db_for_write(Recipe)
+    with connections[using].cursor() as cursor:
+        get_backend(using).delete(cursor, recipe_ids)
+
+
+def search(queryset, user, query):
+    """Restrict queryset to recipes matching query, annotated with rank"""
+    if not query.split():
+        return queryset
+    return get_backend(queryset.db).filter(queryset, user, query)
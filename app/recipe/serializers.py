@@ -1,6 +1,14 @@
+import decimal
+from collections import OrderedDict
+
+from django.core.files.storage import default_storage
+from django.db import router, transaction
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
 from core.models import Tag, Ingredient, Recipe
+from recipe import bulk, images
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -21,7 +29,231 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class UsageStatsSerializer(serializers.Serializer):
+    """Serializer for recipe statistics of a tag or ingredient"""
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    recipe_count = serializers.IntegerField()
+    avg_price = serializers.DecimalField(
+        max_digits=None, decimal_places=2, allow_null=True
+    )
+    min_price = serializers.DecimalField(
+        max_digits=None, decimal_places=2, allow_null=True
+    )
+    max_price = serializers.DecimalField(
+        max_digits=None, decimal_places=2, allow_null=True
+    )
+    avg_time_minutes = serializers.FloatField(allow_null=True)
+    min_time_minutes = serializers.IntegerField(allow_null=True)
+    max_time_minutes = serializers.IntegerField(allow_null=True)
+
+
+class NameListSerializer(serializers.Serializer):
+    """Serializer for a batch of tag or ingredient names"""
+    names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        allow_empty=False,
+        max_length=1000
+    )
+
+
+class DynamicFieldsMixin:
+    """Serializer mixin limiting and expanding fields on demand
+
+    Accepts a `fields` keyword with the names to keep and an `expand`
+    keyword with the relations to render nested, using the serializers
+    declared in `expandable_fields`.
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', ())
+        super().__init__(*args, **kwargs)
+
+        for name in expand:
+            if name in self.expandable_fields and name in self.fields:
+                self.fields[name] = self.expandable_fields[name](
+                    many=True, read_only=True
+                )
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class ImageDerivativesField(serializers.Field):
+    """URLs of an image and of its resized copies, by format and size"""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        name = getattr(value, 'name', value)
+        if not name:
+            return None
+
+        ret = OrderedDict([('original', self._url(name))])
+        for image_format, names in images.derivative_names(name).items():
+            ret[image_format] = OrderedDict(
+                (str(size), self._url(derivative))
+                for size, derivative in names.items()
+            )
+        return ret
+
+    def _url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class FiniteDecimalField(serializers.DecimalField):
+    """DecimalField rejecting signaling NaN as invalid
+
+    DRF compares the parsed value with itself to spot NaN, which raises
+    InvalidOperation for sNaN instead of failing validation.
+    """
+
+    def to_internal_value(self, data):
+        try:
+            return super().to_internal_value(data)
+        except decimal.InvalidOperation:
+            self.fail('invalid')
+
+
+def _decimal_to_representation(field):
+    """Return a fast to_representation for an already quantized Decimal"""
+    coerce_to_string = getattr(
+        field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING
+    )
+    if not coerce_to_string or field.localize:
+        return field.to_representation
+    exponent = -field.decimal_places
+
+    def to_representation(value):
+        if value.as_tuple().exponent == exponent:
+            return '{:f}'.format(value)
+        return field.to_representation(value)
+
+    return to_representation
+
+
+class RowListSerializer(serializers.ListSerializer):
+    """Render values() rows, fetching relations for all rows at once"""
+
+    def to_representation(self, data):
+        rows = list(data.all() if hasattr(data, 'all') else data)
+        if rows and isinstance(rows[0], dict):
+            self.child.add_related(rows)
+            return [self.child.row_to_representation(row) for row in rows]
+
+        return super().to_representation(rows)
+
+
+class RowRepresentationMixin:
+    """Serializer mixin rendering values() rows without model instances
+
+    Plain fields are copied from the row, many-to-many fields are read
+    from the through table with one query per relation, grouped by
+    recipe id, and rendered as ids or as nested dicts. Instances still
+    go through the regular ModelSerializer machinery.
+    """
+
+    def to_representation(self, instance):
+        if isinstance(instance, dict):
+            self.add_related([instance])
+            return self.row_to_representation(instance)
+
+        return super().to_representation(instance)
+
+    def add_related(self, rows):
+        """Store related ids or nested dicts on every row"""
+        model = self.Meta.model
+        row_ids = [row['id'] for row in rows]
+        for name, field in self.fields.items():
+            if field.write_only or name not in self._related_names():
+                continue
+            descriptor = getattr(model, name)
+            through = descriptor.through
+            source = descriptor.field.m2m_field_name()
+            target = descriptor.field.m2m_reverse_field_name()
+            links = through.objects.filter(
+                **{f'{source}_id__in': row_ids}
+            ).order_by(f'{target}_id')
+
+            grouped = {pk: [] for pk in row_ids}
+            if isinstance(field, serializers.ListSerializer):
+                names = list(field.child.fields)
+                values = links.values_list(
+                    f'{source}_id', *(f'{target}__{key}' for key in names)
+                )
+                for row_id, *related in values:
+                    grouped[row_id].append(OrderedDict(zip(names, related)))
+            else:
+                values = links.values_list(f'{source}_id', f'{target}_id')
+                for row_id, related_id in values:
+                    grouped[row_id].append(related_id)
+
+            for row in rows:
+                row[name] = grouped[row['id']]
+
+    def row_to_representation(self, row):
+        """Build the output dict of a row with related data attached"""
+        ret = OrderedDict()
+        for name, source, to_representation in self._row_fields():
+            value = row[source]
+            if to_representation is not None and value is not None:
+                value = to_representation(value)
+            ret[name] = value
+
+        return ret
+
+    def row_columns(self):
+        """Return the model columns needed to render the fields"""
+        concrete = {
+            field.name for field in self.Meta.model._meta.concrete_fields
+        }
+        return {'id'} | {
+            field.source for field in self._readable_fields
+            if field.source in concrete
+        }
+
+    def _related_names(self):
+        return {
+            field.name for field in self.Meta.model._meta.many_to_many
+        }
+
+    def _row_fields(self):
+        if not hasattr(self, '_row_fields_cache'):
+            row_fields = []
+            for field in self._readable_fields:
+                if isinstance(field, serializers.DecimalField):
+                    convert = _decimal_to_representation(field)
+                elif isinstance(field, (
+                        serializers.IntegerField,
+                        serializers.CharField,
+                        serializers.ManyRelatedField,
+                        serializers.ListSerializer)):
+                    # Rows already hold the rendered type
+                    convert = None
+                else:
+                    convert = field.to_representation
+                # Related fields are stored on the row under their name
+                source = field.source
+                if source == '*' or source in self._related_names():
+                    source = field.field_name
+                row_fields.append((field.field_name, source, convert))
+            self._row_fields_cache = row_fields
+
+        return self._row_fields_cache
+
+
+class RecipeSerializer(
+        RowRepresentationMixin,
+        DynamicFieldsMixin,
+        serializers.ModelSerializer):
     """Serialize a recipe"""
     ingredients = serializers.PrimaryKeyRelatedField(
         many=True,
@@ -31,14 +263,21 @@ class RecipeSerializer(serializers.ModelSerializer):
         many=True,
         queryset=Tag.objects.all()
     )
+    images = ImageDerivativesField(source='image')
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'title', 'ingredients', 'tags',
-            'time_minutes', 'price', 'link'
+            'time_minutes', 'price', 'link', 'images'
         )
         read_only_fields = ('id',)
+        list_serializer_class = RowListSerializer
+
+    expandable_fields = {
+        'tags': TagSerializer,
+        'ingredients': IngredientSerializer,
+    }
 
 
 class RecipeDetailSerializer(RecipeSerializer):
@@ -49,8 +288,133 @@ class RecipeDetailSerializer(RecipeSerializer):
 
 class RecipeImageSerializer(serializers.ModelSerializer):
     """Serializer for uploading images to recipe"""
+    images = ImageDerivativesField(source='image')
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'image', 'images')
+        read_only_fields = ('id',)
+
+    def save(self, **kwargs):
+        """Store the image and schedule its resized copies"""
+        # Keeps the stored file locked until the recipe refers to it
+        with transaction.atomic():
+            recipe = super().save(**kwargs)
+        if recipe.image:
+            images.schedule_derivatives(recipe.image.name)
+        return recipe
+
+
+class ChunkedUploadSerializer(serializers.Serializer):
+    """Serializer for starting a chunked image upload"""
+    id = serializers.CharField(read_only=True)
+    size = serializers.IntegerField(min_value=1)
+    offset = serializers.IntegerField(read_only=True)
+
+
+class BulkRecipeListSerializer(serializers.ListSerializer):
+    """Validate and insert many recipes with a fixed number of queries"""
+    max_items = 5000
+    batch_size = 1000
+    related = (
+        ('tags', 'tag_ids', Tag),
+        ('ingredients', 'ingredient_ids', Ingredient),
+    )
+
+    def to_internal_value(self, data):
+        """Validate every item, then all related ids in one query each"""
+        if not isinstance(data, list):
+            message = self.error_messages['not_a_list'].format(
+                input_type=type(data).__name__
+            )
+            raise serializers.ValidationError({
+                'non_field_errors': [message]
+            }, code='not_a_list')
+        if len(data) > self.max_items:
+            message = _('Ensure there are no more than {max} items.')
+            raise serializers.ValidationError({
+                'non_field_errors': [message.format(max=self.max_items)]
+            }, code='max_length')
+
+        values, errors = [], []
+        for item in data:
+            try:
+                values.append(self.child.run_validation(item))
+                errors.append({})
+            except serializers.ValidationError as exc:
+                values.append(None)
+                errors.append(exc.detail)
+
+        user = self.context['request'].user
+        does_not_exist = serializers.PrimaryKeyRelatedField \
+            .default_error_messages['does_not_exist']
+        for field_name, source, model in self.related:
+            requested = {
+                pk for value in values if value for pk in value[source]
+            }
+            existing = set(model.objects.filter(
+                user=user, id__in=requested
+            ).values_list('id', flat=True))
+            for value, error in zip(values, errors):
+                if not value:
+                    continue
+                missing = [pk for pk in value[source] if pk not in existing]
+                if missing:
+                    error[field_name] = [
+                        does_not_exist.format(pk_value=pk) for pk in missing
+                    ]
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return values
+
+    def create(self, validated_data):
+        """Insert recipes and their tag/ingredient links in bulk"""
+        recipes = [
+            Recipe(**{
+                key: value for key, value in item.items()
+                if key not in ('tag_ids', 'ingredient_ids')
+            })
+            for item in validated_data
+        ]
+
+        related_ids = {}
+        for field_name, source, _model in self.related:
+            related_ids[field_name] = [
+                list(dict.fromkeys(item[source])) for item in validated_data
+            ]
+            for recipe, ids in zip(recipes, related_ids[field_name]):
+                setattr(recipe, source, ids)
+
+        using = router.db_for_write(Recipe)
+        with transaction.atomic(using=using):
+            bulk.insert_recipes(
+                recipes, related_ids, using, batch_size=self.batch_size
+            )
+            bulk.recipes_created(recipes, using)
+
+        return recipes
+
+
+class RecipeBulkSerializer(serializers.ModelSerializer):
+    """Serialize a recipe created through the bulk endpoint"""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(),
+        source='ingredient_ids',
+        default=list
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        source='tag_ids',
+        default=list
+    )
 
     class Meta:
         model = Recipe
-        fields = ('id', 'image')
+        fields = (
+            'id', 'title', 'ingredients', 'tags',
+            'time_minutes', 'price', 'link'
+        )
         read_only_fields = ('id',)
+        list_serializer_class = BulkRecipeListSerializer
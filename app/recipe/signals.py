@@ -0,0 +1,143 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_init, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from core.models import Tag, Ingredient, Recipe
+from recipe import images, search, usage
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe_document(sender, instance, **kwargs):
+    """Re-index the search document of a saved recipe"""
+    search.update([instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_search_documents(sender, instance, action, reverse, pk_set,
+                            **kwargs):
+    """Re-index recipes whose tags or ingredients changed"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            search.update([instance.pk])
+    elif action == 'pre_clear':
+        instance._search_recipe_ids = list(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+    elif action == 'post_clear':
+        search.update(instance.__dict__.pop('_search_recipe_ids', ()))
+    elif action in ('post_add', 'post_remove'):
+        search.update(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def reindex_renamed(sender, instance, created, **kwargs):
+    """Re-index recipes using a tag or ingredient that was saved"""
+    if not created:
+        search.update(instance.recipe_set.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_linked_recipes(sender, instance, **kwargs):
+    instance._search_recipe_ids = list(
+        instance.recipe_set.values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def reindex_unlinked(sender, instance, **kwargs):
+    """Re-index recipes that lost a deleted tag or ingredient"""
+    search.update(instance.__dict__.pop('_search_recipe_ids', ()))
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_document(sender, instance, **kwargs):
+    search.delete([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def bump_data_version(sender, instance, **kwargs):
+    """Invalidate ETags of the owner when recipe data changes"""
+    get_user_model().objects.bump_data_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def bump_data_version_links(sender, instance, action, **kwargs):
+    """Invalidate ETags of the owner when recipe links change"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        get_user_model().objects.bump_data_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_usage_counts(sender, instance, action, reverse, model, pk_set,
+                        **kwargs):
+    """Recount recipes of tags or ingredients whose links changed"""
+    if not usage.counts_enabled():
+        return
+
+    if reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            usage.refresh(type(instance), [instance.pk])
+    elif action == 'pre_clear':
+        instance._usage_ids = list(
+            getattr(instance, usage.RELATIONS[model]).values_list(
+                'id', flat=True
+            )
+        )
+    elif action == 'post_clear':
+        usage.refresh(model, instance.__dict__.pop('_usage_ids', ()))
+    elif action in ('post_add', 'post_remove'):
+        usage.refresh(model, pk_set)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_used_attributes(sender, instance, **kwargs):
+    if usage.counts_enabled():
+        instance._usage_ids = {
+            model: list(getattr(instance, relation).values_list(
+                'id', flat=True
+            ))
+            for model, relation in usage.RELATIONS.items()
+        }
+
+
+@receiver(post_delete, sender=Recipe)
+def recount_unused_attributes(sender, instance, **kwargs):
+    """Recount tags and ingredients of a deleted recipe"""
+    for model, ids in instance.__dict__.pop('_usage_ids', {}).items():
+        usage.refresh(model, ids)
+
+
+@receiver(post_init, sender=Recipe)
+def remember_image(sender, instance, **kwargs):
+    image = instance.__dict__.get('image')
+    instance._stored_image = getattr(image, 'name', image)
+
+
+@receiver(post_save, sender=Recipe)
+def release_replaced_image(sender, instance, **kwargs):
+    """Drop the previous image file when no other recipe shares it"""
+    previous = instance.__dict__.get('_stored_image')
+    current = instance.image.name
+    if previous and previous != current:
+        images.delete_unused(previous)
+    instance._stored_image = current
+
+
+@receiver(post_delete, sender=Recipe)
+def release_deleted_image(sender, instance, **kwargs):
+    """Drop the image file of a deleted recipe unless it is shared"""
+    if instance.image:
+        images.delete_unused(instance.image.name)
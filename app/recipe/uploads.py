@@ -0,0 +1,226 @@
+"""Chunked, resumable recipe image uploads
+
+A client opens an upload with the total size, sends the bytes in any
+number of requests each carrying the offset it starts at, then
+finalizes it. Chunks are streamed to a part file under MEDIA_ROOT so
+memory use does not grow with the image, and after a dropped connection
+the client reads the current offset back and resumes from there.
+
+The image header is checked as soon as enough bytes arrived, without
+decoding any pixels, so a wrong file type or oversized image is turned
+away early instead of after the whole transfer.
+"""
+import fcntl
+import json
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.utils.translation import gettext_lazy as _
+from PIL import Image
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+
+
+MAX_SIZE = getattr(settings, 'RECIPE_UPLOAD_MAX_SIZE', 20 * 1024 * 1024)
+EXPIRY = getattr(settings, 'RECIPE_UPLOAD_EXPIRY', 24 * 60 * 60)
+# A header not parsed within this many bytes is treated as invalid
+HEADER_LIMIT = 256 * 1024
+BLOCK_SIZE = 64 * 1024
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+SIGNATURES = (
+    (0, b'\xff\xd8\xff'),
+    (0, b'\x89PNG\r\n\x1a\n'),
+    (0, b'GIF87a'),
+    (0, b'GIF89a'),
+    (8, b'WEBP'),
+)
+
+
+class UploadConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = _('Upload offset does not match.')
+    default_code = 'upload_offset'
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = _('Upload exceeds its declared size.')
+    default_code = 'upload_size'
+
+
+class PartFile(File):
+    """A finished part file, moved rather than copied into storage"""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def _directory():
+    return os.path.join(settings.MEDIA_ROOT, 'uploads', 'partial')
+
+
+def _known_signature(head):
+    if len(head) < 12:
+        return None
+    return any(head[start:start + len(magic)] == magic
+               for start, magic in SIGNATURES)
+
+
+class ChunkedUpload:
+    """An upload in progress, stored as a part file and its metadata"""
+
+    def __init__(self, upload_id, meta):
+        self.id = upload_id
+        self.meta = meta
+
+    @classmethod
+    def create(cls, user_id, recipe_id, size):
+        """Start an upload of size bytes to the image of a recipe"""
+        if size > MAX_SIZE:
+            raise UploadTooLarge(
+                _('Uploads are limited to {} bytes.').format(MAX_SIZE)
+            )
+        os.makedirs(_directory(), exist_ok=True)
+        purge_expired()
+
+        upload = cls(uuid.uuid4().hex, {
+            'user': user_id,
+            'recipe': recipe_id,
+            'size': size,
+            'created': time.time(),
+        })
+        open(upload.part_path, 'xb').close()
+        upload._save_meta()
+        return upload
+
+    @classmethod
+    def get(cls, upload_id, user_id, recipe_id):
+        """Return an upload of the user to the recipe or raise NotFound"""
+        upload = cls(upload_id, None)
+        try:
+            with open(upload.meta_path) as meta_file:
+                upload.meta = json.load(meta_file)
+        except (OSError, ValueError):
+            raise NotFound()
+        if upload.meta['user'] != user_id or \
+                upload.meta['recipe'] != recipe_id:
+            raise NotFound()
+        return upload
+
+    @property
+    def part_path(self):
+        return os.path.join(_directory(), f'{self.id}.part')
+
+    @property
+    def meta_path(self):
+        return os.path.join(_directory(), f'{self.id}.json')
+
+    @property
+    def size(self):
+        return self.meta['size']
+
+    @property
+    def offset(self):
+        return os.path.getsize(self.part_path)
+
+    @property
+    def format(self):
+        return self.meta.get('format')
+
+    def _save_meta(self):
+        temporary = f'{self.meta_path}.tmp'
+        with open(temporary, 'w') as meta_file:
+            json.dump(self.meta, meta_file)
+        os.replace(temporary, self.meta_path)
+
+    def append(self, stream, offset):
+        """Write the stream at offset and return the new offset"""
+        with open(self.part_path, 'ab') as part:
+            # Chunks sent twice in parallel must not both be appended
+            fcntl.flock(part, fcntl.LOCK_EX)
+            current = part.seek(0, os.SEEK_END)
+            if offset != current:
+                raise UploadConflict(
+                    _('Expected offset {}.').format(current)
+                )
+
+            written = current
+            while stream is not None:
+                block = stream.read(BLOCK_SIZE)
+                if not block:
+                    break
+                written += len(block)
+                if written > self.size:
+                    part.truncate(current)
+                    raise UploadTooLarge()
+                part.write(block)
+            part.flush()
+
+        if self.format is None:
+            self._check_header(written)
+        return written
+
+    def _check_header(self, offset):
+        """Identify the image once its header is complete"""
+        with open(self.part_path, 'rb') as part:
+            head = part.read(12)
+        if _known_signature(head) is False:
+            self._reject(_('Upload a JPEG, PNG, GIF or WebP image.'))
+
+        try:
+            with Image.open(self.part_path) as image:
+                image_format, (width, height) = image.format, image.size
+        except Image.DecompressionBombError:
+            self._reject(_('The image has too many pixels.'))
+        except Exception:
+            # Most likely a header that is still incomplete
+            if offset >= min(HEADER_LIMIT, self.size):
+                self._reject(_('The file is not a valid image.'))
+            return
+
+        if image_format not in EXTENSIONS:
+            self._reject(_('Upload a JPEG, PNG, GIF or WebP image.'))
+        self.meta.update(format=image_format, width=width, height=height)
+        self._save_meta()
+
+    def _reject(self, message):
+        self.delete()
+        raise ValidationError({'image': [message]})
+
+    def finish(self):
+        """Return the complete image as a file ready to be stored"""
+        if self.offset != self.size:
+            raise UploadConflict(
+                _('Upload is incomplete at offset {}.').format(self.offset)
+            )
+        if self.format is None:
+            self._check_header(self.offset)
+        try:
+            with Image.open(self.part_path) as image:
+                image.verify()
+        except Exception:
+            self._reject(_('The file is not a valid image.'))
+
+        return PartFile(
+            open(self.part_path, 'rb'),
+            name=f'upload.{EXTENSIONS[self.format]}'
+        )
+
+    def delete(self):
+        for path in (self.part_path, self.meta_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def purge_expired():
+    """Remove uploads that received no data for EXPIRY seconds"""
+    deadline = time.time() - EXPIRY
+    for entry in os.scandir(_directory()):
+        if entry.name.endswith('.part') and \
+                entry.stat().st_mtime < deadline:
+            ChunkedUpload(entry.name[:-len('.part')], None).delete()
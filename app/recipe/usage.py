@@ -0,0 +1,86 @@
+"""Recipe usage of tags and ingredients
+
+assigned_only used to join the whole through table and dedupe with
+DISTINCT. It is now a correlated EXISTS probe, or, with the
+RECIPE_USAGE_COUNTS setting on, a filter on the usage_count column that
+the signal handlers in recipe.signals keep up to date.
+"""
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from core.locks import advisory_locks
+from core.models import Ingredient, Recipe, Tag
+
+
+RELATIONS = {Tag: 'tags', Ingredient: 'ingredients'}
+
+
+def counts_enabled():
+    """Return True when usage_count columns are maintained"""
+    return getattr(settings, 'RECIPE_USAGE_COUNTS', False)
+
+
+def _through(model):
+    field = getattr(Recipe, RELATIONS[model]).field
+    return field.remote_field.through, f'{field.m2m_reverse_field_name()}_id'
+
+
+def assigned_exists(queryset):
+    """Restrict queryset to objects linked to a recipe with EXISTS"""
+    through, column = _through(queryset.model)
+    links = through.objects.filter(**{column: OuterRef('pk')})
+    return queryset.annotate(assigned=Exists(links)).filter(assigned=True)
+
+
+def assigned_counted(queryset):
+    """Restrict queryset to objects linked to a recipe by usage_count"""
+    return queryset.filter(usage_count__gt=0)
+
+
+def assigned(queryset):
+    """Restrict queryset to objects linked to at least one recipe"""
+    if counts_enabled():
+        return assigned_counted(queryset)
+    return assigned_exists(queryset)
+
+
+def refresh(model, ids=None, using=None):
+    """Recount linked recipes of the given objects, of all when ids is None
+
+    Counting again instead of adding deltas keeps the column right under
+    concurrent link changes, provided concurrent recounts of an object
+    run one after the other: under READ COMMITTED an UPDATE waiting for
+    another one still counts with the links it saw before waiting. The
+    objects are locked first, so the recount starts after earlier ones
+    committed and sees their links. Row locks would deadlock with the
+    key share locks adding links takes, advisory locks do not.
+    """
+    using = using or router.db_for_write(model)
+    through, column = _through(model)
+    count = through.objects.filter(
+        **{column: OuterRef('pk')}
+    ).order_by().values(column).annotate(n=Count('*')).values('n')
+    queryset = model.objects.db_manager(using).all()
+    if ids is not None:
+        queryset = queryset.filter(pk__in=ids)
+
+    with transaction.atomic(using=using):
+        advisory_locks((
+            f'usage:{model._meta.label}:{pk}'
+            for pk in queryset.values_list('pk', flat=True)
+        ), using)
+        return queryset.update(usage_count=Coalesce(
+            Subquery(count, output_field=IntegerField()), 0
+        ))
+
+
+def refresh_for_recipes(recipe_ids, using=None):
+    """Recount tags and ingredients linked to the given recipes"""
+    for model in RELATIONS:
+        through, column = _through(model)
+        linked = through.objects.using(using).filter(
+            recipe_id__in=recipe_ids
+        ).values(column)
+        refresh(model, linked, using)
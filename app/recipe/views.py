@@ -1,19 +1,33 @@
+from django.db import transaction
+from django.db.models import Avg, Count, FloatField, Max, Min
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils.translation import gettext_lazy as _
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
+from rest_framework import fields, viewsets, mixins, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 
 from core.models import Tag, Ingredient, Recipe
-from recipe import serializers
+from recipe import (
+    bulk, export, images, index, search, serializers, uploads, usage
+)
+from recipe.caching import ResponseCacheMixin
+from recipe.conditional import DataVersionETagMixin, get_data_version
+from recipe.pagination import RecipeCursorPagination
+from user.authentication import CachingTokenAuthentication
 
 
 class BaseRecipeAttrViewSet(
+        DataVersionETagMixin,
+        ResponseCacheMixin,
         viewsets.GenericViewSet,
         mixins.ListModelMixin,
         mixins.CreateModelMixin):
     """Base viewset for user owned recipe attributes"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachingTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
@@ -21,17 +35,61 @@ class BaseRecipeAttrViewSet(
         assigned_only = bool(
             int(self.request.query_params.get('assigned_only', 0))
         )
-        queryset = self.queryset
+        queryset = self.queryset.filter(user=self.request.user)
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+            queryset = usage.assigned(queryset)
 
-        return queryset.filter(
-            user=self.request.user
-        ).order_by('-name').distinct()
+        return queryset.order_by('-name')
 
     def perform_create(self, serializer):
-        """Create a new object."""
-        serializer.save(user=self.request.user)
+        """Create a new object or reuse the one with the same name"""
+        # Not unpacked into _, which is gettext in this module
+        serializer.instance = self.queryset.model.objects.get_or_create(
+            user=self.request.user,
+            **serializer.validated_data
+        )[0]
+
+    @action(methods=['POST'], detail=False)
+    def bulk(self, request):
+        """Get or create many objects by name"""
+        serializer = serializers.NameListSerializer(data=request.data)
+
+        if serializer.is_valid():
+            names = serializer.validated_data['names']
+            objects = bulk.get_or_create_by_name(
+                self.queryset.model, request.user.pk, names
+            )
+            return Response(
+                self.get_serializer(
+                    [objects[name] for name in dict.fromkeys(names)],
+                    many=True
+                ).data,
+                status=status.HTTP_200_OK
+            )
+
+        return Response(
+            serializer.errors,
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    @action(methods=['GET'], detail=False)
+    def stats(self, request):
+        """Return recipe statistics per object in one grouped query"""
+        rows = self.queryset.filter(user=request.user).values(
+            'id', 'name'
+        ).annotate(
+            recipe_count=Count('recipe'),
+            avg_price=Avg('recipe__price'),
+            min_price=Min('recipe__price'),
+            max_price=Max('recipe__price'),
+            avg_time_minutes=Avg(
+                'recipe__time_minutes', output_field=FloatField()
+            ),
+            min_time_minutes=Min('recipe__time_minutes'),
+            max_time_minutes=Max('recipe__time_minutes'),
+        ).order_by('-recipe_count', 'name')
+
+        return Response(serializers.UsageStatsSerializer(rows, many=True).data)
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
@@ -46,37 +104,154 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
     serializer_class = serializers.IngredientSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+        DataVersionETagMixin,
+        ResponseCacheMixin,
+        viewsets.ModelViewSet):
     """Manage recipes in the database"""
     serializer_class = serializers.RecipeSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachingTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipeCursorPagination
+    etag_exempt_actions = ('upload',)
+    export_chunk_size = 500
+    range_filters = {
+        'min_time': ('time_minutes__gte', fields.IntegerField(
+            min_value=0, max_value=2 ** 31 - 1
+        )),
+        'max_time': ('time_minutes__lte', fields.IntegerField(
+            min_value=0, max_value=2 ** 31 - 1
+        )),
+        'min_price': ('price__gte', serializers.FiniteDecimalField(5, 2)),
+        'max_price': ('price__lte', serializers.FiniteDecimalField(5, 2)),
+    }
 
-    def _params_to_ints(self, qs):
+    id_field = fields.IntegerField(min_value=1, max_value=2 ** 31 - 1)
+
+    def _params_to_ints(self, name, qs):
         """Convert a list of string IDs to a list of integers"""
-        return [int(str_id) for str_id in qs.split(',')]
+        try:
+            return [
+                self.id_field.run_validation(str_id)
+                for str_id in qs.split(',') if str_id.strip()
+            ]
+        except ValidationError as error:
+            raise ValidationError({name: error.detail})
 
     def get_queryset(self):
         """Retrive the recipes for the authenticated user"""
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
-        queryset = self.queryset
-        if tags:
-            tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
-        if ingredients:
-            ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
-
-        return queryset.filter(user=self.request.user)
+        queryset = self.queryset.filter(
+            user=self.request.user, **self._range_lookups()
+        )
+        recipe_ids = self._matching_recipe_ids()
+        if recipe_ids is not None:
+            queryset = queryset.filter(id__in=recipe_ids)
+        query = self.request.query_params.get('search')
+        if query:
+            queryset = search.search(queryset, self.request.user, query)
+        if self.action in ('list', 'retrieve'):
+            # Read serializers render plain rows, see RowRepresentationMixin
+            queryset = queryset.values(*self._requested_columns(queryset))
+
+        return queryset
+
+    def _query_param_list(self, name):
+        """Return a comma separated query param as a tuple of names"""
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        return tuple(item.strip() for item in value.split(',') if item)
+
+    def _requested_fields(self):
+        """Return the fields asked for with ?fields=, None for all"""
+        if self.action not in ('list', 'retrieve'):
+            return None
+        return self._query_param_list('fields')
+
+    def _expanded_fields(self):
+        """Return the relations asked to be nested with ?expand="""
+        if self.action not in ('list', 'retrieve'):
+            return ()
+        return self._query_param_list('expand') or ()
+
+    def _requested_columns(self, queryset):
+        """Return the recipe columns needed to render requested fields"""
+        serializer = self.get_serializer_class()(
+            fields=self._requested_fields()
+        )
+        columns = serializer.row_columns()
+        if self.action == 'list':
+            # The paginator reads the ordering value of every row
+            ordering = self.paginator.get_ordering(
+                self.request, queryset, self
+            )
+            columns |= {order.lstrip('-') for order in ordering}
+
+        return columns
+
+    def _range_lookups(self):
+        """Return lookups for the time and price range query params"""
+        lookups = {}
+        errors = {}
+        for param, (lookup, field) in self.range_filters.items():
+            value = self.request.query_params.get(param)
+            if value is None:
+                continue
+            try:
+                lookups[lookup] = field.run_validation(value)
+            except ValidationError as error:
+                errors[param] = error.detail
+        if errors:
+            raise ValidationError(errors)
+
+        return lookups
+
+    def _matching_recipe_ids(self):
+        """Resolve tag and ingredient filters against the inverted index"""
+        match = self.request.query_params.get('match', 'any')
+        if match not in ('all', 'any'):
+            raise ValidationError({'match': _('Expected "all" or "any".')})
+
+        recipe_ids = None
+        for relation in index.RELATIONS:
+            related_ids = self._params_to_ints(
+                relation, self.request.query_params.get(relation, '')
+            )
+            if not related_ids:
+                continue
+            matched = index.match_recipes(
+                self.request.user.id,
+                get_data_version(self.request),
+                relation,
+                related_ids,
+                match_all=match == 'all'
+            )
+            if recipe_ids is None:
+                recipe_ids = matched
+            else:
+                recipe_ids &= matched
+
+        return recipe_ids
+
+    def get_serializer(self, *args, **kwargs):
+        """Pass sparse fieldset options to read serializers"""
+        if self.action in ('list', 'retrieve'):
+            kwargs.setdefault('fields', self._requested_fields())
+            kwargs.setdefault('expand', self._expanded_fields())
+
+        return super().get_serializer(*args, **kwargs)
 
     def get_serializer_class(self):
         """Return serializer class"""
         if self.action == "retrieve":
             return serializers.RecipeDetailSerializer
-        elif self.action == 'upload_image':
+        elif self.action in ('upload_image', 'finish_upload'):
             return serializers.RecipeImageSerializer
+        elif self.action in ('start_upload', 'upload'):
+            return serializers.ChunkedUploadSerializer
+        elif self.action == 'bulk':
+            return serializers.RecipeBulkSerializer
 
         return self.serializer_class
 
@@ -84,6 +259,55 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Create new recipe"""
         serializer.save(user=self.request.user)
 
+    @action(
+        methods=['GET'],
+        detail=False,
+        renderer_classes=(JSONRenderer, export.NDJSONRenderer)
+    )
+    def export(self, request):
+        """Stream all recipes of the user as JSON or NDJSON"""
+        serializer = serializers.RecipeDetailSerializer(
+            context=self.get_serializer_context()
+        )
+        columns = serializer.row_columns()
+        rows = self.get_queryset().order_by('id').values(
+            *columns
+        ).iterator(chunk_size=self.export_chunk_size)
+        items = export.iter_representations(
+            serializer, rows, self.export_chunk_size
+        )
+
+        renderer = request.accepted_renderer
+        if renderer.format == export.NDJSONRenderer.format:
+            content, extension = export.iter_ndjson(items), 'ndjson'
+        else:
+            content, extension = export.iter_json_array(items), 'json'
+        response = StreamingHttpResponse(
+            content,
+            content_type=renderer.media_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="recipes.{extension}"'
+        )
+        return response
+
+    @action(methods=['POST'], detail=False)
+    def bulk(self, request):
+        """Create many recipes in one transaction"""
+        serializer = self.get_serializer(data=request.data, many=True)
+
+        if serializer.is_valid():
+            serializer.save(user=self.request.user)
+            return Response(
+                serializer.data,
+                status=status.HTTP_201_CREATED
+            )
+
+        return Response(
+            serializer.errors,
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
         """Upload image to a recipe"""
@@ -104,3 +328,75 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    @action(methods=['POST'], detail=True, url_path='uploads')
+    def start_upload(self, request, pk=None):
+        """Start a chunked image upload of the given size"""
+        recipe = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        upload = uploads.ChunkedUpload.create(
+            request.user.pk, recipe.pk, serializer.validated_data['size']
+        )
+        location = reverse(
+            'recipe:recipe-upload', args=[recipe.pk, upload.id]
+        )
+        return Response(
+            self._upload_data(upload),
+            status=status.HTTP_201_CREATED,
+            headers={'Location': request.build_absolute_uri(location)}
+        )
+
+    @action(
+        methods=['GET', 'PATCH', 'DELETE'],
+        detail=True,
+        url_path=r'uploads/(?P<upload_id>[0-9a-f]{32})'
+    )
+    def upload(self, request, upload_id, pk=None):
+        """Show, append a chunk to or abort a chunked upload
+
+        Chunks are sent as the raw request body with the offset they
+        start at in an Upload-Offset header.
+        """
+        recipe = self.get_object()
+        upload = uploads.ChunkedUpload.get(
+            upload_id, request.user.pk, recipe.pk
+        )
+        if request.method == 'DELETE':
+            upload.delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if request.method == 'PATCH':
+            try:
+                offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+            except (KeyError, ValueError):
+                raise ValidationError(
+                    {'Upload-Offset': _('A byte offset is required.')}
+                )
+            upload.append(request.stream, offset)
+
+        data = self._upload_data(upload)
+        return Response(data, headers={'Upload-Offset': data['offset']})
+
+    @action(
+        methods=['POST'],
+        detail=True,
+        url_path=r'uploads/(?P<upload_id>[0-9a-f]{32})/finalize'
+    )
+    def finish_upload(self, request, upload_id, pk=None):
+        """Store a completed chunked upload as the recipe image"""
+        recipe = self.get_object()
+        upload = uploads.ChunkedUpload.get(
+            upload_id, request.user.pk, recipe.pk
+        )
+        with upload.finish() as content, transaction.atomic():
+            recipe.image.save(content.name, content)
+        upload.delete()
+        images.schedule_derivatives(recipe.image.name)
+
+        return Response(self.get_serializer(recipe).data)
+
+    def _upload_data(self, upload):
+        return self.get_serializer({
+            'id': upload.id, 'size': upload.size, 'offset': upload.offset
+        }).data
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework.authentication import TokenAuthentication
+
+
+CACHE_MAX_ENTRIES = getattr(settings, 'AUTH_TOKEN_CACHE_MAX_ENTRIES', 10000)
+CACHE_TIMEOUT = getattr(settings, 'AUTH_TOKEN_CACHE_TIMEOUT', 60)
+
+
+class TokenCache:
+    """Thread safe LRU map of token key -> user snapshot with a TTL
+
+    Entries are dropped on token or user changes by the handlers in
+    user.signals. Those only reach the current process, so the TTL bounds
+    how long other processes may keep a stale user.
+    """
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_user(self, user_id):
+        """Drop every token of a user"""
+        with self._lock:
+            for key, (_expires, snapshot) in list(self._entries.items()):
+                if snapshot.user_id == user_id:
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def get_stats(self):
+        """Return hit, miss and eviction counters and the hit ratio"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class TokenSnapshot:
+    """Field values of a token and its user, rebuilt per request
+
+    Each request gets its own model instances, so changes a view makes
+    to request.user never leak into the cache.
+    """
+    __slots__ = ('user_id', 'created', 'db', 'attnames', 'values')
+
+    def __init__(self, token):
+        user = token.user
+        self.user_id = user.pk
+        self.created = token.created
+        self.db = user._state.db
+        self.attnames = [
+            field.attname for field in user._meta.concrete_fields
+        ]
+        self.values = [getattr(user, name) for name in self.attnames]
+
+    def restore(self, model, key):
+        user = get_user_model().from_db(self.db, self.attnames, self.values)
+        token = model(key=key, user_id=self.user_id, created=self.created)
+        token._state.adding = False
+        token._state.db = self.db
+        token.user = user
+        return user, token
+
+
+token_cache = TokenCache(CACHE_MAX_ENTRIES, CACHE_TIMEOUT)
+
+
+class CachingTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that skips the token query on a cache hit"""
+    cache = token_cache
+
+    def authenticate_credentials(self, key):
+        snapshot = self.cache.get(key)
+        if snapshot is not None:
+            return snapshot.restore(self.get_model(), key)
+
+        user, token = super().authenticate_credentials(key)
+        self.cache.set(key, TokenSnapshot(token))
+        return user, token
+
+
+def get_stats():
+    """Return counters of the token cache"""
+    return token_cache.get_stats()
@@ -0,0 +1,208 @@
+"""Password hashing in a bounded process pool
+
+PBKDF2 keeps a CPU busy for a good part of a second. Running it in a
+small process pool keeps login and sign-up storms from occupying every
+server thread, and a bounded number of slots lets excess requests fail
+fast with a 503 instead of queueing behind each other.
+"""
+import os
+import threading
+import time
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+HASH_WORKERS = getattr(settings, 'PASSWORD_HASH_WORKERS', 2)
+HASH_QUEUE_SIZE = getattr(settings, 'PASSWORD_HASH_QUEUE_SIZE', 8)
+HASH_TIMEOUT = getattr(settings, 'PASSWORD_HASH_TIMEOUT', 5)
+HASH_RETRY_AFTER = getattr(settings, 'PASSWORD_HASH_RETRY_AFTER', 1)
+
+
+class HashingUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('Too many login attempts in progress, retry shortly.')
+    default_code = 'hashing_unavailable'
+    # Sent as Retry-After by the DRF exception handler
+    wait = HASH_RETRY_AFTER
+
+
+def _init_worker():
+    """Load settings in workers that were spawned instead of forked"""
+    if not apps.ready:
+        django.setup()
+
+
+def _timed(func, *args):
+    """Run func in a worker, returning its result with start and duration"""
+    started = time.time()
+    result = func(*args)
+    return result, started, time.time() - started
+
+
+class HashingPool:
+    """Process pool with a fixed number of running plus waiting slots
+
+    With no workers the functions run in the calling thread, still within
+    the slot limit.
+    """
+
+    def __init__(self, workers, queue_size, timeout):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + queue_size)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self.stats = {}
+
+    def _get_executor(self):
+        # A pool inherited through fork() has no workers in this process
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = futures.ProcessPoolExecutor(
+                    self.workers, initializer=_init_worker
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _discard(self, executor):
+        # A pool stays broken once a worker died, the next call builds
+        # a new one
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def _release(self, future):
+        # Work lost with a broken pool is redone holding the same slot
+        if future.cancelled() or not isinstance(
+                future.exception(), BrokenProcessPool):
+            self._slots.release()
+
+    def run(self, func, *args, timings=None):
+        """Return func(*args) computed in the pool
+
+        Raises HashingUnavailable when all slots are taken or the result
+        does not arrive in time. A slot stays taken until its work
+        finishes, also after a timeout. When a worker died the pool is
+        replaced and func runs in the calling thread instead. Stage
+        durations are added to timings.
+        """
+        if not self._slots.acquire(blocking=False):
+            self.record('rejected', 0)
+            raise HashingUnavailable()
+        submitted = time.time()
+        in_process = not self.workers
+        if self.workers:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(_timed, func, *args)
+            except BrokenProcessPool:
+                in_process = True
+            except BaseException:
+                self._slots.release()
+                raise
+            else:
+                # Held until the work is done, a timed out caller leaves
+                # it running in the pool
+                future.add_done_callback(self._release)
+                try:
+                    result, started, duration = future.result(self.timeout)
+                except futures.TimeoutError:
+                    future.cancel()
+                    self.record('timeout', time.time() - submitted)
+                    raise HashingUnavailable()
+                except BrokenProcessPool:
+                    in_process = True
+            if in_process:
+                self._discard(executor)
+                self.record('broken', time.time() - submitted)
+        if in_process:
+            try:
+                result, started, duration = _timed(func, *args)
+            finally:
+                self._slots.release()
+
+        self.record('queue', started - submitted, timings)
+        self.record('hash', duration, timings)
+        return result
+
+    def record(self, stage, seconds, timings=None):
+        """Add a stage duration to the pool stats and to timings"""
+        with self._lock:
+            count, total, longest = self.stats.get(stage, (0, 0.0, 0.0))
+            self.stats[stage] = (
+                count + 1, total + seconds, max(longest, seconds)
+            )
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def get_stats(self):
+        """Return count, mean and max milliseconds per stage"""
+        with self._lock:
+            return {
+                stage: {
+                    'count': count,
+                    'mean_ms': total / count * 1000,
+                    'max_ms': longest * 1000,
+                }
+                for stage, (count, total, longest) in self.stats.items()
+            }
+
+
+pool = HashingPool(HASH_WORKERS, HASH_QUEUE_SIZE, HASH_TIMEOUT)
+
+
+def make_password(password, timings=None):
+    """Hash a password in the pool"""
+    return pool.run(hashers.make_password, password, timings=timings)
+
+
+def verify_password(user, password, timings=None):
+    """Check a password against a user, None standing for no such user
+
+    Mirrors ModelBackend: unknown users cost one hash as well, and
+    passwords stored with an outdated hasher are upgraded.
+    """
+    if user is None or not user.has_usable_password():
+        make_password(password, timings)
+        return False
+
+    encoded = user.password
+    if not pool.run(hashers.check_password, password, encoded,
+                    timings=timings):
+        return False
+
+    preferred = hashers.get_hasher('default')
+    hasher = hashers.identify_hasher(encoded)
+    if (hasher.algorithm != preferred.algorithm or
+            preferred.must_update(encoded)):
+        user.password = make_password(password, timings)
+        user.save(update_fields=['password'])
+
+    return True
+
+
+def get_timings(request):
+    """Return the stage durations recorded for a request"""
+    if request is None:
+        return None
+    if not hasattr(request, '_hash_timings'):
+        request._hash_timings = {}
+    return request._hash_timings
+
+
+def server_timing(timings):
+    """Format stage durations as a Server-Timing header value"""
+    return ', '.join(
+        f'{stage};dur={seconds * 1000:.1f}'
+        for stage, seconds in timings.items()
+    )
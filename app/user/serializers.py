@@ -1,7 +1,11 @@
-from django.contrib.auth import get_user_model, authenticate
+import time
+
+from django.contrib.auth import get_user_model
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 
+from user import hashing
+
 
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for the user object"""
@@ -13,7 +17,17 @@ class UserSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         """Create a new user with encrypted password and return it"""
-        return get_user_model().objects.create_user(**validated_data)
+        password = hashing.make_password(
+            validated_data.pop('password'),
+            hashing.get_timings(self.context.get('request'))
+        )
+        model = get_user_model()
+        user = model(**validated_data)
+        user.email = model.objects.normalize_email(user.email)
+        user.password = password
+        user.save()
+
+        return user
 
     def update(self, instance, validated_data):
         """Update a user, setting the password correctly and return it"""
@@ -39,12 +53,17 @@ class AuthTokenSerializer(serializers.Serializer):
         email = attrs.get('email')
         password = attrs.get('password')
 
-        user = authenticate(
-            request=self.context.get('request'),
-            username=email,
-            password=password
-        )
-        if not user:
+        timings = hashing.get_timings(self.context.get('request'))
+
+        started = time.time()
+        model = get_user_model()
+        user = model._default_manager.filter(
+            **{model.USERNAME_FIELD: email}
+        ).first()
+        hashing.pool.record('lookup', time.time() - started, timings)
+
+        if not hashing.verify_password(user, password, timings) or \
+                not user.is_active:
             msg = _('Unable to authenticate with provided cridentials')
             raise serializers.ValidationError(msg, code='authentication')
 
@@ -0,0 +1,20 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from user.authentication import token_cache
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def forget_token(sender, instance, **kwargs):
+    """Stop authenticating a changed or deleted token from the cache"""
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def forget_user_tokens(sender, instance, **kwargs):
+    """Drop cached tokens of a user whose state may have changed"""
+    token_cache.delete_user(instance.pk)
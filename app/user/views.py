@@ -1,15 +1,30 @@
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
+from user import hashing
+from user.authentication import CachingTokenAuthentication
 from user.serializers import UserSerializer, AuthTokenSerializer
 
 
-class CreateUserView(generics.CreateAPIView):
+class ServerTimingMixin:
+    """Report password hashing stage durations in a Server-Timing header"""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        timings = hashing.get_timings(request)
+        if timings:
+            response['Server-Timing'] = hashing.server_timing(timings)
+        return response
+
+
+class CreateUserView(ServerTimingMixin, generics.CreateAPIView):
     """Create a new user in the system"""
     serializer_class = UserSerializer
 
 
-class CreateTokenView(ObtainAuthToken):
+class CreateTokenView(ServerTimingMixin, ObtainAuthToken):
     """Create a new auth token for user"""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
@@ -18,7 +33,7 @@ class CreateTokenView(ObtainAuthToken):
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachingTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):